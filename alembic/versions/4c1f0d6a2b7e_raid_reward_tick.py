@@ -0,0 +1,24 @@
+"""Track last rewarded tick on raids
+
+Revision ID: 4c1f0d6a2b7e
+Revises: 9001d008f92d
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c1f0d6a2b7e'
+down_revision = '9001d008f92d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('raids', sa.Column('last_reward_tick', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('raids', 'last_reward_tick')
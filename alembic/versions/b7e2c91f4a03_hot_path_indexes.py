@@ -0,0 +1,77 @@
+"""Indexes for hot lookup paths
+
+Revision ID: b7e2c91f4a03
+Revises: 4c1f0d6a2b7e
+Create Date: 2026-10-18 10:41:02.553871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2c91f4a03'
+down_revision = '4c1f0d6a2b7e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # Existing GP entries are dated from what they reference rather than stamped with the migration time, so reading
+    # the ledgers by time (PR as of a date or drop) still orders them correctly
+    op.add_column('gear_point_ledger_entries', sa.Column('created_at', sa.DateTime(), nullable=True))
+    op.execute("""
+        UPDATE gear_point_ledger_entries AS g SET created_at = COALESCE(d.awarded_at, d.dropped_at)
+        FROM item_drops AS d WHERE g.item_drop_id = d.id
+    """)
+    op.execute("""
+        UPDATE gear_point_ledger_entries AS g SET created_at = r.starts_at
+        FROM raids AS r WHERE g.created_at IS NULL AND g.raid_id = r.id
+    """)
+    # Entries without a drop or raid (INIT, LOAD, DECAY, manual grants) take the time of the latest dated entry
+    # before them, by id, or failing that after them. The subqueries see the table as it was before this UPDATE.
+    op.execute("""
+        UPDATE gear_point_ledger_entries AS g SET created_at = COALESCE(
+            (SELECT max(p.created_at) FROM gear_point_ledger_entries AS p WHERE p.id < g.id),
+            (SELECT min(n.created_at) FROM gear_point_ledger_entries AS n WHERE n.id > g.id),
+            now())
+        WHERE g.created_at IS NULL
+    """)
+    op.alter_column('gear_point_ledger_entries', 'created_at', nullable=False, server_default=sa.func.now())
+    op.alter_column('effort_point_ledger_entries', 'created_at', server_default=sa.func.now())
+
+    op.create_index('ix_point_buckets_user_id_team_id', 'point_buckets',
+                    ['user_id', 'team_id', 'raid_tier', 'point_type'])
+    op.create_index('ix_signups_raid_id_user_id', 'signups', ['raid_id', 'user_id'])
+    op.create_index('ix_characters_user_id', 'characters', ['user_id'])
+    op.create_index('ix_ep_ledger_team_tier_user_created_at', 'effort_point_ledger_entries',
+                    ['team_id', 'raid_tier', 'user_id', 'created_at'])
+    op.create_index('ix_gp_ledger_team_tier_user_created_at', 'gear_point_ledger_entries',
+                    ['team_id', 'raid_tier', 'user_id', 'created_at'])
+    op.create_index('ix_raids_signup_message_id', 'raids', ['signup_message_id'])
+    op.create_index('ix_item_drops_bid_message_id', 'item_drops', ['bid_message_id'])
+
+    op.create_index('ix_items_name_trgm', 'items', ['name'],
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_users_display_name_trgm', 'users', ['display_name'],
+                    postgresql_using='gin', postgresql_ops={'display_name': 'gin_trgm_ops'})
+    op.create_index('ix_characters_name_trgm', 'characters', ['name'],
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_characters_name_trgm', table_name='characters')
+    op.drop_index('ix_users_display_name_trgm', table_name='users')
+    op.drop_index('ix_items_name_trgm', table_name='items')
+
+    op.drop_index('ix_item_drops_bid_message_id', table_name='item_drops')
+    op.drop_index('ix_raids_signup_message_id', table_name='raids')
+    op.drop_index('ix_gp_ledger_team_tier_user_created_at', table_name='gear_point_ledger_entries')
+    op.drop_index('ix_ep_ledger_team_tier_user_created_at', table_name='effort_point_ledger_entries')
+    op.drop_index('ix_characters_user_id', table_name='characters')
+    op.drop_index('ix_signups_raid_id_user_id', table_name='signups')
+    op.drop_index('ix_point_buckets_user_id_team_id', table_name='point_buckets')
+
+    op.alter_column('effort_point_ledger_entries', 'created_at', server_default=None)
+    op.drop_column('gear_point_ledger_entries', 'created_at')
@@ -0,0 +1,30 @@
+"""Precomputed item GP table
+
+Revision ID: d3a5f8e61c2b
+Revises: b7e2c91f4a03
+Create Date: 2026-10-18 12:05:37.418206
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a5f8e61c2b'
+down_revision = 'b7e2c91f4a03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Populate with `python setup.py --recompute-gp`; Item.gp() falls back to the formula until then
+    op.create_table('item_gear_points',
+                    sa.Column('item_id', sa.Integer(), nullable=False),
+                    sa.Column('role', sa.Integer(), nullable=False),
+                    sa.Column('gp', sa.Integer(), nullable=False),
+                    sa.ForeignKeyConstraint(['item_id'], ['items.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('item_id', 'role'))
+
+
+def downgrade():
+    op.drop_table('item_gear_points')
@@ -0,0 +1,38 @@
+"""Ledger checkpoints per point bucket
+
+Revision ID: e8b4c27d9a16
+Revises: d3a5f8e61c2b
+Create Date: 2026-10-18 14:21:09.531774
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8b4c27d9a16'
+down_revision = 'd3a5f8e61c2b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Populate with `python setup.py --checkpoint-ledgers`, the bot also writes checkpoints daily
+    op.create_table('point_bucket_checkpoints',
+                    sa.Column('user_id', sa.BigInteger(), nullable=False),
+                    sa.Column('team_id', sa.Integer(), nullable=False),
+                    sa.Column('raid_tier', sa.Integer(), nullable=False),
+                    sa.Column('point_type', postgresql.ENUM('EP', 'GP', name='pointtypes', create_type=False),
+                              nullable=False),
+                    sa.Column('ledger_entry_id', sa.BigInteger(), nullable=False),
+                    sa.Column('balance', sa.Integer(), nullable=False),
+                    sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+                    sa.ForeignKeyConstraint(['user_id', 'team_id', 'raid_tier', 'point_type'],
+                                            ['point_buckets.user_id', 'point_buckets.team_id',
+                                             'point_buckets.raid_tier', 'point_buckets.point_type']),
+                    sa.PrimaryKeyConstraint('user_id', 'team_id', 'raid_tier', 'point_type', 'ledger_entry_id'))
+
+
+def downgrade():
+    op.drop_table('point_bucket_checkpoints')
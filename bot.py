@@ -2,36 +2,69 @@ import os
 import discord
 import worker
 import asyncio
+import functools
+import time
 import pytz
 from lib.helpers import *
+from lib.routing import MessageRoutes, ROUTE_RAID, ROUTE_DROP, ROUTE_AUDIT
+from lib.render import EmbedRenderScheduler
+from lib.search import ItemIndex
+from lib.emojis import EmojiRegistry
+from lib.usercache import UserContextCache, SignupContext
+from lib.reactions import ReactionAttacher
+from lib.dispatch import CommandDispatcher
+from lib.instrument import Instrumentation
+from lib.audit import AuditPages, AuditView, page_view, export_ledger_csv
+from lib import db, logs
 from datetime import datetime
 from dateutil import parser
+from apscheduler.jobstores.base import JobLookupError
 from operator import attrgetter, itemgetter
 from constants import *
 from models import Spec, Character, Team, Raid, User, PointTypes, UserPointBucket, EffortPointLedgerEntry, \
-    GearPointLedgerEntry, ItemDrop, ItemDropBid, Bids
+    GearPointLedgerEntry, ItemDrop, ItemDropBid, PointBucketCheckpoint
 
 DISCORD_BOT_TOKEN = os.environ['DISCORD_BOT_TOKEN']
-FORMAT = '%(asctime)-15s %(message)s'
-logging.basicConfig(format=FORMAT)
+logs.configure()
 logger = logging.getLogger('argbot')
 
 client = discord.Client()
+message_routes = MessageRoutes()
+item_index = ItemIndex()
+emoji_registry = EmojiRegistry()
+user_contexts = UserContextCache()
+reaction_attacher = ReactionAttacher()
+user_contexts.listen(models.Session)
+message_routes.listen(models.Session)
+instruments = Instrumentation()
+audit_pages = AuditPages()
+instruments.listen(models.engine)
+instruments.wrap_http(client.http)
+render_scheduler = EmbedRenderScheduler(client)
+loop_lag_monitor = None
+stats_dumper = None
 
 logger.debug("Checking for access to scheduler?")
-logger.debug("Scheduler is " + str(worker.scheduler))
+logger.debug("Scheduler is %s", worker.scheduler)
 
 
-async def attach_signup_reactions(message):
-    session = models.Session()
+def attach_signup_reactions(message, sent_at=None):
     logger.info("Attaching signup reactions to raid")
+    return reaction_attacher.attach(message, emoji_registry.signup_reactions(), 'Raid signup', sent_at=sent_at)
+
+
+def configure_guild_emojis():
+    logger.info("Configuring custom emojis")
+    session = models.Session()
     try:
-        for spec in session.query(Spec).all():
-            logger.debug("Adding reaction " + spec.emoticon_name + ':' + str(spec.emoticon_id) + " for " + str(
-                spec.character_class.name) + " to message id " + str(message.id))
-            await message.add_reaction('<' + spec.emoticon_name + ':' + str(spec.emoticon_id) + '>')
+        emoji_list = client.emojis
+        logger.debug("Got emoji list, loading registry")
+        _changed_specs = emoji_registry.load(emoji_list, session.query(Spec).all())
+        if _changed_specs:
+            logger.debug("Updated emoji ids for specs %s", _changed_specs)
+        session.commit()
     except Exception as e:
-        logger.error("Failed to add reaction to raid_signup because: " + str(e))
+        logger.error("Failed to load custom guild emojis because %s", e)
         session.rollback()
         raise e
     finally:
@@ -39,34 +72,49 @@ async def attach_signup_reactions(message):
         return
 
 
-def configure_guild_emojis():
-    logger.info("Configuring custom emojis")
+def warm_message_routes():
     session = models.Session()
     try:
-        emoji_list = client.emojis
-        logger.debug("Got emoji list, starting iterations")
-        for emoji in emoji_list:
-            logger.debug("Starting iteration for " + str(emoji))
-            specs = session.query(Spec).filter(Spec.emoticon_name == emoji.name).all()
-            if specs:
-                logger.debug("Updating specs " + str(specs) + " with emoji id ")
-                for spec in specs:
-                    spec.emoticon_id = emoji.id
-            else:
-                logger.info("Couldn't find spec, trying to register a bid instead for emoji named " + emoji.name)
-                if emoji.name in ['bid_100', 'bid_25', 'bid_0']:
-                    logger.debug("Registering bid emoji " + emoji.name + " " + str(emoji.id))
-                    Bids().register(emoji.name, emoji.id)
-                else:
-                    logger.info("Couldn't register emoji: " + emoji.name + ':' + str(emoji.id))
-        session.commit()
+        message_routes.warm(session)
     except Exception as e:
-        logger.error("Failed to load custom guild emojis because " + str(e))
-        session.rollback()
+        logger.error("Failed to warm message routes because %s", e)
+        raise e
+    finally:
+        session.close()
+
+
+def warm_item_index():
+    session = models.Session()
+    try:
+        item_index.warm(session)
+    except Exception as e:
+        logger.error("Failed to warm item index because %s", e)
         raise e
     finally:
         session.close()
-        return
+
+
+def resolve_item(session, item_name):
+    """Resolve an item name (or id, for items sharing a name) against the item index, picking up newly loaded items
+    when nothing matches."""
+    if item_name.isdigit() and int(item_name) in item_index:
+        return int(item_name), []
+    _item_id, _matches = item_index.resolve(item_name)
+    if not _matches and item_index.is_stale() and item_index.refresh(session):
+        _item_id, _matches = item_index.resolve(item_name)
+    return _item_id, _matches
+
+
+def format_item_matches(matches):
+    if len(matches) == 1:
+        response_body = ">>>| ** No exact match, use the item id if this is the one** |\r\n"
+    else:
+        response_body = ">>>| ** Too many similar Item Names Found** |\r\n"
+    for match in matches:
+        response_body += "|" + match.name + " (" + str(match.item_id) + ")|\r\n"
+    if len(matches) == ITEM_SEARCH_LIMIT:
+        response_body += "| *Showing the closest " + str(ITEM_SEARCH_LIMIT) + ", try a longer name* |\r\n"
+    return response_body
 
 
 def configure_guild_channels():
@@ -84,21 +132,20 @@ def configure_guild_channels():
         for channel in channel_list:
             for team in teams:
                 if team.name in channel.name:
-                    logger.debug("Registering " + channel.name + ':' + str(channel.id) + " for team " + team.name)
+                    logger.debug("Registering %s:%s for team %s", channel.name, channel.id, team.name)
                     team.voice_channel_id = channel.id
         session.commit()
         return
     except Exception as e:
-        logger.error("Failed to configure voice channels because " + str(e))
+        logger.error("Failed to configure voice channels because %s", e)
         session.rollback()
         raise e
     finally:
         session.close()
 
 
-def generate_drop_embed(item_drop):
-    logger.info("Starting embed render for item drop " + str(item_drop.id))
-    session = models.Session()
+def generate_drop_embed(session, item_drop):
+    logger.info("Starting embed render for item drop %s", item_drop.id)
     try:
         if item_drop.bids:
             bids_100 = session.query(ItemDropBid).filter(ItemDropBid.drop == item_drop,
@@ -145,29 +192,20 @@ def generate_drop_embed(item_drop):
                 embed.add_field(name="Grats to", value="Asgardbank for their shiny new shard")
         return embed
     except Exception as e:
-        logger.error("Failed to generate item_drop_embed because " + str(e))
+        logger.error("Failed to generate item_drop_embed because %s", e)
         logger.error(traceback.format_exc())
-        session.rollback()
         raise e
-    finally:
-        session.close()
 
 
-async def attach_itemdrop_bid_reactions(item_drop):
-    channel = client.get_channel(item_drop.bid_message_channel_id)
-    message = await channel.fetch_message(item_drop.bid_message_id)
-    bids = Bids()
-    for emoji_name in bids.get_all():
-        reaction_string = '<' + emoji_name + ':' + str(bids[emoji_name]) + '>'
-        logger.debug("Reaction string is " + reaction_string)
-        await message.add_reaction(reaction_string)
-    return
+def attach_itemdrop_bid_reactions(message, sent_at=None):
+    logger.info("Attaching bid reactions to item drop")
+    return reaction_attacher.attach(message, emoji_registry.bid_reactions(), 'Item drop', sent_at=sent_at)
 
 
 def render_help(user):
     help_text = ""
     # user_role_names = []
-    logger.debug("Generating help message for user with roles " + str(user.roles))
+    logger.debug("Generating help message for user with roles %s", user.roles)
     # for role in user.roles:
     #    user_role_names.append(role.name)
     for command in COMMAND_MAP:
@@ -185,6 +223,16 @@ async def on_ready():
 
     configure_guild_emojis()
     configure_guild_channels()
+    warm_message_routes()
+    warm_item_index()
+    schedule_open_raids()
+    add_loop_job(checkpoint_ledgers, trigger='interval', hours=LEDGER_CHECKPOINT_HOURS, id='ledger-checkpoints',
+                 jobstore=MEMORY_JOBSTORE, replace_existing=True, coalesce=True)
+    global loop_lag_monitor, stats_dumper
+    if loop_lag_monitor is None:
+        loop_lag_monitor = asyncio.ensure_future(db.monitor_loop_lag())
+    if stats_dumper is None:
+        stats_dumper = asyncio.ensure_future(instruments.dump_periodically())
 
 
 @client.event
@@ -193,72 +241,61 @@ async def on_message(message):
         # Ignore messages from myself
         return
     elif message.content.startswith('arg.'):
-        command = message.content.split(' ')[0]
-        logger.debug("Looking for " + command + " in map")
-        if COMMAND_MAP.get(command):
-            logger.debug("Found command in map")
-            if any(role.name == COMMAND_MAP[command]['required_role'] for role in message.author.roles):
-                await COMMAND_MAP.get(command)['handler'](message)
-            else:
-                await message.channel.send("Access Denied: You do not possess the role required for that command.")
-        else:
-            await message.channel.send('Command Not Found, try arg.help for usage information')
+        await dispatcher.dispatch(message)
     else:
-        logger.debug("Message Contents: " + message.content)
+        logger.debug("Message Contents: %s", message.content)
     return
 
 
+@client.event
+async def on_member_update(before, after):
+    if before.roles != after.roles:
+        dispatcher.forget_member(after.id)
+
+
 @client.event
 async def on_raw_reaction_add(raw_event):
-    session = models.Session()
-    logger.debug("Full reaction event: " + str(raw_event))
+    if raw_event.user_id == client.user.id:
+        return
+    route = message_routes.lookup(raw_event.message_id)
+    if route is None:
+        return
+    logger.debug("Full reaction event: %s", raw_event)
 
     try:
-        if raw_event.user_id != client.user.id:
-            _raid = session.query(Raid).filter(Raid.signup_message_id == raw_event.message_id).one_or_none()
-            if _raid is not None:
-                logger.info("Found a raid!")
-                await handle_reaction_raid(raw_event=raw_event, session=session, raid=_raid)
-            else:
-                logger.info("Searching for itemdrops")
-                _itemdrop = session.query(ItemDrop).filter(
-                    ItemDrop.bid_message_id == raw_event.message_id).one_or_none()
-                if _itemdrop is not None:
-                    logger.info("Found an itemdrop")
-                    if not _itemdrop.is_awarded:
-                        await handle_reaction_bid(raw_event=raw_event, session=session, item_drop=_itemdrop)
-                    else:
-                        logger.warning(
-                            "Ignoring late bid from " + str(raw_event.user_id) + " for drop " + str(_itemdrop.id))
-                        await send_dm(raw_event.user_id, "Recieved your bid after the item was already awarded, sorry!")
+        _kind, _entity_id = route
+        if _kind == ROUTE_AUDIT:
+            await handle_reaction_audit(raw_event)
+        elif _kind == ROUTE_RAID:
+            await handle_reaction_raid(raw_event=raw_event, raid_id=_entity_id)
+        elif _kind == ROUTE_DROP:
+            await handle_reaction_bid(raw_event=raw_event, drop_id=_entity_id)
     except Exception as e:
-        logger.error("Unable to process reaction because " + str(e))
+        logger.error("Unable to process reaction because %s", e)
         logger.error(traceback.format_exc())
-        session.rollback()
-    finally:
-        session.close()
-        return
+    return
 
 
-def confirm_signups(session, raid):
-    logger.info("Processing signups for raid " + str(raid.id))
-    try:
-        logger.debug("Looking for channel " + str(raid.team.voice_channel_id))
-        channel = client.get_channel(raid.team.voice_channel_id)
-        member_ids = []
-        for member in channel.members:
-            member_ids.append(member.id)
-        logger.debug("Channel member ids " + str(member_ids))
+def voice_member_ids(channel_id):
+    logger.debug("Looking for channel %s", channel_id)
+    member_ids = set(member.id for member in client.get_channel(channel_id).members)
+    logger.debug("Channel member ids %s", member_ids)
+    return member_ids
 
+
+def confirm_signups(session, raid, member_ids):
+    """Confirm the signups of everyone in member_ids, which callers read from the team voice channel on the loop."""
+    logger.info("Processing signups for raid %s", raid.id)
+    try:
         for signup in raid.signups:
-            if signup.user.id in member_ids:
+            if signup.user_id in member_ids:
                 signup.confirm()
             else:
-                logger.debug("User " + str(signup.user.id) + " not found in channel, not confirming")
+                logger.debug("User %s not found in channel, not confirming", signup.user_id)
         session.commit()
         return
     except Exception as e:
-        logger.error("Couldn't confirm signups because " + str(e))
+        logger.error("Couldn't confirm signups because %s", e)
         session.rollback()
         raise e
 
@@ -283,83 +320,66 @@ def item_to_quality_color(item):
 
 @client.event
 async def on_raw_reaction_remove(raw_event):
-    session = models.Session()
-    logger.debug("Full reaction event for removal: " + str(raw_event))
+    if raw_event.user_id == client.user.id:
+        return
+    route = message_routes.lookup(raw_event.message_id)
+    if route is None:
+        return
+    logger.debug("Full reaction event for removal: %s", raw_event)
 
     try:
-        if raw_event.user_id != client.user.id:
-            _raid = session.query(Raid).filter(Raid.signup_message_id == raw_event.message_id).one_or_none()
-            if _raid is not None:
-                logger.info("Found a raid!")
-                await handle_reaction_raid(raw_event=raw_event, session=session, raid=_raid)
-            else:
-                logger.info("Searching for itemdrops")
-                _itemdrop = session.query(ItemDrop).filter(
-                    ItemDrop.bid_message_id == raw_event.message_id).one_or_none()
-                if _itemdrop is not None:
-                    logger.info("Found an itemdrop")
-                    if not _itemdrop.is_awarded:
-                        await handle_reaction_bid(raw_event=raw_event, session=session, item_drop=_itemdrop)
-                    else:
-                        logger.warning(
-                            "Ignoring late bid cancellation from " + str(raw_event.user_id) + " for drop " + str(
-                                _itemdrop.id))
-                        await send_dm(raw_event.user_id,
-                                      "Received your bid cancellation after the item was already awarded."
-                                      + " If you won the item, then don't equip it and ping a Raid Leader for help")
+        _kind, _entity_id = route
+        if _kind == ROUTE_AUDIT:
+            await handle_reaction_audit(raw_event)
+        elif _kind == ROUTE_RAID:
+            await handle_reaction_raid(raw_event=raw_event, raid_id=_entity_id)
+        elif _kind == ROUTE_DROP:
+            await handle_reaction_bid(raw_event=raw_event, drop_id=_entity_id)
     except Exception as e:
-        logger.error("Unable to process reaction because " + str(e))
+        logger.error("Unable to process reaction because %s", e)
         logger.error(traceback.format_exc())
-        session.rollback()
-    finally:
-        session.close()
 
 
-def generate_pr_embed(session, team):
-    logger.info("Generating PR embed for " + team.name)
+def paint_utc(dt):
+    # paint_time for a naive UTC datetime, shown in the server's time zone
+    return paint_time(pytz.utc.localize(dt).astimezone(pytz.timezone(SERVER_TIMEZONE)))
+
+
+def generate_pr_embed(session, team, at=None):
+    # at is a naive UTC datetime to show the standings as they were then, read from the ledgers
+    logger.info("Generating PR embed for %s as of %s", team.name, at or 'now')
     try:
-        embed = discord.Embed(title="**" + team.name + "**", timestamp=datetime.utcnow())
+        if at is None:
+            embed = discord.Embed(title="**" + team.name + "**", timestamp=datetime.utcnow())
+            standings = models.get_pr_standings(session, team)
+        else:
+            embed = discord.Embed(title="**" + team.name + "** as of " + paint_utc(at), timestamp=at)
+            history = models.get_pr_standings_at(session, team, at)
+            if history.history_start is None or at < history.history_start:
+                embed.description = "No EP/GP history was recorded for " + team.name + " before " \
+                    + (paint_utc(history.history_start) if history.history_start else "now") \
+                    + ", so standings from then can't be shown"
+                return embed
+            if history.incomplete:
+                embed.description = str(len(history.incomplete)) + " raider(s) had no EP/GP history yet and are " \
+                    "left out: " + ", ".join(sorted(set(name for _, name in history.incomplete)))
+            standings = history.standings
 
         for raid_tier in models.ActiveRaidTiers:
-            logger.debug("Getting buckets for " + raid_tier.name)
-            bucket_tuples = []
-            ep_buckets = session.query(UserPointBucket) \
-                .filter(
-                UserPointBucket.team == team,
-                UserPointBucket.raid_tier == raid_tier.tier,
-                UserPointBucket.point_type == PointTypes.EP
-            ) \
-                .all()
-            for ep_bucket in ep_buckets:
-                gp_bucket = session.query(UserPointBucket) \
-                    .filter(
-                    UserPointBucket.team == team,
-                    UserPointBucket.raid_tier == raid_tier.tier,
-                    UserPointBucket.point_type == PointTypes.GP,
-                    UserPointBucket.user == ep_bucket.user
-                ) \
-                    .one()
-                ep_val = ep_bucket.get_points()
-                gp_val = gp_bucket.get_points()
-                # TODO: REPLACE WITH COMMON BUCKET.CALCULATE_PR FUNCTION
-                pr_val = round((ep_val / gp_val), 2)
-                bucket_tuples.append((ep_bucket.user.display_name, ep_val, gp_val, pr_val))
-
             name_str = ""
             point_str = ""
             pr_str = ""
-            pr_list = sorted(bucket_tuples, key=itemgetter(3), reverse=True)
-            for entry in pr_list:
-                name_str += entry[0] + "\r\n"
-                point_str += str(entry[1]) + "\t/\t" + str(entry[2]) + " =\r\n"
-                pr_str += str(entry[3]) + "\r\n"
+            for entry in standings[raid_tier.tier]:
+                name_str += entry.display_name + "\r\n"
+                point_str += str(entry.ep) + "\t/\t" + str(entry.gp) + " =\r\n"
+                pr_str += str(entry.pr) + "\r\n"
 
             embed.add_field(name="**" + raid_tier.name + "**", value=name_str, inline=True)
             embed.add_field(name="** **", value=point_str, inline=True)
             embed.add_field(name="** **", value=pr_str, inline=True)
         return embed
     except Exception as e:
-        logger.error("Unable to generate PR embed because: " + str(e))
+        logger.error("Unable to generate PR embed because: %s", e)
         logger.error(traceback.format_exc())
         raise
 
@@ -375,51 +395,140 @@ async def send_dm(user_id, content=None, embed=None):
             raise KeyError("No content to send via DM")
         return
     except Exception as e:
-        logger.error("Unable to send a DM to user " + str(user_id) + " because " + str(e))
+        logger.error("Unable to send a DM to user %s because %s", user_id, e)
         logger.error(traceback.format_exc())
 
 
-def process_rewards(raid_id):
-    session = models.Session()
+def load_reward_target(session, raid_id):
+    raid = session.query(Raid).filter(Raid.id == raid_id).one()
+    return raid.is_closed, raid.team.voice_channel_id, raid.signup_message_channel_id
+
+
+def reward_raid(session, raid_id, member_ids):
+    """Confirm the voice channel members and pay the raid's outstanding ticks, returning whether the raid is closed."""
+    raid = session.query(Raid).filter(Raid.id == raid_id).one()
+    confirm_signups(session, raid, member_ids)
+    raid.reward(session)
+    return raid.is_closed
 
+
+def stop_raid_rewards(raid_id):
     try:
-        raid = session.query(Raid).filter(Raid.id == raid_id).one()
-        confirm_signups(session, raid)
-        raid.reward(session)
-    except Exception as e:
-        logger.error("Failed to process rewards for raid " + str(raid.id) + " because " + str(e))
-        raise
+        worker.scheduler.remove_job(reward_job_id(raid_id), jobstore=MEMORY_JOBSTORE)
+        logger.info("Raid %s is closed, removed its reward job", raid_id)
+    except JobLookupError:
+        pass
+
+
+@instruments.timed('job:process_rewards')
+async def process_rewards(raid_id):
+    _signup_channel_id = None
     try:
-        if datetime.utcnow() < raid.ends_at:
-            logger.debug("Setting up next process_rewards run at" + str(raid.ends_at))
-            worker.scheduler.add_job(process_rewards,
-                                     kwargs={'raid_id': raid.id},
-                                     trigger='date',
-                                     run_date=(datetime.utcnow() + raid.reward_schedule.tick_interval)
-                                     )
-        asyncio.run_coroutine_threadsafe(
-            client.get_channel(raid.signup_message_channel_id)
-                .send(content="Processed EP reward for Raid ID " + str(raid.id)),
-            client.loop
-        )
-        return
-    # TODO: Notify raid signup channel of awarded EP or failure
+        _is_closed, _voice_channel_id, _signup_channel_id = await db.run(load_reward_target, raid_id)
+        if _is_closed:
+            logger.info("Raid %s is already closed, nothing to reward", raid_id)
+            stop_raid_rewards(raid_id)
+            return
+        _is_closed = await db.run(reward_raid, raid_id, voice_member_ids(_voice_channel_id))
+        await client.get_channel(_signup_channel_id).send(content="Processed EP reward for Raid ID " + str(raid_id))
+        if _is_closed:
+            stop_raid_rewards(raid_id)
     except Exception as e:
-        logger.error("Failed to schedule next reward for raid")
+        logger.error("Failed to process rewards for raid %s because %s", raid_id, e)
         logger.error(traceback.format_exc())
-        asyncio.run_coroutine_threadsafe(
-            client.get_channel(raid.signup_message_channel_id)
-                .send(content="Failed to process reward for Raid ID " + str(raid.id)
-                      ),
-            client.loop
-        )
+        if _signup_channel_id is not None:
+            await client.get_channel(_signup_channel_id).send(
+                content="Failed to process reward for Raid ID " + str(raid_id))
         raise e
+
+
+def run_on_loop(job, **kwargs):
+    """Run coroutine job on the client loop from a SCHEDULER_MODE_BACKGROUND scheduler thread."""
+    return asyncio.run_coroutine_threadsafe(job(**kwargs), client.loop).result()
+
+
+def add_loop_job(job, **options):
+    """Add coroutine job to worker.scheduler, wrapped with run_on_loop when the scheduler runs jobs on threads."""
+    if worker.SCHEDULER_MODE == SCHEDULER_MODE_ASYNCIO:
+        return worker.scheduler.add_job(job, **options)
+    options.setdefault('name', job.__name__)
+    return worker.scheduler.add_job(functools.partial(run_on_loop, job), **options)
+
+
+@instruments.timed('job:checkpoint_ledgers')
+async def checkpoint_ledgers():
+    try:
+        written = await db.run(PointBucketCheckpoint.write)
+        drifts = await db.run(PointBucketCheckpoint.verify)
+        for drift in drifts[:20]:
+            logger.warning("Bucket %s/%s/%s %s holds %s, ledger says %s", drift.user_id, drift.team_id,
+                           drift.raid_tier, drift.point_type.name, drift.stored, drift.expected)
+        logger.info("Wrote %s ledger checkpoints, %s buckets drifted", written, len(drifts))
+    except Exception as e:
+        logger.error("Unable to checkpoint ledgers because %s", e)
+        logger.error(traceback.format_exc())
+
+
+def reward_job_id(raid_id):
+    return 'raid-rewards-' + str(raid_id)
+
+
+def schedule_raid_rewards(raid, now=None):
+    """Register the raid's single interval reward job, replacing any earlier one.
+
+    The job fires on every tick from starts_at, and coalesces missed runs into one since Raid.reward pays every
+    outstanding tick anyway. It has no end date: process_rewards removes it once the raid closes on its final tick,
+    which follows ends_at as it is when the tick runs, so extending a raid keeps it ticking. Ticks already due (after a
+    restart) are caught up right away.
+    """
+    if now is None:
+        now = datetime.utcnow()
+    _interval = raid.reward_schedule.tick_interval
+    _final_tick = raid.final_tick()
+    _last_run = raid.starts_at + _interval * _final_tick
+    if _last_run > now:
+        add_loop_job(process_rewards,
+                     kwargs={'raid_id': raid.id},
+                     trigger='interval',
+                     seconds=_interval.total_seconds(),
+                     start_date=raid.starts_at,
+                     id=reward_job_id(raid.id),
+                     jobstore=MEMORY_JOBSTORE,
+                     replace_existing=True,
+                     coalesce=True,
+                     misfire_grace_time=None)
+    _due_tick = min(raid.get_tick(now), _final_tick)
+    if raid.starts_at <= now and (raid.last_reward_tick is None or _due_tick > raid.last_reward_tick):
+        logger.info("Raid %s is behind on rewards (through %s, due %s), catching up", raid.id, raid.last_reward_tick,
+                    _due_tick)
+        add_loop_job(process_rewards,
+                     kwargs={'raid_id': raid.id},
+                     id=reward_job_id(raid.id) + '-catchup',
+                     jobstore=MEMORY_JOBSTORE,
+                     replace_existing=True,
+                     misfire_grace_time=None)
+
+
+def schedule_open_raids():
+    session = models.Session()
+    try:
+        # Drop one-shot per tick jobs persisted by older versions, the interval jobs below replace them
+        for job in worker.scheduler.get_jobs(jobstore='default'):
+            if job.name == process_rewards.__name__:
+                logger.info("Removing legacy reward job %s", job.id)
+                job.remove()
+        _raids = session.query(Raid).filter(Raid.is_closed == False).all()
+        for raid in _raids:
+            schedule_raid_rewards(raid)
+        logger.info("Scheduled rewards for %s open raids", len(_raids))
+    except Exception as e:
+        logger.error("Unable to schedule raid rewards because %s", e)
+        logger.error(traceback.format_exc())
     finally:
         session.close()
 
 
-def generate_raid_embed(raid):
-    session = models.Session()
+def generate_raid_embed(session, raid):
     logger.info("Attempting to generate embed object")
     title_str = (raid.team.name + " is going to " + raid.zone.name + " at " +
                  paint_time(raid.starts_at.astimezone(pytz.timezone(SERVER_TIMEZONE))))
@@ -432,7 +541,7 @@ def generate_raid_embed(raid):
             .join(Signup.character) \
             .join(Character.spec) \
             .all()
-        logger.debug("Got list of " + str(len(_signup_characters)) + " signup characters")
+        logger.debug("Got list of %s signup characters", len(_signup_characters))
 
         _role_summary = {
             CharacterRoles.Tank: {
@@ -464,9 +573,10 @@ def generate_raid_embed(raid):
                 'count': 0,
                 'characters': []
             }
+        _debug = logger.isEnabledFor(logging.DEBUG)  # Checked once rather than per signup on this render path
         for signup_character_spec in _signup_characters:
-            logger.info("Processing signup.")
-            logger.debug("Character: " + str(signup_character_spec.character))
+            if _debug:
+                logger.debug("Processing signup for character %s", signup_character_spec.character)
             _role_summary[signup_character_spec.character.spec.role]['count'] += 1
             _role_summary[signup_character_spec.character.spec.role]['characters'].append(
                 signup_character_spec.character.name)
@@ -477,8 +587,8 @@ def generate_raid_embed(raid):
                 signup_character_spec.character.spec.role][
                 'characters'].append(signup_character_spec.character.name)
 
-        logger.debug("Completed role summary: " + str(_role_summary))
-        logger.debug("Completed spec summary: " + str(_spec_summary))
+        logger.debug("Completed role summary: %s", _role_summary)
+        logger.debug("Completed spec summary: %s", _spec_summary)
 
         # Change to zone-specific image URL from DB
         if raid.zone == RaidZone.ONY:
@@ -585,14 +695,20 @@ def generate_raid_embed(raid):
 
         return embed
     except Exception as e:
-        logger.error("Failed to generate raid embed because " + str(e))
+        logger.error("Failed to generate raid embed because %s", e)
         logger.error(traceback.format_exc())
         raise e
-    finally:
-        session.close()
 
 
-async def send_registration_help(user_id):
+def render_raid_embed(session, raid_id):
+    return generate_raid_embed(session, session.query(Raid).get(raid_id))
+
+
+def render_drop_embed(session, drop_id):
+    return generate_drop_embed(session, session.query(ItemDrop).get(drop_id))
+
+
+def registration_help():
     help_msg = "Please check your registration command. " \
                + "It should be in the format 'arg.register CharacterName Role Class'\r\n"
     help_msg += "**Valid Role and Class combinations are:** \r\n"
@@ -601,252 +717,220 @@ async def send_registration_help(user_id):
     help_msg += "Caster (Druid, Mage, Warlock, or Priest)\r\n"
     help_msg += "Healer (Druid, Priest, or Paladin)\r\n"
     help_msg += "Ranged (Hunter)\r\n"
-    await send_dm(user_id, help_msg)
-    return
+    return help_msg
 
 
 async def handle_registercharacter(message):
-    session = models.Session()
     logger.info("Starting character create")
     try:
-        logger.debug("Starting user lookup")
-        _user = session.query(User).filter(User.id == message.author.id).one_or_none()
-        logger.debug("Starting team lookups")
-        _team_aesir = session.query(Team).filter(Team.name == TEAM_NAME_ALPHA).one()
-        _team_vanir = session.query(Team).filter(Team.name == TEAM_NAME_ONE).one()
         arg_array = parse_message_args(message.content)
-
-        logger.debug("arg_array is " + str(len(arg_array)) + " entries long.")
-        if len(arg_array) < 3:
-            await send_registration_help(message.author.id)
-        elif len(arg_array) == 3:
-            logger.debug("Two argument character registration. Let's hope its a warlock, mage, or hunter")
-            char_name = arg_array[1].title()
-            spec_name = arg_array[2].title()
-            try:
-                specs = session.query(Spec).filter(Spec.character_class == CharacterClass[spec_name]).all()
-                if len(specs) > 1:
-                    error_body = "Registration Failed! Multiple specs found: \r\n"
-                    for spec in specs:
-                        if spec.name is not None:
-                            error_body += spec.name + " "
-                            error_body += spec.character_class + '\r\n'
-                    error_body += "Please be more specific with your role and class."
-                    await send_dm(user_id=message.author.id, content=error_body)
-                elif len(specs) == 1:
-                    spec = specs[0]
-                else:
-                    await send_registration_help(message.author.id)
-            except Exception as e:
-                logger.error("Unable to find spec for new character registration because: " + str(e))
-                session.rollback()
-                await send_registration_help(message.author.id)
-                raise
-        elif len(arg_array) == 4:
-            logger.debug("Three argument character create")
-            char_name = arg_array[1].title()
-            char_spec = arg_array[2].title()
-            char_class = arg_array[3].title()
-
-            try:
-                logger.debug("Search parameters= char_spec='" + str(char_spec) + "' and char_class='" + str(char_class))
-                spec = session.query(Spec).filter(Spec.name.ilike(char_spec),
-                                                  Spec.character_class == CharacterClass[char_class]).one()
-            except Exception as e:
-                logger.error("Unable to find spec for character registration because " + str(e))
-                await send_registration_help(message.author.id)
-                session.rollback()
-                raise
-        else:
-            await send_registration_help(message.author.id)
+        logger.debug("arg_array is %s entries long.", len(arg_array))
+        _author = message.author
+        try:
+            _character_id, _character_name = await db.run(register_character, arg_array, user_id=_author.id,
+                                                          guild_id=_author.guild.id, name=_author.name,
+                                                          display_name=_author.display_name)
+        except ValueError as e:
+            await send_dm(_author.id, str(e))
             return
-        if _user is None:
-            logger.debug("User not found, creating anew.")
-            _user = User(id=message.author.id,
-                         discord_guild_id=message.author.guild.id,
-                         name=message.author.name,
-                         display_name=message.author.display_name)
-            session.add(_user)
-
-        if spec is not None:
-            duplicate_characters = _user.find_characters(session=session,
-                                                         character_class=spec.character_class,
-                                                         )
-            if duplicate_characters:
-                logger.error("Found duplicate character when registering spec id "
-                             + str(spec.id) + " for user " + str(_user.display_name))
-                await send_dm(message.author.id,
-                              "Already found a character registered to you with that class and spec." +
-                              " If you are trying to change specs, contact Cawl for help (self-help coming soon!)")
-            else:
-                _character = Character(name=char_name, spec=spec, user=_user)
-                logger.debug("Creating new character " + _character.name + " for " + str(_user.id))
-                session.add(_character)
-                session.commit()
-                await message.channel.send("Character registration for " + str(_character) + " successful.")
-                logger.info("Attempting auto-registration with teams for user " + str(_user.id))
-                for _discord_role in message.author.roles:
-                    if _discord_role.name == TEAM_NAME_ALPHA:
-                        logger.debug("Found " + TEAM_NAME_ALPHA + " in roles for user " + str(_user.id))
-                        _team_aesir.assign(session, _character)
-                        await message.channel.send("Automatic Team Registration for " + TEAM_NAME_ALPHA
-                                                   + " succeeded as well.")
-                    if _discord_role.name == TEAM_NAME_ONE:
-                        logger.debug("Found " + TEAM_NAME_ONE + " in roles for user " + str(_user.id))
-                        _team_vanir.assign(session, _character)
-                        await message.channel.send("Automatic Team Registration for " + TEAM_NAME_ONE
-                                                   + " succeeded as well.")
-                session.commit()
+        await message.channel.send("Character registration for " + _character_name + " successful.")
+        logger.info("Attempting auto-registration with teams for user %s", _author.id)
+        for _team_name in await db.run(assign_registered_character, _character_id,
+                                       [_discord_role.name for _discord_role in _author.roles]):
+            await message.channel.send("Automatic Team Registration for " + _team_name + " succeeded as well.")
         return
     except Exception as e:
-        logger.error("Failed to register character because : " + str(e))
+        logger.error("Failed to register character because : %s", e)
         logger.error(traceback.format_exc())
         await message.channel.send("Registration failed.")
-    finally:
-        session.close()
-        return
+
+
+def register_character(session, arg_array, user_id, guild_id, name, display_name):
+    """Register the character described by arg_array, returning its id and name.
+
+    Raises ValueError with the message to DM the user when the arguments don't name exactly one spec or the user
+    already has a character of that class.
+    """
+    logger.debug("Starting user lookup")
+    _user = session.query(User).filter(User.id == user_id).one_or_none()
+    if len(arg_array) == 3:
+        logger.debug("Two argument character registration. Let's hope its a warlock, mage, or hunter")
+        char_name = arg_array[1].title()
+        spec_name = arg_array[2].title()
+        try:
+            specs = session.query(Spec).filter(Spec.character_class == CharacterClass[spec_name]).all()
+        except Exception as e:
+            logger.error("Unable to find spec for new character registration because: %s", e)
+            raise ValueError(registration_help())
+        if len(specs) > 1:
+            error_body = "Registration Failed! Multiple specs found: \r\n"
+            for spec in specs:
+                if spec.name is not None:
+                    error_body += spec.name + " "
+                    error_body += spec.character_class.name + '\r\n'
+            error_body += "Please be more specific with your role and class."
+            raise ValueError(error_body)
+        elif not specs:
+            raise ValueError(registration_help())
+        spec = specs[0]
+    elif len(arg_array) == 4:
+        logger.debug("Three argument character create")
+        char_name = arg_array[1].title()
+        char_spec = arg_array[2].title()
+        char_class = arg_array[3].title()
+        try:
+            logger.debug("Search parameters= char_spec='%s' and char_class='%s", char_spec, char_class)
+            spec = session.query(Spec).filter(Spec.name.ilike(char_spec),
+                                              Spec.character_class == CharacterClass[char_class]).one()
+        except Exception as e:
+            logger.error("Unable to find spec for character registration because %s", e)
+            raise ValueError(registration_help())
+    else:
+        raise ValueError(registration_help())
+    if _user is None:
+        logger.debug("User not found, creating anew.")
+        _user = User(id=user_id, discord_guild_id=guild_id, name=name, display_name=display_name)
+        session.add(_user)
+
+    if _user.find_characters(session=session, character_class=spec.character_class):
+        logger.error("Found duplicate character when registering spec id %s for user %s", spec.id, _user.display_name)
+        raise ValueError("Already found a character registered to you with that class and spec."
+                         + " If you are trying to change specs, contact Cawl for help (self-help coming soon!)")
+    _character = Character(name=char_name, spec=spec, user=_user)
+    logger.debug("Creating new character %s for %s", _character.name, _user.id)
+    session.add(_character)
+    session.commit()
+    return _character.id, str(_character)
+
+
+def assign_registered_character(session, character_id, role_names):
+    """Assign a newly registered character to the teams named by its user's Discord roles, returning those names."""
+    _character = session.query(Character).get(character_id)
+    _assigned = []
+    for _team_name in (TEAM_NAME_ALPHA, TEAM_NAME_ONE):
+        if _team_name in role_names:
+            logger.debug("Found %s in roles for user %s", _team_name, _character.user_id)
+            session.query(Team).filter(Team.name == _team_name).one().assign(session, _character)
+            _assigned.append(_team_name)
+    return _assigned
 
 
 async def handle_whois(message):
-    session = models.Session()
     _search_param = parse_message_args(message.content)[1]
     try:
-        found_user = search_user(session, _search_param)
-
-        _description = "Member of "
-        raw_teams = []
-        for character in found_user.characters:
-            for team in character.rosters:
-                raw_teams.append(team)
-        teams = list(set(raw_teams))  # Forcing a typecast to set removes duplicate values
-        # TODO: Remove User Level Team list and instead tag each character in the list with A or V
-        if len(teams) >= 1:
-            _description += teams[0].name
-        if len(teams) == 2:
-            _description += " & " + teams[1].name
-
-        _embed = discord.Embed(title=found_user.display_name, description=_description, timestamp=datetime.utcnow())
-
-        _characters_val = ""
-        for character in session.query(Character).filter(Character.user == found_user).all():
-            _characters_val += str(character.name) + '\t' + str(character.spec.name) + '\t' + str(
-                character.spec.character_class.name) + ' \r\n'
-
-        _embed.add_field(name="Characters", value=_characters_val, inline=False)
-
-        for team in teams:
-            _team_val = ""
-            for tier_tuple in ActiveRaidTiers:
-                _team_val += '__' + tier_tuple.name + '__' + '\r\n'
-                _ep_val = session.query(UserPointBucket) \
-                    .filter(
-                    UserPointBucket.user == found_user,
-                    UserPointBucket.team == team,
-                    UserPointBucket.raid_tier == tier_tuple.tier,
-                    UserPointBucket.point_type == PointTypes.EP
-                ) \
-                    .one()
-                _team_val += ("EP:\t" + str(_ep_val) + '\r\n')
-                _gp_val = session.query(UserPointBucket) \
-                    .filter(
-                    UserPointBucket.user == found_user,
-                    UserPointBucket.team == team,
-                    UserPointBucket.raid_tier == tier_tuple.tier,
-                    UserPointBucket.point_type == PointTypes.GP
-                ) \
-                    .one()
-                _team_val += ("GP:\t" + str(_gp_val) + '\r\n')
-                _team_val += "** ** \r\n"
-            _embed.add_field(name='**' + team.name + '**', value=_team_val, inline=True)
-
+        _embed = await db.run(generate_whois_embed, _search_param)
         await message.channel.send(embed=_embed)
     except Exception as e:
-        logger.error('Failed to handle whois because : ' + str(e))
+        logger.error("Failed to handle whois because : %s", e)
         logger.error(traceback.format_exc())
-        session.rollback()
         await message.channel.send('Failed to find character.')
-    finally:
-        session.close()
-        return
+    return
+
+
+def generate_whois_embed(session, search_param):
+    found_user = search_user(session, search_param)
+
+    _description = "Member of "
+    raw_teams = []
+    for character in found_user.characters:
+        for team in character.rosters:
+            raw_teams.append(team)
+    teams = list(set(raw_teams))  # Forcing a typecast to set removes duplicate values
+    # TODO: Remove User Level Team list and instead tag each character in the list with A or V
+    if len(teams) >= 1:
+        _description += teams[0].name
+    if len(teams) == 2:
+        _description += " & " + teams[1].name
+
+    _embed = discord.Embed(title=found_user.display_name, description=_description, timestamp=datetime.utcnow())
+
+    _characters_val = ""
+    for character in session.query(Character).filter(Character.user == found_user).all():
+        _characters_val += str(character.name) + '\t' + str(character.spec.name) + '\t' + str(
+            character.spec.character_class.name) + ' \r\n'
+
+    _embed.add_field(name="Characters", value=_characters_val, inline=False)
+
+    for team in teams:
+        _team_val = ""
+        _standings = models.get_pr_standings(session, team, user_ids=[found_user.id])
+        for tier_tuple in ActiveRaidTiers:
+            _team_val += '__' + tier_tuple.name + '__' + '\r\n'
+            _standing = _standings[tier_tuple.tier][0]
+            _team_val += ("EP:\t" + str(_standing.ep) + '\r\n')
+            _team_val += ("GP:\t" + str(_standing.gp) + '\r\n')
+            _team_val += "** ** \r\n"
+        _embed.add_field(name='**' + team.name + '**', value=_team_val, inline=True)
+
+    return _embed
 
 
 async def handle_raidshow(message):
-    session = models.Session()
     try:
         embed = discord.Embed(timestamp=datetime.utcnow())
         logger.info('Searching for active raids')
-        raidsnow = session.query(Raid) \
-            .filter(
-            Raid.starts_at <= datetime.utcnow(),
-            Raid.ends_at > datetime.utcnow()
-        ) \
-            .all()
-        logger.debug("Active raids found: " + str(raidsnow))
-        # response_body = ">>> **Current Raids** \r\n"
+        _active, _upcoming = await db.run(list_raids)
+        logger.debug("Active raids found: %s", _active)
         raidsnow_val = ""
-        if raidsnow:
+        if _active:
             logger.debug('Found a raidsnow')
-            for raid in raidsnow:
-                channel = client.get_channel(raid.signup_message_channel_id)
-                message = await channel.fetch_message(raid.signup_message_id)
-                raidsnow_val += "\t-\t" + (
-                    "[" + raid.team.name + " raiding " + raid.zone.name + " until "
-                    + paint_time(
-                        raid.ends_at.astimezone(pytz.timezone(SERVER_TIMEZONE))
-                        )
-                    + "](" + message.jump_url + ")\r\n"
-                    )
+            for _text, _channel_id, _message_id in _active:
+                _signup_message = await render_scheduler.get_message(_channel_id, _message_id)
+                raidsnow_val += "\t-\t" + "[" + _text + "](" + _signup_message.jump_url + ")\r\n"
         else:
             raidsnow_val = "No active raids"
         embed.add_field(name="**Active Raids**", value=raidsnow_val, inline=False)
-        try:
-            raidnext_val = ""
-            for team in session.query(Team).all():
-                try:
-                    raidnext = session.query(Raid).filter(Raid.starts_at >= datetime.utcnow(),
-                                                          Raid.team == team).order_by(Raid.starts_at.asc()).first()
-                    if raidnext:
-                        channel = client.get_channel(raidnext.signup_message_channel_id)
-                        message = await channel.fetch_message(raidnext.signup_message_id)
-                        raidnext_val += (
-                            "[" + raidnext.team.name + " is going to " + raidnext.zone.name + " at "
-                            + paint_time(raidnext.starts_at.astimezone(pytz.timezone(SERVER_TIMEZONE)))
-                            + "](" + message.jump_url + ")\r\n"
-                            )
-                    else:
-                        raidnext_val = '\t' + team.name + ' none found\r\n'
-                except Exception as e:
-                    logger.error("Failed to add raidnext because " + str(e))
-                    session.rollback()
-            embed.add_field(name="**Upcoming Raids**", value=raidnext_val, inline=False)
-        except Exception as e:
-            session.rollback()
-            logger.error('handle_raidshow: Failed to load the list of teams')
-            await send_dm(user_id=message.author.id, content=" Failed to load team list \r\n")
+        raidnext_val = ""
+        for _team_name, _next in _upcoming:
+            try:
+                if _next:
+                    _text, _channel_id, _message_id = _next
+                    _signup_message = await render_scheduler.get_message(_channel_id, _message_id)
+                    raidnext_val += "[" + _text + "](" + _signup_message.jump_url + ")\r\n"
+                else:
+                    raidnext_val = '\t' + _team_name + ' none found\r\n'
+            except Exception as e:
+                logger.error("Failed to add raidnext because %s", e)
+        embed.add_field(name="**Upcoming Raids**", value=raidnext_val, inline=False)
         await message.channel.send(embed=embed)
     except Exception as e:
-        logger.error("Failed to send raidshow response because : " + str(e))
+        logger.error("Failed to send raidshow response because : %s", e)
         logger.error(traceback.format_exc())
-    finally:
-        session.close()
-        return
+
+
+def list_raids(session):
+    """Active raids and each team's next raid, as link text with the signup message's channel and id."""
+    raidsnow = session.query(Raid) \
+        .filter(
+        Raid.starts_at <= datetime.utcnow(),
+        Raid.ends_at > datetime.utcnow()
+    ) \
+        .all()
+    _active = [(raid.team.name + " raiding " + raid.zone.name + " until "
+                + paint_time(raid.ends_at.astimezone(pytz.timezone(SERVER_TIMEZONE))),
+                raid.signup_message_channel_id, raid.signup_message_id) for raid in raidsnow]
+    _upcoming = []
+    for team in session.query(Team).all():
+        raidnext = session.query(Raid).filter(Raid.starts_at >= datetime.utcnow(),
+                                              Raid.team == team).order_by(Raid.starts_at.asc()).first()
+        if raidnext:
+            _upcoming.append((team.name, (raidnext.team.name + " is going to " + raidnext.zone.name + " at "
+                                          + paint_time(raidnext.starts_at.astimezone(pytz.timezone(SERVER_TIMEZONE))),
+                                          raidnext.signup_message_channel_id, raidnext.signup_message_id)))
+        else:
+            _upcoming.append((team.name, None))
+    return _active, _upcoming
 
 
 async def handle_raidschedule(message):
     # arg.raid.schedule aesir mc 2019-02-20 06:00 PM
-    session = models.Session()
     logger.info("Processing new raid")
+    _signup_message = None
     try:
         arg_array = parse_message_args(message.content)
         _team_arg = arg_array[1]
         _zone_arg = arg_array[2]
         _start_datetime_arg = arg_array[3:]
-        try:
-            _team = session.query(Team).filter(Team.name.ilike(_team_arg)).one()
-        except Exception as e:
-            logger.error("Unable to find team")
-            await message.channel.send("Raid Create Failed: Unable to locate team with name " + _team_arg)
-            raise e
         try:
             _zone = RaidZone[_zone_arg.upper()]
         except Exception as e:
@@ -855,490 +939,604 @@ async def handle_raidschedule(message):
             raise e
         try:
             start_datetime = pytz.timezone(SERVER_TIMEZONE).localize(parser.parse(' '.join(_start_datetime_arg)))
-            logger.debug("Read start_datetime as " + str(paint_time(start_datetime)))
+            logger.debug("Read start_datetime as %s", paint_time(start_datetime))
         except Exception as e:
-            logger.error(
-                "Unable to parse raid start time '" + str(_start_datetime_arg) + "' because: " + str(e))
+            logger.error("Unable to parse raid start time '%s' because: %s", _start_datetime_arg, e)
             logger.error(traceback.format_exc())
             await message.channel.send("Raid Create Failed: Unable to parse start date or time")
             raise e
         try:
-            logger.info("Creating new raid")
-            _new_raid = Raid(team=_team, zone=_zone, starts_at=start_datetime.astimezone(pytz.utc),
-                             created_by_id=message.author.id)
-            session.add(_new_raid)
-            session.commit()
-            _new_raid.ends_at = _new_raid.starts_at + _new_raid.reward_schedule.duration
-
-            logger.info("Generating embed from raid")
-            _embed = generate_raid_embed(_new_raid)
+            _raid_id, _embed = await db.run(create_raid, _team_arg, _zone, start_datetime.astimezone(pytz.utc),
+                                            created_by_id=message.author.id)
+        except ValueError as e:
+            logger.error("Unable to find team")
+            await message.channel.send(str(e))
+            raise e
+        try:
             logger.info("Sending signup message")
+            _sent_at = time.perf_counter()
             _signup_message = await message.channel.send(embed=_embed)
+            render_scheduler.remember(_signup_message)
             logger.info("Updating new raid's attached message id")
-            _new_raid.signup_message_id = _signup_message.id
-            _new_raid.signup_message_channel_id = _signup_message.channel.id
-            session.commit()
-            await attach_signup_reactions(_signup_message)
-
-            logger.debug("Scheduling process_rewards job to run at " + str(_new_raid.starts_at))
-            worker.scheduler.add_job(process_rewards,
-                                     kwargs={'raid_id': _new_raid.id},
-                                     trigger='date',
-                                     run_date=_new_raid.starts_at
-                                     # TODO: ADD SIGNUP DURATION TO STARTS_AT FOR RUN_DATE
-                                     )
-            session.commit()
+            await db.run(attach_raid_signup, _raid_id, _signup_message.channel.id, _signup_message.id)
+            message_routes.register(_signup_message.id, ROUTE_RAID, _raid_id)
+            attach_signup_reactions(_signup_message, sent_at=_sent_at)
         except Exception as e:
-            logger.error("Unable to save raid because: " + str(e))
+            logger.error("Unable to save raid because: %s", e)
             logger.error(traceback.format_exc())
             await message.channel.send("Raid Create Failed: Unable to save")
             if _signup_message is not None:
                 await _signup_message.delete()
             raise e
     except Exception as e:
-        logger.error("Raid schedule operation failed because: " + str(e))
-        session.rollback()
-        if _signup_message is not None:
-            await _signup_message.delete
-    finally:
-        session.close()
-        return
+        logger.error("Raid schedule operation failed because: %s", e)
 
 
-async def handle_itemsearch(message):
-    session = models.Session()
+def create_raid(session, team_arg, zone, starts_at, created_by_id):
+    """Save a new raid, returning its id and signup embed. Raises ValueError when no team matches team_arg."""
+    _team = session.query(Team).filter(Team.name.ilike(team_arg)).one_or_none()
+    if _team is None:
+        raise ValueError("Raid Create Failed: Unable to locate team with name " + team_arg)
+    logger.info("Creating new raid")
+    _new_raid = Raid(team=_team, zone=zone, starts_at=starts_at, created_by_id=created_by_id)
+    session.add(_new_raid)
+    session.commit()
+    _new_raid.ends_at = _new_raid.starts_at + _new_raid.reward_schedule.duration
+    logger.info("Generating embed from raid")
+    return _new_raid.id, generate_raid_embed(session, _new_raid)
+
+
+def attach_raid_signup(session, raid_id, channel_id, message_id):
+    """Record the raid's signup message and schedule its rewards."""
+    _raid = session.query(Raid).get(raid_id)
+    _raid.signup_message_id = message_id
+    _raid.signup_message_channel_id = channel_id
+    logger.debug("Scheduling process_rewards job from %s", _raid.starts_at)
+    # TODO: ADD SIGNUP DURATION TO STARTS_AT FOR THE FIRST TICK
+    schedule_raid_rewards(_raid)
+
 
+async def handle_itemsearch(message):
     try:
         item_name = message.content.split(' ', 1)[1]
-        logger.debug('Searching for item named "' + str(item_name))
+        logger.debug('Searching for item named "%s', item_name)
         if len(item_name) < 3:
-            logger.warning('Ignoring item query with less than 3 characters :"' + item_name)
+            logger.warning('Ignoring item query with less than 3 characters :"%s', item_name)
             await message.channel.send('Please use a longer word to search (>=3 characters)')
         else:
-            try:
-                items = session.query(Item).filter(Item.name.ilike('%' + item_name + '%')).all()
-                if len(items) > 1:
-                    response_body = ">>>| ** Too many similar Item Names Found** |\r\n"
-                    for other_item in items:
-                        response_body += "|" + other_item.name + "|\r\n"
-                    await message.channel.send(response_body)
-                elif len(items) == 1:
-                    await message.channel.send(">>> " + str(items[0]))
-                    # TODO: Unify item render to an embed with same details as raid_drop
-            except:
-                session.rollback()
-                raise
+            await message.channel.send(await db.run(search_item, item_name))
     except Exception as e:
         await message.channel.send('Failed to search item')
-        logger.error("Failed to search for item because : " + str(e))
-    finally:
-        session.close()
-        return
+        logger.error("Failed to search for item because : %s", e)
+
+
+def search_item(session, item_name):
+    item_id, matches = resolve_item(session, item_name)
+    if item_id is not None:
+        # TODO: Unify item render to an embed with same details as raid_drop
+        return ">>> " + str(session.query(Item).get(item_id))
+    elif matches:
+        return format_item_matches(matches)
+    return "Unable to locate item with name " + str(item_name)
 
 
 async def handle_raidgrant(message):
     logger.info("Handling raid.grant")
-    session = models.Session()
     try:
         arg_array = parse_message_args(message.content)
 
-        logger.debug("arg_array is " + str(len(arg_array)) + " entries long.")
+        logger.debug("arg_array is %s entries long.", len(arg_array))
         if len(arg_array) != 3:
-            logger.warning('Ignoring grant with improper arguments :"' + str(arg_array))
+            logger.warning('Ignoring grant with improper arguments :"%s', arg_array)
             await message.channel.send('Please use the correct format arg.raid.grant raid_id amount')
         if len(arg_array) == 3:
             logger.info("Looking for raid to grant to")
-            raid_arg = arg_array[1]
-            logger.info("Passed raid_arg")
-            amount_arg = arg_array[2]
-            logger.debug("Raid query param is " + str(raid_arg))
-            _raid = session.query(Raid).filter(Raid.id == int(raid_arg)).one_or_none()
-            if _raid is None:
-                logger.info("Couldn't find raid by id.  Attempting to lookup by message id")
-                _raid = session.query(Raid).filter(Raid.signup_message_id == int(raid_arg)).one_or_none()
-
-            if _raid is not None:
-                logger.info("Looking for active signups for raid to call give_effort")
-                _active_signups = session.query(Signup).filter(Signup.raid == _raid, Signup.is_confirmed == True,
-                                                               Signup.is_ejected == False).all()
-                if not _active_signups:
-                    logger.warning("No confirmed and non-ejected signups found for raid.")
-
-                for _signup in _active_signups:
-                    logger.info(
-                        "Calling give_effort for signup id " + str(_signup.id) + " in the amount of "
-                        + str(int(amount_arg))
-                    )
-                    _signup.give_effort(session=session, effort_amount=int(amount_arg))
-                    logger.info("Completed give_effort for signup id " + str(_signup.id))
-            else:
+            _amount = int(arg_array[2])
+            try:
+                await db.run(grant_raid_effort, arg_array[1], _amount)
+            except ValueError as e:
                 logger.info("Unable to find any raids matching grant request")
-                await message.channel.send("Unable to locate any raids with that identifier")
+                await message.channel.send(str(e))
     except Exception as e:
-        logger.error("Unable to finish raidgrant because " + str(e))
+        logger.error("Unable to finish raidgrant because %s", e)
         logger.error(traceback.format_exc())
-        session.rollback()
-    finally:
-        session.close()
-        return
+
+
+def find_raid(session, raid_arg):
+    """Look a raid up by id, then by signup message id. Raises ValueError when neither matches."""
+    logger.debug("Raid query param is %s", raid_arg)
+    _raid = None
+    if raid_arg.isdigit():
+        _raid = session.query(Raid).filter(Raid.id == int(raid_arg)).one_or_none()
+        if _raid is None:
+            logger.info("Couldn't find raid by id.  Attempting to lookup by message id")
+            _raid = session.query(Raid).filter(Raid.signup_message_id == int(raid_arg)).one_or_none()
+    if _raid is None:
+        raise ValueError("Unable to locate any raids with that identifier")
+    return _raid
+
+
+def grant_raid_effort(session, raid_arg, amount):
+    _raid = find_raid(session, raid_arg)
+    logger.info("Granting %s EP to active signups for raid %s", amount, _raid.id)
+    if not _raid.grant_effort(session=session, bonuses=[amount]):
+        logger.warning("No confirmed and non-ejected signups found for raid.")
 
 
 async def handle_raiddrop(message):
     logger.info("Handling raid.drop")
-    session = models.Session()
+    _drop_message = None
     try:
         arg_array = parse_message_args(message.content)
 
-        logger.debug("arg_array is " + str(len(arg_array)) + " entries long.")
-        if len(arg_array) != 3:
+        logger.debug("arg_array is %s entries long.", len(arg_array))
+        if len(arg_array) < 3:
             await message.channel.send('Please use the correct format arg.raid.drop raid_id Item Name')
         else:
             logger.info("Looking for raid to drop item for")
-            raid_arg = arg_array[1]
-            item_name_arg = arg_array[2:]
-            _item_name = ' '.join(item_name_arg)
-            logger.debug("Item name param is " + str(_item_name))
-            logger.debug("Raid query param is " + str(raid_arg))
-            _raid = session.query(Raid).filter(Raid.id == int(raid_arg)).one_or_none()
-            if _raid is None:
-                logger.info("Couldn't find raid by id.  Attempting to lookup by message id")
-                _raid = session.query(Raid).filter(Raid.signup_message_id == int(raid_arg)).one_or_none()
-            if _raid is not None:
-                logger.info("Found a raid, starting search for item")
-                _items = session.query(Item).filter(Item.name.ilike(_item_name + '%')).all()
-                # Maybe use HandleItemSearch()?
-                if _items is None:
-                    await message.channel.send("Unable to locate item with name " + str(_item_name))
-                elif len(_items) == 1:
-                    logger.info("Found a single item. Starting drop processing")
-                    _created_by = session.query(User).filter(User.id == message.author.id).one()
-                    _new_drop = ItemDrop(item=_items[0], raid=_raid, dropped_at=datetime.utcnow(),
-                                         created_by=_created_by)
-                    session.add(_new_drop)
-                    session.commit()
-                    _embed = generate_drop_embed(_new_drop)
-                    logger.info("Sending itemdrop embed.")
-                    _drop_message = await message.channel.send(embed=_embed)
-                    _new_drop.bid_message_channel_id = _drop_message.channel.id
-                    _new_drop.bid_message_id = _drop_message.id
-                    await attach_itemdrop_bid_reactions(_new_drop)
-                    session.commit()
-                else:
-                    logger.warning("More than one item found for drop; returning error")
-                    await message.channel.send("Located too many items with name " + str(_item_name))
-            return
+            _item_name = ' '.join(arg_array[2:])
+            try:
+                _drop_id, _embed = await db.run(create_drop, arg_array[1], _item_name, created_by_id=message.author.id)
+            except ValueError as e:
+                await message.channel.send(str(e))
+                return
+            logger.info("Sending itemdrop embed.")
+            _sent_at = time.perf_counter()
+            _drop_message = await message.channel.send(embed=_embed)
+            render_scheduler.remember(_drop_message)
+            await db.run(attach_drop_bids, _drop_id, _drop_message.channel.id, _drop_message.id)
+            message_routes.register(_drop_message.id, ROUTE_DROP, _drop_id)
+            attach_itemdrop_bid_reactions(_drop_message, sent_at=_sent_at)
+        return
     except Exception as e:
-        logger.error("Unable to process drop because " + str(e))
+        logger.error("Unable to process drop because %s", e)
         logger.error(traceback.format_exc())
-        session.rollback()
         if _drop_message is not None:
             await _drop_message.delete()
         await message.channel.send("Unable to process drop.")
-    finally:
-        session.close()
-        return
+
+
+def create_drop(session, raid_arg, item_name, created_by_id):
+    """Save a drop of the named item for the raid, returning its id and bid embed.
+
+    Raises ValueError with the reply for the channel when the raid isn't found or the name isn't resolved to one item.
+    """
+    _raid = find_raid(session, raid_arg)
+    logger.info("Found a raid, starting search for item")
+    logger.debug("Item name param is %s", item_name)
+    _item_id, _matches = resolve_item(session, item_name)
+    if _item_id is None and not _matches:
+        raise ValueError("Unable to locate item with name " + str(item_name))
+    elif _item_id is None:
+        logger.warning("No single exact or prefix match for drop; asking for the item id")
+        raise ValueError(format_item_matches(_matches))
+    logger.info("Found a single item. Starting drop processing")
+    _created_by = session.query(User).filter(User.id == created_by_id).one()
+    _new_drop = ItemDrop(item=session.query(Item).get(_item_id), raid=_raid,
+                         dropped_at=datetime.utcnow(), created_by=_created_by)
+    session.add(_new_drop)
+    session.commit()
+    return _new_drop.id, generate_drop_embed(session, _new_drop)
+
+
+def attach_drop_bids(session, drop_id, channel_id, message_id):
+    _item_drop = session.query(ItemDrop).get(drop_id)
+    _item_drop.bid_message_channel_id = channel_id
+    _item_drop.bid_message_id = message_id
 
 
 async def handle_droprefresh(message):
     logger.info("Handling drop.refresh")
-    session = models.Session()
     try:
         arg_array = parse_message_args(message.content)
         _drop_id_arg = arg_array[1]
 
-        _item_drop = session.query(ItemDrop).filter(ItemDrop.id == _drop_id_arg).one()
-        _embed = generate_drop_embed(_item_drop)
-        channel = client.get_channel(_item_drop.bid_message_channel_id)
-        message = await channel.fetch_message(_item_drop.bid_message_id)
+        _channel_id, _message_id, _embed = await db.run(render_drop_message, int(_drop_id_arg))
+        message = await render_scheduler.get_message(_channel_id, _message_id)
         await message.edit(embed=_embed)
     except Exception as e:
-        logger.error("Failed to refresh item embed because: " + str(e))
-        session.rollback()
-    finally:
-        session.close()
-        return
+        logger.error("Failed to refresh item embed because: %s", e)
+
+
+def render_drop_message(session, drop_id):
+    """The drop's bid message channel and id, with its embed as of now."""
+    _item_drop = session.query(ItemDrop).filter(ItemDrop.id == drop_id).one()
+    return _item_drop.bid_message_channel_id, _item_drop.bid_message_id, generate_drop_embed(session, _item_drop)
 
 
 async def handle_raidconfirm(message):
     logger.info("Processing raidconfirm")
-    session = models.Session()
     try:
         _arg_array = parse_message_args(message.content)
-        _raid_id_arg = _arg_array[1]
-        _raid = session.query(Raid).filter(Raid.id == int(_raid_id_arg)).one()
-        if _raid is not None:
-            if not _raid.is_closed:
-                confirm_signups(session=session, raid=_raid)
-                session.commit()
+        _raid_id = int(_arg_array[1])
+        _is_closed, _voice_channel_id, _ = await db.run(load_reward_target, _raid_id)
+        if not _is_closed:
+            await db.run(confirm_raid_signups, _raid_id, voice_member_ids(_voice_channel_id))
         return
     except Exception as e:
-        logger.error("Failed to handle raid.confirm because " + str(e))
-        session.rollback()
+        logger.error("Failed to handle raid.confirm because %s", e)
         await message.channel.send("Failed to process confirmations.")
         raise e
-    finally:
-        session.close()
+
+
+def confirm_raid_signups(session, raid_id, member_ids):
+    confirm_signups(session=session, raid=session.query(Raid).get(raid_id), member_ids=member_ids)
 
 
 async def handle_dropaward(message):
     logger.info("Processing drop award")
-    session = models.Session()
     try:
         _arg_array = parse_message_args(message.content)
-        _drop_id_arg = _arg_array[1]
+        _drop_id = int(_arg_array[1])
         try:
-            # TODO: refactor: split function here
-            _item_drop = session.query(ItemDrop).filter(ItemDrop.id == int(_drop_id_arg)).one()
-            if not _item_drop.is_awarded:
-                _item_drop.award(session=session)
-                session.commit()
-                if _item_drop.winner_id is not None:
-                    await message.channel.send("Item successfully awarded")
-                else:
-                    await message.channel.send("No bids, item is headed to shardsville")
-            else:
-                await message.channel.send("Item already awarded.  Check or refresh the drop id?")
+            await message.channel.send(await db.run(award_drop, _drop_id))
         except Exception as e:
-            logger.error("Failed to handle drop award because " + str(e))
+            logger.error("Failed to handle drop award because %s", e)
             await message.channel.send("Failed to process item award.")
-            session.rollback()
             raise e
         try:
-            _embed = generate_drop_embed(_item_drop)
-            _drop_channel = client.get_channel(_item_drop.bid_message_channel_id)
-            _drop_message = await _drop_channel.fetch_message(_item_drop.bid_message_id)
+            _channel_id, _message_id, _embed = await db.run(render_drop_message, _drop_id)
+            _drop_message = await render_scheduler.get_message(_channel_id, _message_id)
             await _drop_message.edit(embed=_embed)
         except Exception as e:
-            logger.error("Failed to update drop with award info because " + str(e))
+            logger.error("Failed to update drop with award info because %s", e)
             logger.error(traceback.format_exc())
             await message.channel.send(
                 "Failed to update drop render in discord, but item was awarded.  Try arg.drop.refresh DropID to recover")
     except:
         logger.error(traceback.format_exc())
-    finally:
-        session.close()
-        return
+
+
+def award_drop(session, drop_id):
+    """Award the drop unless it already was, returning the reply for the channel."""
+    _item_drop = session.query(ItemDrop).filter(ItemDrop.id == drop_id).one()
+    if _item_drop.is_awarded:
+        return "Item already awarded.  Check or refresh the drop id?"
+    _item_drop.award(session=session)
+    session.commit()
+    if _item_drop.winner_id is not None:
+        return "Item successfully awarded"
+    return "No bids, item is headed to shardsville"
 
 
 async def handle_raideject(message):
     logger.info("Processing raid ejection")
-    session = models.Session()
+    _person_arg = None
     try:
         _arg_array = parse_message_args(message.content)
         _raid_id_arg = _arg_array[1]
         _person_arg = _arg_array[2]
-
-        _user = search_user(session, _person_arg)
-        if _user is not None:
-            _signup = session.query(Signup).filter(Signup.raid_id == int(_raid_id_arg)).join(Signup.character).filter(
-                Character.user == _user).one()
-        else:
-            logger.warning("Unable to find user for ejection")
-            raise
-        _signup.is_ejected = True
-        _signup.ejected_at = datetime.utcnow()
-        session.commit()
+        await db.run(eject_signup, int(_raid_id_arg), _person_arg)
         return
     except Exception as e:
-        logger.error("Failed to eject user because " + str(e))
+        logger.error("Failed to eject user because %s", e)
         logger.error(traceback.format_exc())
         await send_dm(message.author.id, "Failed to eject " + str(_person_arg) + " from raid.")
-        session.rollback()
-    finally:
-        session.close()
+
+
+def eject_signup(session, raid_id, person_arg):
+    _user = search_user(session, person_arg)
+    if _user is None:
+        logger.warning("Unable to find user for ejection")
+        raise ValueError("Couldn't locate user")
+    _signup = session.query(Signup).filter(Signup.raid_id == raid_id).join(Signup.character).filter(
+        Character.user == _user).one()
+    _signup.is_ejected = True
+    _signup.ejected_at = datetime.utcnow()
 
 
 async def handle_useraudit(message):
+    # arg.user.audit @User TeamName Tier EP|GP or arg.user.audit @User TeamName csv
     logger.info("Processing user audit request")
-    session = models.Session()
     try:
         _arg_array = parse_message_args(message.content)
-        person_arg = _arg_array[1]
-        team_arg = _arg_array[2]
-
-        _user = search_user(session, person_arg)
-        _team = session.query(Team).filter(Team.name.ilike(team_arg)).one()
-
-        if _user:
-            _ep_transactions = {}
-            for tier_tuple in models.ActiveRaidTiers:
-                
-                
-                _ep_transactions[tier_tuple.name] = session.query(EffortPointLedgerEntry) \
-                    .filter(EffortPointLedgerEntry.team == _team,
-                            EffortPointLedgerEntry.user == _user,
-                            EffortPointLedgerEntry.raid_tier == tier_tuple.tier) \
-                    .order_by(EffortPointLedgerEntry.created_at.desc()) \
-                    .all()  # Probably not how to do this. TODO: Lookup query.limit function
-            _gp_transactions = {}
-            for tier_tuple in models.ActiveRaidTiers:
-                _gp_transactions[tier_tuple.name] = session.query(GearPointLedgerEntry) \
-                    .filter(GearPointLedgerEntry.team == _team,
-                            GearPointLedgerEntry.user == _user,
-                            GearPointLedgerEntry.raid_tier == tier_tuple.tier) \
-                    .order_by(EffortPointLedgerEntry.created_at.desc()) \
-                    .all()
-            # TODO Build a new embed formatter for the ledger entries
+        _person_arg = _arg_array[1]
+        _team_arg = _arg_array[2]
+        if len(_arg_array) == 4 and _arg_array[3].lower() == 'csv':
+            _filename, _export = await db.run(export_user_ledger, _person_arg, _team_arg)
+            try:
+                await message.author.send(content="Ledger history export", file=discord.File(_export, _filename))
+            finally:
+                _export.close()
+            return
+        _tier_arg = _arg_array[3]
+        _point_type = PointTypes[_arg_array[4].upper()] if len(_arg_array) > 4 else PointTypes.EP
+
+        _view, _embed = await db.run(open_ledger_audit, message.author.id, _person_arg, _team_arg, _tier_arg,
+                                     _point_type)
+        _audit_message = await message.author.send(embed=_embed)
+        remember_audit_view(_audit_message, _view)
+        reaction_attacher.attach(_audit_message, (AUDIT_NEWER_EMOJI, AUDIT_OLDER_EMOJI), 'Ledger audit')
         return
     except Exception as e:
-        logger.error("Couldn't process user audit request because " + str(e))
-    finally:
-        session.close()
+        logger.error("Couldn't process user audit request because %s", e)
+        logger.error(traceback.format_exc())
+        await send_dm(message.author.id, "Couldn't process user audit request because " + str(e))
+
+
+def find_audit_target(session, person_arg, team_arg):
+    _user = search_user(session, person_arg)
+    if _user is None:
+        raise ValueError("Couldn't locate user " + person_arg)
+    _team = session.query(Team).filter(Team.name.ilike(team_arg)).one()
+    return _user, _team
+
+
+def open_ledger_audit(session, owner_id, person_arg, team_arg, tier_arg, point_type):
+    _user, _team = find_audit_target(session, person_arg, team_arg)
+    raid_tier = None
+    for tier_tuple in ActiveRaidTiers:
+        if tier_arg.lower() in tier_tuple.name.lower():
+            raid_tier = tier_tuple
+    if raid_tier is None:
+        raise ValueError("Couldn't find that raid tier or we aren't tracking EPGP for it.")
+    _view = AuditView(owner_id=owner_id, user_id=_user.id, display_name=_user.display_name, team_id=_team.id,
+                      team_name=_team.name, raid_tier=raid_tier.tier, tier_name=raid_tier.name, point_type=point_type,
+                      newest=None, oldest=None, has_newer=False, has_older=False)
+    _page = models.get_ledger_page(session, point_type, _user.id, _team.id, raid_tier.tier)
+    _view = page_view(_view, _page)
+    return _view, generate_audit_embed(_view, _page)
+
+
+def page_ledger_audit(session, view, older):
+    if older:
+        _page = models.get_ledger_page(session, view.point_type, view.user_id, view.team_id, view.raid_tier,
+                                       before=view.oldest)
+    else:
+        _page = models.get_ledger_page(session, view.point_type, view.user_id, view.team_id, view.raid_tier,
+                                       after=view.newest)
+    _view = page_view(view, _page)
+    return _view, generate_audit_embed(_view, _page)
+
+
+def export_user_ledger(session, person_arg, team_arg):
+    _user, _team = find_audit_target(session, person_arg, team_arg)
+    return (_user.display_name + '-' + _team.name + '-ledger.csv').lower(), \
+        export_ledger_csv(session, _user.id, _team.id)
+
+
+def generate_audit_embed(view, page):
+    _lines = []
+    for entry in page.entries:
+        _line = "`" + pytz.utc.localize(entry.created_at).astimezone(pytz.timezone(SERVER_TIMEZONE)) \
+            .strftime("%Y-%m-%d %H:%M") + "` " + entry.transaction_type.name + " **" \
+            + "{:+d}".format(entry.point_delta or 0) + "** = " + str(entry.point_new_value)
+        if entry.item_name:
+            _line += " (" + entry.item_name + ")"
+        elif entry.raid_id:
+            _line += " (raid " + str(entry.raid_id) + ")"
+        _lines.append(_line)
+    _embed = discord.Embed(title="**" + view.display_name + "** " + view.point_type.name + " ledger",
+                           description="\r\n".join(_lines) or "No ledger entries",
+                           timestamp=datetime.utcnow())
+    _footer = view.team_name + " " + view.tier_name
+    if view.has_newer:
+        _footer += " | " + AUDIT_NEWER_EMOJI + " newer"
+    if view.has_older:
+        _footer += " | " + AUDIT_OLDER_EMOJI + " older"
+    _embed.set_footer(text=_footer)
+    return _embed
+
+
+def remember_audit_view(message, view):
+    render_scheduler.remember(message)
+    message_routes.register(message.id, ROUTE_AUDIT, message.id)
+    for message_id in audit_pages.remember(message.id, view):
+        message_routes.unregister(message_id)
+        render_scheduler.forget(message_id)
+
+
+@instruments.timed('reaction:audit')
+async def handle_reaction_audit(raw_event):
+    # Adding and removing a reaction both turn the page, the bot can't clear other people's reactions in DMs
+    _view = audit_pages.get(raw_event.message_id)
+    if _view is None or raw_event.user_id != _view.owner_id:
+        return
+    _emoji = str(raw_event.emoji)
+    if _emoji == AUDIT_OLDER_EMOJI and _view.has_older:
+        _older = True
+    elif _emoji == AUDIT_NEWER_EMOJI and _view.has_newer:
+        _older = False
+    else:
+        return
+    _view, _embed = await db.run(page_ledger_audit, _view, _older)
+    _message = await render_scheduler.get_message(raw_event.channel_id, raw_event.message_id)
+    await _message.edit(embed=_embed)
+    audit_pages.remember(raw_event.message_id, _view)
 
 
-async def handle_reaction_raid(raw_event, session, raid):
+@instruments.timed('reaction:raid')
+async def handle_reaction_raid(raw_event, raid_id):
     try:
-        _specs = session.query(Spec).filter(Spec.emoticon_id == raw_event.emoji.id).all()
-        _user = session.query(User).filter(User.id == raw_event.user_id).one()
-        action = raw_event.event_type
-
-        _spec_ids = []
-        for spec in _specs:
-            _spec_ids.append(spec.id)
-
-        _characters = session.query(Character).filter(Character.user == _user, Character.spec_id.in_(_spec_ids),
-                                                      Character.rosters.contains(raid.team)).all()
-        if not _characters:
-            logger.error("Unable to find character for user id " + str(_user.id) + "and emoji id " + str(
-                raw_event.emoji.id) + " for team " + str(raid.team.name))
-            if action == 'REACTION_ADD':
-                await send_dm(raw_event.user_id,
-                              "Unable to find a character to sign up for this raid.  "
-                              + "Are you using the correct class icon and checked your raid team assignment?")
-        elif len(_characters) == 1:
-            _signup = session.query(Signup).filter(Signup.user == _user, Signup.raid == raid).one_or_none()
-            if action == 'REACTION_ADD':
-                if _signup is None:
-                    _signup = Signup(user=_user, character=_characters[0], raid=raid, signup_at=datetime.now())
-                    session.add(_signup)
-                else:
-                    logger.info("Found existing signup id " + str(_signup.id) + " for this user for this raid")
-                    if _signup.is_rescinded == True:  # Signup was previously rescinded, set back to active
-                        _signup.is_rescinded = False
-                        _signup.rescinded_at = datetime.utcnow()
-                    _signup.character = _characters[0]  # Force to this current character regardless of old state
-            elif action == 'REACTION_REMOVE':
-                if _signup is not None and _signup.character == _characters[0]:
-                    _signup.is_rescinded = True
-                    _signup.rescinded_at = datetime.utcnow()
-                else:
-                    logger.warning("Couldn't find signup for removed reaction; I must've missed a REACTION_ADD event?")
-            session.commit()
-            _embed = generate_raid_embed(raid)
-            channel = client.get_channel(raw_event.channel_id)
-            message = await channel.fetch_message(raw_event.message_id)
-            await message.edit(embed=_embed)
-        else:
-            logger.warning("More than one character found for signup.  Something is wrong")
-            logger.debug(
-                "Found characters " + str(_characters) + " for " + str(_user.id) + " with emoji " + str(
-                    raw_event.emoji.id))
+        _matched = await db.run(apply_reaction_raid, raw_event, raid_id)
+        if _matched == 1:
+            render_scheduler.schedule(raw_event.channel_id, raw_event.message_id,
+                                      lambda session: render_raid_embed(session, raid_id))
+        elif _matched == 0 and raw_event.event_type == 'REACTION_ADD':
+            await send_dm(raw_event.user_id,
+                          "Unable to find a character to sign up for this raid.  "
+                          + "Are you using the correct class icon and checked your raid team assignment?")
         return
     except Exception as e:
-        logger.error("Unable to handle raid reaction because " + str(e))
+        logger.error("Unable to handle raid reaction because %s", e)
         logger.error(traceback.format_exc())
-        session.rollback()
 
 
-async def handle_reaction_bid(raw_event, session, item_drop):
-    logger.info("Handling item bid")
-    try:
-        try:
-            _user = session.query(User).filter(User.id == raw_event.user_id).one()
-            _signup = session.query(Signup).filter(Signup.user == _user, Signup.raid == item_drop.raid).one()
-            action = raw_event.event_type
-        except:
-            await send_dm(raw_event.user_id,
-                          "Unable to create your bid on " + item_drop.item.name + " because you aren't signed up for this raid.")
-            raise
-
-        if raw_event.emoji.name is None:
-            logger.info("Emoji name was not included, looking it up from our registered cache")
-            bid_name = Bids.lookup(raw_event.emoji.id)
-        else:
-            logger.debug("Got bid reaction name from event " + raw_event.emoji.name)
-            bid_name = raw_event.emoji.name
-
-        _item_drop_bid = session.query(ItemDropBid).filter(ItemDropBid.drop_id == item_drop.id,
-                                                           ItemDropBid.user_id == _user.id).one_or_none()
-
-        if _item_drop_bid is None:
-            logger.info("Did not find existing bid; creating new one")
-            _item_drop_bid = ItemDropBid(drop=item_drop, user=_user, character=_signup.character)
-            session.add(_item_drop_bid)
-        elif _item_drop_bid.character is None:
-            # Bid was found, but character was not correctly attached before
-            _item_drop_bid.character = _signup.character
-
-        if bid_name == 'bid_100':
-            if action == 'REACTION_ADD':
-                _item_drop_bid.bid_100 = True
-            elif action == 'REACTION_REMOVE':
-                _item_drop_bid.bid_100 = False
-        elif bid_name == 'bid_25':
-            if action == 'REACTION_ADD':
-                _item_drop_bid.bid_25 = True
-            elif action == 'REACTION_REMOVE':
-                _item_drop_bid.bid_25 = False
-        elif bid_name == 'bid_0':
-            if action == 'REACTION_ADD':
-                _item_drop_bid.bid_0 = True
-            elif action == 'REACTION_REMOVE':
-                _item_drop_bid.bid_0 = False
-        else:
-            logger.error("Unknown bid name value when handling reaction " + str(bid_name))
+def apply_reaction_raid(session, raw_event, raid_id):
+    """Apply a signup reaction to a raid, returning how many of the user's characters matched the emoji."""
+    raid = session.query(Raid).get(raid_id)
+    _spec_ids = emoji_registry.spec_ids_for(raw_event.emoji.id)
+    if not _spec_ids:
+        logger.info("Emoji %s isn't a registered spec emoji, checking specs directly", raw_event.emoji.id)
+        _spec_ids = [spec_id for (spec_id,) in
+                     session.query(Spec.id).filter(Spec.emoticon_id == raw_event.emoji.id).all()]
+    _context = user_contexts.get(session, raw_event.user_id)
+    if _context is None:
+        raise ValueError("No registered user with id " + str(raw_event.user_id))
+    action = raw_event.event_type
+
+    _characters = _context.characters_for(_spec_ids, raid.team_id)
+    if not _characters:
+        logger.error("Unable to find character for user id %s and emoji id %s for team %s", _context.user_id,
+                     raw_event.emoji.id, raid.team.name)
+    elif len(_characters) == 1:
+        # Signups are written with single Core statements and recorded straight into the user context, so a
+        # cached reaction costs one write and doesn't invalidate the context it just used
+        _character_id = _characters[0].id
+        _signup = _context.signups.get(raid.id)
+        _signup_table = Signup.__table__
+        if action == 'REACTION_ADD':
+            if _signup is None:
+                _result = session.execute(_signup_table.insert().values(
+                    user_id=_context.user_id, character_id=_character_id, raid_id=raid.id,
+                    signup_at=datetime.now()))
+                _signup = SignupContext(_result.inserted_primary_key[0], _character_id, False)
+            else:
+                logger.info("Found existing signup id %s for this user for this raid", _signup.id)
+                _values = {'character_id': _character_id}  # Force to this current character regardless of old state
+                if _signup.is_rescinded:  # Signup was previously rescinded, set back to active
+                    _values.update(is_rescinded=False, rescinded_at=datetime.utcnow())
+                session.execute(_signup_table.update().where(_signup_table.c.id == _signup.id).values(**_values))
+                _signup = SignupContext(_signup.id, _character_id, False)
+        elif action == 'REACTION_REMOVE':
+            if _signup is not None and _signup.character_id == _character_id:
+                session.execute(_signup_table.update().where(_signup_table.c.id == _signup.id)
+                                .values(is_rescinded=True, rescinded_at=datetime.utcnow()))
+                _signup = SignupContext(_signup.id, _character_id, True)
+            else:
+                logger.warning("Couldn't find signup for removed reaction; I must've missed a REACTION_ADD event?")
         session.commit()
+        if _signup is not None:
+            user_contexts.record_signup(_context.user_id, raid.id, _signup)
+    else:
+        logger.warning("More than one character found for signup.  Something is wrong")
+        logger.debug("Found characters %s for %s with emoji %s", _characters, _context.user_id, raw_event.emoji.id)
+    return len(_characters)
 
-        try:
-            _embed = generate_drop_embed(item_drop)
-            channel = client.get_channel(raw_event.channel_id)
-            message = await channel.fetch_message(raw_event.message_id)
-            await message.edit(embed=_embed)
-        except Exception as e:
-            logger.error("Failed to update drop embed for " + str(item_drop.id) + " because " + str(e))
-            await client.get_channel(raw_event.channel_id).send(
-                "Unable to update latest bid info. Ask a GM to manually refresh")
-            raise
+
+@instruments.timed('reaction:bid')
+async def handle_reaction_bid(raw_event, drop_id):
+    logger.info("Handling item bid")
+    try:
+        _refusal = await db.run(apply_reaction_bid, raw_event, drop_id)
+        if _refusal is not None:
+            await send_dm(raw_event.user_id, _refusal)
+            return
+        render_scheduler.schedule(raw_event.channel_id, raw_event.message_id,
+                                  lambda session: render_drop_embed(session, drop_id),
+                                  failure_notice="Unable to update latest bid info. Ask a GM to manually refresh")
     except Exception as e:
-        logger.error("Unable to handle reaction bid because " + str(e))
+        logger.error("Unable to handle reaction bid because %s", e)
         logger.error(traceback.format_exc())
-        session.rollback()
+
+
+def apply_reaction_bid(session, raw_event, drop_id):
+    """Apply a bid reaction to a drop, returning a message for the user instead when the bid can't be taken."""
+    item_drop = session.query(ItemDrop).get(drop_id)
+    action = raw_event.event_type
+    if item_drop.is_awarded:
+        if action == 'REACTION_ADD':
+            logger.warning("Ignoring late bid from %s for drop %s", raw_event.user_id, item_drop.id)
+            return "Recieved your bid after the item was already awarded, sorry!"
+        logger.warning("Ignoring late bid cancellation from %s for drop %s", raw_event.user_id, item_drop.id)
+        return ("Received your bid cancellation after the item was already awarded."
+                + " If you won the item, then don't equip it and ping a Raid Leader for help")
+
+    _context = user_contexts.get(session, raw_event.user_id)
+    _signup = user_contexts.signup_for(session, _context, item_drop.raid_id) if _context is not None else None
+    if _signup is None:
+        logger.error("User %s isn't signed up for raid %s", raw_event.user_id, item_drop.raid_id)
+        return ("Unable to create your bid on " + item_drop.item.name
+                + " because you aren't signed up for this raid.")
+
+    if raw_event.emoji.name is None:
+        logger.info("Emoji name was not included, looking it up from our registered cache")
+        bid_name = emoji_registry.name_for(raw_event.emoji.id)
+    else:
+        logger.debug("Got bid reaction name from event %s", raw_event.emoji.name)
+        bid_name = raw_event.emoji.name
+
+    _item_drop_bid = session.query(ItemDropBid).get((item_drop.id, _context.user_id))
+
+    if _item_drop_bid is None:
+        logger.info("Did not find existing bid; creating new one")
+        _item_drop_bid = ItemDropBid(drop_id=item_drop.id, user_id=_context.user_id,
+                                     character_id=_signup.character_id)
+        session.add(_item_drop_bid)
+    elif _item_drop_bid.character_id is None:
+        # Bid was found, but character was not correctly attached before
+        _item_drop_bid.character_id = _signup.character_id
+
+    if bid_name == 'bid_100':
+        if action == 'REACTION_ADD':
+            _item_drop_bid.bid_100 = True
+        elif action == 'REACTION_REMOVE':
+            _item_drop_bid.bid_100 = False
+    elif bid_name == 'bid_25':
+        if action == 'REACTION_ADD':
+            _item_drop_bid.bid_25 = True
+        elif action == 'REACTION_REMOVE':
+            _item_drop_bid.bid_25 = False
+    elif bid_name == 'bid_0':
+        if action == 'REACTION_ADD':
+            _item_drop_bid.bid_0 = True
+        elif action == 'REACTION_REMOVE':
+            _item_drop_bid.bid_0 = False
+    else:
+        logger.error("Unknown bid name value when handling reaction %s", bid_name)
+    return None
 
 
 async def handle_prwhisper(message):
     logger.info("Handling a PR request")
-    session = models.Session()
-    logger.debug("got a session")
     try:
-        arg_array = message.content.split(' ')
-        if len(arg_array) != 2:
+        arg_array = message.content.split()
+        if len(arg_array) < 2:
             await send_dm(message.author.id, "arg.pr command requires a team name argument")
+            return
         logger.debug("Split the arg_array")
         team_arg = arg_array[1]
-
-        try:
-            logger.debug("Looking for team")
-            team = session.query(Team).filter(Team.name.ilike(team_arg)).one()
-        except Exception as e:
-            logger.warning("Couldn't find team by name for PR whisper")
-            await send_dm(message.author.id, "Couldn't find that team name. Check your spelling?")
-            raise
-
-        _embed = generate_pr_embed(session, team)
+        _at = None
+        _drop_id = None
+        if len(arg_array) == 4 and arg_array[2].lower() == 'drop' and arg_array[3].isdigit():
+            _drop_id = int(arg_array[3])
+        elif len(arg_array) > 2:
+            try:
+                _at = pytz.timezone(SERVER_TIMEZONE).localize(parser.parse(' '.join(arg_array[2:])))
+                _at = _at.astimezone(pytz.utc).replace(tzinfo=None)
+            except Exception as e:
+                logger.warning("Unable to parse PR date '%s' because: %s", arg_array[2:], e)
+                await send_dm(message.author.id, "Unable to parse that date or time")
+                return
+
+        _embed = await db.run(render_pr_embed, team_arg, _at, _drop_id)
+        if _embed is None:
+            logger.warning("Couldn't find team or drop for PR whisper")
+            await send_dm(message.author.id, "Couldn't find that team name or drop. Check your spelling?")
+            return
         await send_dm(user_id=message.author.id, embed=_embed)
         return
     except Exception as e:
-        logger.error("Couldn't handle PR whisper because " + str(e))
+        logger.error("Couldn't handle PR whisper because %s", e)
         logger.error(traceback.format_exc())
-        session.rollback()
-    finally:
-        session.close()
+
+
+def render_pr_embed(session, team_arg, at=None, drop_id=None):
+    logger.debug("Looking for team")
+    team = session.query(Team).filter(Team.name.ilike(team_arg)).one_or_none()
+    if team is None:
+        return None
+    if drop_id is not None:
+        drop = session.query(ItemDrop).get(drop_id)
+        if drop is None:
+            return None
+        at = drop.dropped_at
+    return generate_pr_embed(session, team, at)
 
 
 async def handle_teamassign(message):
     # arg.team.assign aesir <@!1234567890> Cawl Healer Priest
     logger.info("Handling a team assignment")
-    session = models.Session()
     try:
         arg_array = parse_message_args(message.content)
         if len(arg_array) == 3:
@@ -1359,111 +1557,96 @@ async def handle_teamassign(message):
             await send_dm(message.author.id, content="Unable to process assignment, invalid number of arguments.")
             raise ValueError("Invalid argument count provided to team.assign")
 
+        discord_user = None
+        if user_arg and user_arg.startswith('<@!'):
+            if len(message.mentions) == 1:
+                logger.info("Getting the user directly from the message's mention list")
+                discord_user = message.mentions[0]
+            else:
+                logger.info("Trying to fetch discord user from their API by ID")
+                discord_user = client.get_user(int(user_arg.split('!')[1].replace('>', '')))
+
         try:
-            logger.debug("Looking for team")
-            team = session.query(Team).filter(Team.name.ilike(team_arg)).one()
-        except Exception as e:
-            logger.warning("Couldn't find team by name for assignment")
-            await send_dm(message.author.id, "Couldn't find that team name. Check your spelling?")
+            await db.run(assign_team_character, team_arg=team_arg, char_arg=char_arg, user_arg=user_arg,
+                         role_arg=role_arg, class_arg=class_arg, discord_user=discord_user,
+                         guild_id=message.author.guild.id)
+        except ValueError as e:
+            await send_dm(message.author.id, str(e))
             raise e
+    except Exception as e:
+        logger.error("Couldn't handle team assignment because %s", e)
+        logger.error(traceback.format_exc())
 
-        if user_arg:
-            try:
-                logger.debug("Looking for user to assign character to")
-                user = search_user(session, user_arg)
-                if user is None:
-                    logger.info("User not found, trying to create a new one.")
-                    logger.debug("User arg looks like: " + str(user_arg))
-                    if user_arg.startswith('<@!'):
-                        new_user_id = user_arg.split('!')[1].replace('>', '')
-                        logger.debug("Creating new user with id: " + str(new_user_id))
-                        if len(message.mentions) == 1:
-                            logger.info("Getting the user directly from the message's mention list")
-                            discord_user = message.mentions[0]
-                        else:
-                            logger.info("Trying to fetch discord user from their API by ID")
-                            discord_user = client.get_user(int(new_user_id))
-                        logger.debug("Got user from discord: " + str(discord_user))
-                        user = User(id=new_user_id,
-                                    discord_guild_id=message.author.guild.id,
-                                    name=discord_user.name,
-                                    display_name=discord_user.display_name)
-                        session.add(user)
-                        session.commit()
-                    else:
-                        logger.warning("Unable to parse user")
-                        raise ValueError("Unable to locate User")
-            except Exception as e:
+
+def assign_team_character(session, team_arg, char_arg, user_arg=None, role_arg=None, class_arg=None,
+                          discord_user=None, guild_id=None):
+    try:
+        logger.debug("Looking for team")
+        team = session.query(Team).filter(Team.name.ilike(team_arg)).one()
+    except Exception as e:
+        logger.warning("Couldn't find team by name for assignment")
+        raise ValueError("Couldn't find that team name. Check your spelling?")
+
+    user = None
+    if user_arg:
+        logger.debug("Looking for user to assign character to")
+        user = search_user(session, user_arg)
+        if user is None:
+            logger.info("User not found, trying to create a new one.")
+            logger.debug("User arg looks like: %s", user_arg)
+            if discord_user is None:
                 logger.warning("Couldn't find or create discord user")
-                await send_dm(message.author.id, "Couldn't find that discord user. Check your @tag to make sure it "
-                              + "linked before you sent it?")
-                raise e
-        else:
-            user = None
+                raise ValueError("Couldn't find that discord user. Check your @tag to make sure it "
+                                 + "linked before you sent it?")
+            logger.debug("Creating new user from discord user: %s", discord_user)
+            user = User(id=discord_user.id,
+                        discord_guild_id=guild_id,
+                        name=discord_user.name,
+                        display_name=discord_user.display_name)
+            session.add(user)
+
+    logger.info("Searching for a character to assign")
+    query = session.query(Character).filter(Character.name.ilike(char_arg))
+    if user:
+        query = query.filter(Character.user == user)
+    try:
+        character = query.one_or_none()
+    except models.sqlalchemy.orm.exc.MultipleResultsFound as e:
+        raise ValueError("Found more than one character with that name, ask Cawl for help")
+
+    if character:
+        logger.info("Found an existing character, appending team to its rosters")
+    elif user and role_arg and class_arg:
+        logger.info("Role and class was provided, trying to create new character")
         try:
-            logger.info("Searching for a character to assign")
-
-            query = session.query(Character).filter(Character.name.ilike(char_arg))
-            if user:
-                query.filter(Character.user == user)
-            try:
-                character = query.one_or_none()
-            except models.sqlalchemy.orm.exc.MultipleResultsFound as e:
-                await send_dm(
-                    (message.author.id, "Found more than one character with that name, ask Cawl for help"))
-
-            if character:
-                logger.info("Found an existing character, appending team to its rosters")
-            elif user and role_arg and class_arg:
-                logger.info("Role and class was provided, trying to create new character")
-                try:
-                    spec = session.query(Spec).filter(Spec.name.ilike(role_arg),
-                                                      Spec.character_class == class_arg.title()).one()
-                    character_list = user.find_characters(session=session, character_class=spec.character_class)
-                    if len(character_list) == 1:
-                        character = character_list[0]
-                    elif len(character_list) > 1:
-                        raise ValueError("Too many characters found with that class for this user.")
-
-                    if not character:
-                        logger.info("Creating new character for " + str(user))
-                        character = Character(user=user, name=char_arg.title(), spec=spec)
-                        session.add(character)
-                except Exception as e:
-                    await send_dm(message.author.id, "Couldn't find a spec matching " + str(role_arg) + ' '
-                                  + str(class_arg) + '\r\n'
-                                  + "Valid roles are Tank, Melee, Caster, Ranged, Healer\r\n")
-                    raise e
-            else:
-                logger.warning("Unable to find character")
-                await send_dm(message.author.id, "Couldn't find a character with name" + str(char_arg))
-                raise ValueError("No character found with name" + char_arg)
-            team.assign(session, character)
-            session.commit()
+            spec = session.query(Spec).filter(Spec.name.ilike(role_arg),
+                                              Spec.character_class == class_arg.title()).one()
+            character_list = user.find_characters(session=session, character_class=spec.character_class)
+            if len(character_list) == 1:
+                character = character_list[0]
+            elif len(character_list) > 1:
+                raise ValueError("Too many characters found with that class for this user.")
+
+            if not character:
+                logger.info("Creating new character for %s", user)
+                character = Character(user=user, name=char_arg.title(), spec=spec)
+                session.add(character)
         except Exception as e:
-            logger.warning("Couldn't find or create character")
-            # await send_dm(message.author.id, "Couldn't find or create that character")
-            raise e
-
-    except Exception as e:
-        logger.error("Couldn't handle team assignment because " + str(e))
-        logger.error(traceback.format_exc())
-        session.rollback()
-    finally:
-        session.close()
+            raise ValueError("Couldn't find a spec matching " + str(role_arg) + ' ' + str(class_arg) + '\r\n'
+                             + "Valid roles are Tank, Melee, Caster, Ranged, Healer\r\n")
+    else:
+        logger.warning("Unable to find character")
+        raise ValueError("Couldn't find a character with name " + str(char_arg))
+    team.assign(session, character)
+    return
 
 
 async def handle_usergrant(message):
     # arg.user.ep @User Team Tier Amount
     logger.info("Handling a user grant")
-    session = models.Session()
     try:
         arg_array = parse_message_args(message.content)
         _point_type_arg = arg_array[0].split('.')[2]
-        _user_arg = arg_array[1]
-        _team_arg = arg_array[2]
-        _tier_arg = arg_array[3]
-        _amount_arg = arg_array[4]
 
         if _point_type_arg.lower() == 'ep':
             _point_type = PointTypes.EP
@@ -1472,74 +1655,74 @@ async def handle_usergrant(message):
         else:
             raise ValueError("Invalid grant command, unknown point type")
 
-        _user = search_user(session, _user_arg)
-
-        if _user is None:
-            raise ValueError("Couldn't locate user")
-
-        _team = session.query(Team).filter(Team.name.ilike(_team_arg)).one()
-
-        raid_tier = None
-        for tier_tuple in ActiveRaidTiers:
-            if _tier_arg.lower() in tier_tuple.name.lower():
-                raid_tier = tier_tuple
-
-        if raid_tier.tier is None:
-            raise ValueError("Couldn't find that raid tier or we aren't tracking EPGP for it.")
-        else:
-            _bucket = session.query(UserPointBucket) \
-                .filter(
-                UserPointBucket.user == _user,
-                UserPointBucket.team == _team,
-                UserPointBucket.raid_tier == raid_tier.tier,
-                UserPointBucket.point_type == _point_type
-            ) \
-                .one()
-            _bucket.grant_points(
-                session=session,
-                delta_points=int(_amount_arg)
-            )
+        await db.run(grant_user_points, _point_type, user_arg=arg_array[1], team_arg=arg_array[2],
+                     tier_arg=arg_array[3], amount=int(arg_array[4]))
         return
     except Exception as e:
-        logger.error("Unable to process user grant because " + str(e))
+        logger.error("Unable to process user grant because %s", e)
         logger.error(traceback.format_exc())
         await message.channel.send("Unable to grant points to user")
         await send_dm(message.author.id, content="Unable to grant points to user because " + str(e))
-        session.rollback()
-    finally:
-        session.close()
+
+
+def grant_user_points(session, point_type, user_arg, team_arg, tier_arg, amount):
+    _user = search_user(session, user_arg)
+
+    if _user is None:
+        raise ValueError("Couldn't locate user")
+
+    _team = session.query(Team).filter(Team.name.ilike(team_arg)).one()
+
+    raid_tier = None
+    for tier_tuple in ActiveRaidTiers:
+        if tier_arg.lower() in tier_tuple.name.lower():
+            raid_tier = tier_tuple
+
+    if raid_tier is None:
+        raise ValueError("Couldn't find that raid tier or we aren't tracking EPGP for it.")
+    _bucket = session.query(UserPointBucket) \
+        .filter(
+        UserPointBucket.user == _user,
+        UserPointBucket.team == _team,
+        UserPointBucket.raid_tier == raid_tier.tier,
+        UserPointBucket.point_type == point_type
+    ) \
+        .one()
+    _bucket.grant_points(
+        session=session,
+        delta_points=int(amount)
+    )
 
 
 async def handle_decay(message):
     # arg.decay
-    logger.info("Handling a user grant")
-    session = models.Session()
+    logger.info("Handling a decay request")
     try:
-        process_decayall(session)
+        touched, elapsed = await db.run(process_decayall)
+        await message.channel.send("Decayed " + str(touched) + " point buckets by " + str(DECAY_PERCENT) + "% in "
+                                   + str(round(elapsed, 2)) + " seconds.")
         return
     except Exception as e:
-        logger.error("Unable to process decay because " + str(e))
+        logger.error("Unable to process decay because %s", e)
         logger.error(traceback.format_exc())
-        session.rollback()
         await send_dm(message.author.id, content="Failed to execute decay because " + str(e))
-    finally:
-        session.close()
 
 
 def process_decayall(session):
+    started = time.perf_counter()
+    touched = 0
     for team in session.query(Team).all():
         for tier_tuple in ActiveRaidTiers:
             try:
-                buckets = session.query(UserPointBucket).filter(
-                    UserPointBucket.team == team,
-                    UserPointBucket.raid_tier == tier_tuple.tier).all()
-                for user_bucket in buckets:
-                    user_bucket.decay_points(session=session, percent_decay=DECAY_PERCENT)
+                touched += UserPointBucket.bulk_decay(session=session, team=team, raid_tier=tier_tuple.tier,
+                                                      percent_decay=DECAY_PERCENT)
             except Exception as e:
-                logger.error("Failed to process decay for " + str(team.name) + " tier " + str(tier_tuple.name))
+                logger.error("Failed to process decay for %s tier %s", team.name, tier_tuple.name)
                 raise e
     session.commit()
-    return
+    elapsed = time.perf_counter() - started
+    logger.info("Decayed %s buckets in %s seconds", touched, round(elapsed, 3))
+    return touched, elapsed
 
 
 async def handle_help(message):
@@ -1548,12 +1731,35 @@ async def handle_help(message):
     return
 
 
+async def handle_stats(message):
+    # arg.stats or arg.stats components
+    logger.info("Handling a stats request")
+    try:
+        if parse_message_args(message.content)[1:2] == ['components']:
+            await message.channel.send("```\n" + instruments.components()[:1900] + "\n```")
+            return
+        _dispatch_stats = dispatcher.stats()
+        _footer = ("Loop lag max " + str(round(db.loop_lag['max'] * 1000)) + "ms, "
+                   + str(_dispatch_stats['in_flight']) + " commands in flight, "
+                   + str(_dispatch_stats['rejected']) + " rejected, "
+                   + str(_dispatch_stats['failed']) + " failed, "
+                   + str(instruments.queries) + " queries, "
+                   + str(sum(instruments.api_routes.values())) + " Discord API calls")
+        await message.channel.send("```\n" + instruments.summary() + "\n```" + _footer)
+        instruments.dump()
+    except Exception as e:
+        logger.error("Unable to report stats because %s", e)
+        logger.error(traceback.format_exc())
+        await send_dm(message.author.id, content="Failed to report stats because " + str(e))
+
+
 COMMAND_MAP = {
     'arg.decay': {
         'handler': handle_decay,
         'description': "Apply decay to all groups",
         'example': "arg.decay",
-        'required_role': GM_ROLE_NAME
+        'required_role': GM_ROLE_NAME,
+        'max_concurrency': 1
     },
     'arg.drop.award': {
         'handler': handle_dropaward,
@@ -1579,6 +1785,12 @@ COMMAND_MAP = {
         'example': "arg.item ItemName",
         'required_role': EVERYONE_ROLE_NAME
     },
+    'arg.user.audit': {
+        'handler': handle_useraudit,
+        'description': "DM a page through a user's EP or GP ledger, or their full history as a CSV file",
+        'example': "arg.user.audit @User TeamName BWL GP or arg.user.audit @User TeamName csv",
+        'required_role': GM_ROLE_NAME
+    },
     'arg.user.ep': {
         'handler': handle_usergrant,
         'description': "Give a single user an amount of EP",
@@ -1594,8 +1806,9 @@ COMMAND_MAP = {
     'arg.pr': {
         'handler': handle_prwhisper,
         'description': "Send the user an overview of the team's PR lists",
-        'example': "arg.pr TeamName",
-        'required_role': EVERYONE_ROLE_NAME
+        'example': "arg.pr TeamName, arg.pr TeamName 2026-03-14 21:00 or arg.pr TeamName drop DropId",
+        'required_role': EVERYONE_ROLE_NAME,
+        'max_concurrency': PR_COMMAND_CONCURRENCY
     },
     'arg.raids': {
         'handler': handle_raidshow,
@@ -1639,6 +1852,12 @@ COMMAND_MAP = {
         'example': "arg.register CharName Role Class",
         'required_role': EVERYONE_ROLE_NAME
     },
+    'arg.stats': {
+        'handler': handle_stats,
+        'description': "Show per-command timings, DB query counts and Discord API calls, or component counters",
+        'example': "arg.stats or arg.stats components",
+        'required_role': GM_ROLE_NAME
+    },
     'arg.team.assign': {
         'handler': handle_teamassign,
         'description': "Create or assign a character to a team",
@@ -1652,11 +1871,26 @@ COMMAND_MAP = {
         'required_role': EVERYONE_ROLE_NAME
     }
 }
+for _command, _entry in COMMAND_MAP.items():
+    _entry['handler'] = instruments.timed(_command)(_entry['handler'])
+dispatcher = CommandDispatcher(COMMAND_MAP)
+
+instruments.register('routes', message_routes.stats)
+instruments.register('renders', render_scheduler.stats)
+instruments.register('db pools', models.get_pool_stats)
+instruments.register('user contexts', user_contexts.stats)
+instruments.register('reactions', reaction_attacher.stats)
+instruments.register('emojis', emoji_registry.stats)
+instruments.register('item index', item_index.stats)
+instruments.register('audit pages', audit_pages.stats)
+instruments.register('loop lag', lambda: dict(db.loop_lag))
 
 if __name__ == "__main__":
-    logger.setLevel(10)  # https://docs.python.org/2/library/logging.html#levels
-
     logger.info("Starting Discord Client")
     worker.scheduler.start()
-    client.run(DISCORD_BOT_TOKEN)
+    try:
+        client.run(DISCORD_BOT_TOKEN)
+    finally:
+        # client.run has already cancelled any reward jobs still running on the loop
+        worker.scheduler.shutdown(wait=False)
     logger.info("Client ran")
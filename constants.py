@@ -8,3 +8,49 @@ MISFIRE_GRACE_SECONDS = 60 * 60 * 4     # 4 hours
 ITEM_LOAD_BATCH_SIZE = 100
 DECAY_PERCENT = 10
 BASE_GP = 100
+EMBED_RENDER_WINDOW_SECONDS = 1.5
+EMBED_MESSAGE_CACHE_SIZE = 256
+DB_EXECUTOR_WORKERS = 4
+DB_LATENCY_BUDGET_MS = 250
+LOOP_LAG_CHECK_SECONDS = 1
+DB_POOL_SIZE = 10
+DB_MAX_OVERFLOW = 5
+DB_POOL_TIMEOUT_SECONDS = 30
+DB_POOL_RECYCLE_SECONDS = 1800
+DB_STATEMENT_TIMEOUT_MS = 30000
+JOBSTORE_POOL_SIZE = 3
+JOBSTORE_MAX_OVERFLOW = 2
+ITEM_LOAD_CONCURRENCY = 16
+ITEM_LOAD_CHECKPOINT_FILE = 'data/.item_load_checkpoint'
+BLIZZARD_API_URL = 'https://us.api.blizzard.com'
+BLIZZARD_OAUTH_URL = 'https://us.battle.net/oauth/token'
+BLIZZARD_CACHE_PATH = 'data/.blizzard_cache.sqlite'
+BLIZZARD_CACHE_TTL_SECONDS = 60 * 60 * 24 * 30     # 30 days
+ITEM_SNAPSHOT_FILE = 'data/item_catalog.jsonl.gz'
+ITEM_SEARCH_LIMIT = 10
+ITEM_SEARCH_FUZZY_THRESHOLD = 0.45
+ITEM_INDEX_REFRESH_SECONDS = 60
+USER_CONTEXT_TTL_SECONDS = 300
+REACTION_PACE_SECONDS = 0.25
+LOG_FORMAT = '%(asctime)-15s %(message)s'
+LOG_LEVEL_DEFAULT = 'INFO'
+COMMAND_DEFAULT_CONCURRENCY = 4
+COMMAND_MAX_QUEUED = 20
+PR_COMMAND_CONCURRENCY = 2
+ROLE_CACHE_TTL_SECONDS = 60
+COMMAND_LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+N_PLUS_ONE_THRESHOLD = 10
+STATS_TOP_N = 15
+STATS_DUMP_SECONDS = 60 * 15
+MEMORY_JOBSTORE = 'memory'
+SCHEDULER_MODE_ASYNCIO = 'asyncio'
+SCHEDULER_MODE_BACKGROUND = 'background'
+SCHEDULER_MODE_DEFAULT = SCHEDULER_MODE_ASYNCIO
+LEDGER_CHECKPOINT_HOURS = 24
+LEDGER_CHECKPOINT_SETTLE_SECONDS = 60
+LEDGER_CHECKPOINT_BATCH_SIZE = 1000
+AUDIT_PAGE_SIZE = 15
+AUDIT_VIEW_CAPACITY = 200
+AUDIT_EXPORT_BATCH_SIZE = 1000
+AUDIT_NEWER_EMOJI = '\u25c0'   # Black left-pointing triangle
+AUDIT_OLDER_EMOJI = '\u25b6'   # Black right-pointing triangle
@@ -4,17 +4,16 @@ import models
 import constants
 import traceback
 
+from lib import logs
 from lib.helpers import *
 from models import UserPointBucket, Team
 
 import csv
 
-FORMAT = '%(asctime)-15s %(message)s'
-logging.basicConfig(format=FORMAT)
 logger = logging.getLogger('argbot.import')
 
 if __name__ == "__main__":
-    logger.setLevel(10)  # https://docs.python.org/2/library/logging.html#levels
+    logs.configure(default_level='DEBUG')
     db_session = models.Session()
 
     for team in db_session.query(Team).all():
@@ -31,7 +30,7 @@ if __name__ == "__main__":
 
                         user = search_user(db_session, row['Name'])
                         if user is None:
-                            logger.error("Couldn't find " + row['Name'] + "!")
+                            logger.error("Couldn't find %s!", row['Name'])
                             continue
                         else:
                             logger.info("Loading EP and GP values")
@@ -49,11 +48,11 @@ if __name__ == "__main__":
                                 .one()
                             ep_bucket.load_points(db_session, round(float(row['EP'])))
                             gp_bucket.load_points(db_session, round(float(row['GP'])))
-                            logger.info("Finished with row " + str(row))
+                            logger.info("Finished with row %s", row)
                     except Exception as e:
-                        logger.error("Unable to load row because " + str(e))
+                        logger.error("Unable to load row because %s", e)
                         logger.error(traceback.format_exc())
-                        logger.debug("Row: " + str(row))
+                        logger.debug("Row: %s", row)
                         raise
     db_session.commit()
     db_session.close()
@@ -0,0 +1,77 @@
+import io
+import csv
+import logging
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
+import models
+from constants import *
+
+logger = logging.getLogger('argbot.audit')
+
+CSV_COLUMNS = ('id', 'created_at', 'point_type', 'raid_tier', 'transaction_type', 'point_old_value', 'point_delta',
+               'point_new_value', 'raid_id', 'item_name')
+
+AuditView = namedtuple('AuditView', 'owner_id user_id display_name team_id team_name raid_tier tier_name point_type '
+                                    'newest oldest has_newer has_older')
+
+
+class AuditPages():
+    """Where each ledger audit message currently is, by message id, so navigation reactions can page from there.
+
+    Views hold only the (created_at, id) keys of the first and last entry shown. The oldest views are dropped past
+    `capacity`; remember returns the message ids it dropped so their routes can be unregistered too.
+    """
+
+    def __init__(self, capacity=AUDIT_VIEW_CAPACITY):
+        self.capacity = capacity
+        self._views = OrderedDict()
+        self._lock = threading.Lock()
+        self.pages = 0
+
+    def remember(self, message_id, view):
+        dropped = []
+        with self._lock:
+            self._views[message_id] = view
+            self._views.move_to_end(message_id)
+            self.pages += 1
+            while len(self._views) > self.capacity:
+                dropped.append(self._views.popitem(last=False)[0])
+        return dropped
+
+    def get(self, message_id):
+        return self._views.get(message_id)
+
+    def stats(self):
+        return {'views': len(self._views), 'pages': self.pages}
+
+
+def page_view(view, page):
+    """The view after moving to page, keyed on its first and last entries."""
+    if not page.entries:
+        return view._replace(has_newer=page.has_newer, has_older=page.has_older)
+    return view._replace(newest=(page.entries[0].created_at, page.entries[0].id),
+                         oldest=(page.entries[-1].created_at, page.entries[-1].id),
+                         has_newer=page.has_newer, has_older=page.has_older)
+
+
+def export_ledger_csv(session, user_id, team_id):
+    """Write a user's whole ledger history in a team to a temporary file as CSV and return it rewound.
+
+    Entries are streamed from the database straight into the file, which is deleted once closed.
+    """
+    export = tempfile.TemporaryFile()
+    writer_file = io.TextIOWrapper(export, encoding='utf-8', newline='')
+    writer = csv.writer(writer_file)
+    writer.writerow(CSV_COLUMNS)
+    rows = 0
+    for entry in models.iter_ledger_entries(session, user_id, team_id):
+        writer.writerow([entry.id, entry.created_at.isoformat(), entry.point_type.name, entry.raid_tier,
+                         entry.transaction_type.name, entry.point_old_value, entry.point_delta, entry.point_new_value,
+                         entry.raid_id, entry.item_name])
+        rows += 1
+    writer_file.flush()
+    writer_file.detach()
+    export.seek(0)
+    logger.info("Exported %s ledger entries for user %s in team %s", rows, user_id, team_id)
+    return export
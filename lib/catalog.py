@@ -0,0 +1,142 @@
+import gzip
+import json
+import hashlib
+import logging
+from datetime import datetime
+from models import Item, ItemClasses, ItemSubClass
+
+logger = logging.getLogger('argbot.catalog')
+
+SNAPSHOT_VERSION = 1
+SUBCLASS_FIELDS = ('item_class', 'subclass_id', 'name')
+ITEM_FIELDS = ('id', 'name', 'item_level', 'required_level', 'icon_url', 'item_class', 'item_subclass_id', 'quality',
+               'inventory_type', 'inventory_type_name', 'max_count')
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def _record(kind, row, fields):
+    record = {'kind': kind}
+    for field in fields:
+        value = getattr(row, field)
+        record[field] = value.name if isinstance(value, ItemClasses) else value
+    return json.dumps(record, sort_keys=True, separators=(',', ':'))
+
+
+def _mapping(record, fields):
+    mapping = {field: record.get(field) for field in fields}
+    mapping['item_class'] = ItemClasses[mapping['item_class']]
+    return mapping
+
+
+def export_snapshot(session, path):
+    """Write the item catalog to a gzip'd JSONL snapshot.
+
+    The first line is a header with the format version, record counts and a sha256 over every following line, which
+    read_snapshot checks before anything is written to the database.
+    """
+    lines = [_record('subclass', subclass, SUBCLASS_FIELDS)
+             for subclass in session.query(ItemSubClass).order_by(ItemSubClass.item_class, ItemSubClass.subclass_id)]
+    subclass_count = len(lines)
+    lines.extend(_record('item', item, ITEM_FIELDS) for item in session.query(Item).order_by(Item.id))
+
+    digest = hashlib.sha256()
+    for line in lines:
+        digest.update(line.encode('utf-8') + b'\n')
+    header = {'version': SNAPSHOT_VERSION, 'created_at': datetime.utcnow().isoformat(), 'subclasses': subclass_count,
+              'items': len(lines) - subclass_count, 'sha256': digest.hexdigest()}
+
+    with gzip.open(path, mode='wt', encoding='utf-8') as snapshot:
+        snapshot.write(json.dumps(header, sort_keys=True) + '\n')
+        for line in lines:
+            snapshot.write(line + '\n')
+    logger.info("Exported %s items and %s subclasses to %s", header['items'], subclass_count, path)
+    return header
+
+
+def read_snapshot(path):
+    """Read and verify a snapshot, returning (header, subclass mappings, item mappings)."""
+    digest = hashlib.sha256()
+    subclasses = []
+    items = []
+    with gzip.open(path, mode='rt', encoding='utf-8') as snapshot:
+        header = json.loads(snapshot.readline())
+        if header.get('version') != SNAPSHOT_VERSION:
+            raise SnapshotError("Unsupported snapshot version " + str(header.get('version')) + " in " + path)
+        for line in snapshot:
+            digest.update(line.encode('utf-8'))
+            record = json.loads(line)
+            if record['kind'] == 'subclass':
+                subclasses.append(_mapping(record, SUBCLASS_FIELDS))
+            elif record['kind'] == 'item':
+                items.append(_mapping(record, ITEM_FIELDS))
+            else:
+                raise SnapshotError("Unknown record kind " + str(record['kind']) + " in " + path)
+
+    if digest.hexdigest() != header['sha256']:
+        raise SnapshotError("Checksum mismatch for " + path + ", the snapshot is corrupt or was edited by hand")
+    if len(subclasses) != header['subclasses'] or len(items) != header['items']:
+        raise SnapshotError("Record counts in " + path + " don't match its header")
+    return header, subclasses, items
+
+
+def _changed(mapping, row, fields):
+    return any(getattr(row, field) != mapping[field] for field in fields)
+
+
+def import_snapshot(session, path, diff=False):
+    """Bulk load a snapshot into the catalog tables. Doesn't commit.
+
+    Without diff the tables are expected to be empty and every record is inserted with a single executemany per table.
+    With diff, existing rows are compared against the snapshot and only new or changed rows are written. Rows that are
+    missing from the snapshot are left alone, since item drops may still reference them.
+    """
+    header, subclasses, items = read_snapshot(path)
+    result = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+
+    if not diff:
+        if session.query(Item.id).first() is not None:
+            raise SnapshotError("Items already loaded, use diff mode to refresh from " + path)
+        existing = set(session.query(ItemSubClass.item_class, ItemSubClass.subclass_id).all())
+        new_subclasses = [mapping for mapping in subclasses
+                          if (mapping['item_class'], mapping['subclass_id']) not in existing]
+        if new_subclasses:
+            session.execute(ItemSubClass.__table__.insert(), new_subclasses)
+        if items:
+            session.execute(Item.__table__.insert(), items)
+        result['inserted'] = len(items)
+    else:
+        existing_subclasses = {(row.item_class, row.subclass_id): row for row in session.query(ItemSubClass)}
+        new_subclasses = []
+        for mapping in subclasses:
+            row = existing_subclasses.get((mapping['item_class'], mapping['subclass_id']))
+            if row is None:
+                new_subclasses.append(mapping)
+            elif _changed(mapping, row, SUBCLASS_FIELDS):
+                row.name = mapping['name']
+        if new_subclasses:
+            session.execute(ItemSubClass.__table__.insert(), new_subclasses)
+        session.flush()
+
+        existing_items = {row.id: row for row in session.query(Item)}
+        inserts = []
+        updates = []
+        for mapping in items:
+            row = existing_items.get(mapping['id'])
+            if row is None:
+                inserts.append(mapping)
+            elif _changed(mapping, row, ITEM_FIELDS):
+                updates.append(mapping)
+            else:
+                result['unchanged'] += 1
+        if inserts:
+            session.execute(Item.__table__.insert(), inserts)
+        if updates:
+            session.bulk_update_mappings(Item, updates)
+        result['inserted'] = len(inserts)
+        result['updated'] = len(updates)
+
+    logger.info("Imported snapshot %s from %s: %s", path, header['created_at'], result)
+    return result
@@ -0,0 +1,59 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import models
+from constants import *
+
+logger = logging.getLogger('argbot.db')
+
+executor = ThreadPoolExecutor(max_workers=int(os.environ.get('DB_EXECUTOR_WORKERS', DB_EXECUTOR_WORKERS)),
+                              thread_name_prefix='argbot-db')
+latency_budget = int(os.environ.get('DB_LATENCY_BUDGET_MS', DB_LATENCY_BUDGET_MS)) / 1000
+loop_lag = {'last': 0.0, 'max': 0.0, 'samples': 0, 'over_budget': 0}
+
+
+def _run_unit(unit, args, kwargs):
+    session = models.Session()
+    started = time.perf_counter()
+    try:
+        result = unit(session, *args, **kwargs)
+        session.commit()
+        return result
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+        elapsed = time.perf_counter() - started
+        if elapsed > latency_budget:
+            logger.warning("DB unit %s took %sms, over the %sms budget", getattr(unit, '__name__', str(unit)),
+                           round(elapsed * 1000), round(latency_budget * 1000))
+
+
+async def run(unit, *args, **kwargs):
+    """Run unit(session, *args, **kwargs) on the DB thread pool with its own session.
+
+    The session is committed when the unit returns and rolled back if it raises. Units must return plain values or
+    detached data, never live ORM objects, since the session is closed before control returns to the loop. The
+    caller's context variables are carried over, so the unit's queries count towards the calling handler's stats.
+    """
+    loop = asyncio.get_event_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(context.run, _run_unit, unit, args, kwargs))
+
+
+async def monitor_loop_lag(interval=LOOP_LAG_CHECK_SECONDS):
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = time.perf_counter() - started - interval
+        loop_lag['last'] = lag
+        loop_lag['max'] = max(loop_lag['max'], lag)
+        loop_lag['samples'] += 1
+        if lag > latency_budget:
+            loop_lag['over_budget'] += 1
+            logger.warning("Event loop lagged %sms behind schedule", round(lag * 1000))
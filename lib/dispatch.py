@@ -0,0 +1,125 @@
+import re
+import time
+import asyncio
+import bisect
+import logging
+from constants import *
+
+logger = logging.getLogger('argbot.dispatch')
+
+COMMAND_PATTERN = re.compile(r'^(arg\.[\w.]+)(?:\s|$)')
+
+
+class LatencyHistogram():
+    """Counts of observed latencies per bucket, bucket i holding values up to bounds[i] ms (the last is overflow)."""
+
+    def __init__(self, bounds=COMMAND_LATENCY_BUCKETS_MS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, elapsed_ms):
+        self.counts[bisect.bisect_left(self.bounds, elapsed_ms)] += 1
+        self.count += 1
+        self.total += elapsed_ms
+        self.max = max(self.max, elapsed_ms)
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of observations (None past the last bound)."""
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return self.bounds[index] if index < len(self.bounds) else None
+        return None
+
+    def stats(self):
+        buckets = dict(('<=' + str(bound), count) for bound, count in zip(self.bounds, self.counts))
+        buckets['>' + str(self.bounds[-1])] = self.counts[-1]
+        return {'count': self.count, 'mean_ms': round(self.total / self.count, 1) if self.count else None,
+                'max_ms': round(self.max, 1), 'p50_ms': self.percentile(0.5), 'p95_ms': self.percentile(0.95),
+                'buckets': buckets}
+
+
+class CommandDispatcher():
+    """Routes arg.* messages to their COMMAND_MAP handlers as tracked tasks.
+
+    Each command gets a semaphore sized by its 'max_concurrency' entry (default COMMAND_DEFAULT_CONCURRENCY). Once
+    COMMAND_MAX_QUEUED invocations are already waiting on it, further ones are turned away instead of piling up.
+    Member role names are cached for ROLE_CACHE_TTL_SECONDS, and handler latency is recorded per command.
+    """
+
+    def __init__(self, command_map, role_ttl=ROLE_CACHE_TTL_SECONDS, max_queued=COMMAND_MAX_QUEUED):
+        self.command_map = command_map
+        self.role_ttl = role_ttl
+        self.max_queued = max_queued
+        self._semaphores = dict((command, asyncio.Semaphore(entry.get('max_concurrency', COMMAND_DEFAULT_CONCURRENCY)))
+                                for command, entry in command_map.items())
+        self._waiting = dict((command, 0) for command in command_map)
+        self._roles = {}
+        self._tasks = set()
+        self.histograms = dict((command, LatencyHistogram()) for command in command_map)
+        self.rejected = 0
+        self.failed = 0
+
+    def parse(self, content):
+        match = COMMAND_PATTERN.match(content)
+        return match.group(1) if match else None
+
+    def member_roles(self, member):
+        cached = self._roles.get(member.id)
+        now = time.monotonic()
+        if cached is None or now - cached[0] > self.role_ttl:
+            cached = (now, frozenset(role.name for role in getattr(member, 'roles', ())))
+            self._roles[member.id] = cached
+        return cached[1]
+
+    def forget_member(self, member_id):
+        self._roles.pop(member_id, None)
+
+    async def dispatch(self, message):
+        command = self.parse(message.content)
+        entry = self.command_map.get(command)
+        if entry is None:
+            logger.debug("No command found for %s", command)
+            await message.channel.send('Command Not Found, try arg.help for usage information')
+            return None
+        if entry['required_role'] not in self.member_roles(message.author):
+            await message.channel.send("Access Denied: You do not possess the role required for that command.")
+            return None
+        if self._waiting[command] >= self.max_queued:
+            self.rejected += 1
+            logger.warning("Rejecting %s from %s, %s already queued", command, message.author.id,
+                           self._waiting[command])
+            await message.channel.send("Too many " + command + " requests are already in progress, try again shortly.")
+            return None
+
+        self._waiting[command] += 1
+        task = asyncio.ensure_future(self._run(command, entry['handler'], message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, command, handler, message):
+        semaphore = self._semaphores[command]
+        try:
+            await semaphore.acquire()
+        finally:
+            self._waiting[command] -= 1
+        started = time.perf_counter()
+        try:
+            await handler(message)
+        except Exception as e:
+            self.failed += 1
+            logger.exception("Unhandled error in %s: %s", command, e)
+        finally:
+            semaphore.release()
+            self.histograms[command].observe((time.perf_counter() - started) * 1000)
+
+    def stats(self):
+        return {'in_flight': len(self._tasks), 'rejected': self.rejected, 'failed': self.failed,
+                'commands': dict((command, histogram.stats()) for command, histogram in self.histograms.items()
+                                 if histogram.count)}
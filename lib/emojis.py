@@ -0,0 +1,83 @@
+import logging
+import threading
+
+logger = logging.getLogger('argbot.emojis')
+
+BID_EMOJI_NAMES = ('bid_100', 'bid_25', 'bid_0')
+
+
+class EmojiRegistry():
+    """Two-way map of the guild's custom emojis (name <-> id), plus which specs each signup emoji stands for."""
+
+    def __init__(self):
+        self._ids_by_name = {}
+        self._names_by_id = {}
+        self._spec_ids_by_emoji_id = {}
+        self._signup_names = []
+        self._lock = threading.Lock()
+
+    def register(self, emoji_name, emoji_id, spec_ids=None):
+        with self._lock:
+            previous_id = self._ids_by_name.get(emoji_name)
+            if previous_id is not None and previous_id != emoji_id:
+                self._names_by_id.pop(previous_id, None)
+                self._spec_ids_by_emoji_id.pop(previous_id, None)
+            self._ids_by_name[emoji_name] = emoji_id
+            self._names_by_id[emoji_id] = emoji_name
+            if spec_ids:
+                self._spec_ids_by_emoji_id[emoji_id] = tuple(spec_ids)
+        logger.debug("Registered emoji %s:%s", emoji_name, emoji_id)
+
+    def load(self, emojis, specs):
+        """Rebuild from the guild's emojis and Spec rows, returning the Specs whose emoticon_id changed."""
+        specs_by_name = {}
+        for spec in specs:
+            specs_by_name.setdefault(spec.emoticon_name, []).append(spec)
+
+        with self._lock:
+            self._ids_by_name = {}
+            self._names_by_id = {}
+            self._spec_ids_by_emoji_id = {}
+            self._signup_names = []
+        changed = []
+        for emoji in emojis:
+            emoji_specs = specs_by_name.get(emoji.name)
+            if emoji_specs:
+                for spec in emoji_specs:
+                    if spec.emoticon_id != emoji.id:
+                        spec.emoticon_id = emoji.id
+                        changed.append(spec)
+                self.register(emoji.name, emoji.id, spec_ids=[spec.id for spec in emoji_specs])
+            elif emoji.name in BID_EMOJI_NAMES:
+                self.register(emoji.name, emoji.id)
+            else:
+                logger.info("Couldn't register emoji: %s:%s", emoji.name, emoji.id)
+        # Signup reactions go on in spec order, each emoji once even when several specs share it
+        for spec in sorted(specs, key=lambda spec: spec.id):
+            if spec.emoticon_name in self._ids_by_name and spec.emoticon_name not in self._signup_names:
+                self._signup_names.append(spec.emoticon_name)
+        missing = [name for name in list(specs_by_name) + list(BID_EMOJI_NAMES) if name not in self._ids_by_name]
+        if missing:
+            logger.warning("Guild is missing custom emojis: %s", ', '.join(str(name) for name in missing))
+        return changed
+
+    def name_for(self, emoji_id):
+        return self._names_by_id.get(emoji_id)
+
+    def id_for(self, emoji_name):
+        return self._ids_by_name.get(emoji_name)
+
+    def spec_ids_for(self, emoji_id):
+        return self._spec_ids_by_emoji_id.get(emoji_id, ())
+
+    def reaction_string(self, emoji_name):
+        return '<' + emoji_name + ':' + str(self._ids_by_name[emoji_name]) + '>'
+
+    def signup_reactions(self):
+        return [self.reaction_string(emoji_name) for emoji_name in self._signup_names]
+
+    def bid_reactions(self):
+        return [self.reaction_string(emoji_name) for emoji_name in BID_EMOJI_NAMES if emoji_name in self._ids_by_name]
+
+    def stats(self):
+        return {'emojis': len(self._ids_by_name), 'spec_emojis': len(self._spec_ids_by_emoji_id)}
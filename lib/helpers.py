@@ -4,7 +4,7 @@ import models
 import worker
 import datetime
 from models import ActiveRaidTiers, CharacterRoles, CharacterClass, Spec, Character, Team, Raid, Item, User, RaidZone, \
-    Signup, PointTypes, UserPointBucket, ItemDrop, ItemDropBid, Bids
+    Signup, PointTypes, UserPointBucket, ItemDrop, ItemDropBid
 
 logger = logging.getLogger('argbot.helpers')
 
@@ -29,7 +29,7 @@ def stringify_bids(bid_pr_list):
     string = ""
     if bid_pr_list:
         for bidder in bid_pr_list:
-            logger.debug("Bidder is " + str(bidder[0]))
+            logger.debug("Bidder is %s", bidder[0])
             string += bidder[0].character.name + " (" + str(bidder[1]) + ")\r\n"
     else:
         string = "** **"  # Closest to &nbsp in Discord markup
@@ -41,7 +41,7 @@ def search_user(session, search_param):
     if search_param.startswith('<@!'):
         logger.debug("Search search_param looks like a mention, lets parse it")
         _search_param_id = search_param.split('!')[1].replace('>', '')
-        logger.debug("Searching for user ID =" + str(int(_search_param_id)))
+        logger.debug("Searching for user ID =%s", int(_search_param_id))
         _user = session.query(User).filter(User.id == int(_search_param_id)).one_or_none()
     else:
         logger.info("Didn't find tag format for @user, searching by raw name instead")
@@ -62,7 +62,7 @@ def search_user(session, search_param):
 
 
 def paint_time(dt):
-    if isinstance(dt, datetime):
+    if isinstance(dt, datetime.datetime):
         return dt.strftime("%B %d %Y %I:%M %p")
     else:
         raise TypeError
@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from email.utils import formatdate
+from constants import *
+
+logger = logging.getLogger('argbot.http_cache')
+
+# Static game data is stable, so 404s are cached alongside successful lookups
+CACHEABLE_STATUS = (200, 404)
+STATUS_NOT_CACHED = 504
+
+
+class CachedResponse():
+    """Just enough of requests.Response for the loader: status_code, text, json() and headers."""
+
+    def __init__(self, status_code, text, headers=None, from_cache=True):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+        self.from_cache = from_cache
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class ResponseCache():
+    """Persistent SQLite store of API responses keyed by full URL (which includes the namespace and locale).
+
+    Entries younger than `ttl` seconds are served without touching the network. Older entries are revalidated with
+    If-None-Match/If-Modified-Since, and a 304 just refreshes the entry. In offline mode only the cache is consulted,
+    regardless of age, and a miss comes back as a 504.
+    """
+
+    def __init__(self, path, ttl, offline=False):
+        self.path = path
+        self.ttl = ttl
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS responses ("
+                           "url TEXT PRIMARY KEY, status INTEGER NOT NULL, body TEXT NOT NULL, "
+                           "etag TEXT, last_modified TEXT, fetched_at REAL NOT NULL)")
+        self._conn.commit()
+
+    def get(self, url):
+        with self._lock:
+            return self._conn.execute("SELECT status, body, etag, last_modified, fetched_at FROM responses "
+                                      "WHERE url = ?", (url,)).fetchone()
+
+    def put(self, url, status, body, etag=None, last_modified=None):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses (url, status, body, etag, last_modified, fetched_at) "
+                               "VALUES (?, ?, ?, ?, ?, ?)", (url, status, body, etag, last_modified, time.time()))
+            self._conn.commit()
+
+    def touch(self, url):
+        with self._lock:
+            self._conn.execute("UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), url))
+            self._conn.commit()
+
+    def fetch(self, url, getter):
+        """Return the response for url, calling getter(url, headers) only when the cache can't answer."""
+        entry = self.get(url)
+        if entry is not None:
+            status, body, etag, last_modified, fetched_at = entry
+            if self.offline or time.time() - fetched_at < self.ttl:
+                self.hits += 1
+                return CachedResponse(status, body)
+        if self.offline:
+            self.misses += 1
+            logger.warning("Offline mode and no cached response for %s", url)
+            return CachedResponse(STATUS_NOT_CACHED, '', from_cache=False)
+
+        headers = {}
+        if entry is not None:
+            if etag:
+                headers['If-None-Match'] = etag
+            headers['If-Modified-Since'] = last_modified or formatdate(fetched_at, usegmt=True)
+        response = getter(url, headers)
+        if response.status_code == 304 and entry is not None:
+            self.revalidated += 1
+            self.touch(url)
+            return CachedResponse(status, body)
+
+        self.misses += 1
+        if response.status_code in CACHEABLE_STATUS:
+            self.put(url, response.status_code, response.text,
+                     response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return response
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT count(*) FROM responses").fetchone()[0]
+        return {'entries': entries, 'hits': self.hits, 'misses': self.misses, 'revalidated': self.revalidated}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def from_env():
+    """Build the cache from BLIZZARD_CACHE_* settings, or return None when BLIZZARD_CACHE is FALSE."""
+    if os.environ.get('BLIZZARD_CACHE', 'TRUE') == 'FALSE':
+        return None
+    return ResponseCache(os.environ.get('BLIZZARD_CACHE_PATH', BLIZZARD_CACHE_PATH),
+                         int(os.environ.get('BLIZZARD_CACHE_TTL_SECONDS', BLIZZARD_CACHE_TTL_SECONDS)),
+                         offline=os.environ.get('BLIZZARD_OFFLINE') == 'TRUE')
@@ -0,0 +1,215 @@
+import time
+import asyncio
+import logging
+import functools
+import threading
+import contextvars
+from collections import Counter
+from sqlalchemy import event
+from constants import *
+
+logger = logging.getLogger('argbot.instrument')
+
+_current = contextvars.ContextVar('argbot_invocation', default=None)
+
+
+class Invocation():
+    def __init__(self, name):
+        self.name = name
+        self.queries = 0
+        self.db_time = 0.0
+        self.api_calls = 0
+        self.statements = Counter()
+
+
+class InvocationStats():
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.wall_total = 0.0
+        self.wall_max = 0.0
+        self.queries = 0
+        self.queries_max = 0
+        self.db_time = 0.0
+        self.api_calls = 0
+        self.n_plus_one = 0
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'wall_avg_ms': round(self.wall_total / self.calls * 1000, 1) if self.calls else 0,
+            'wall_max_ms': round(self.wall_max * 1000, 1),
+            'queries_avg': round(self.queries / self.calls, 1) if self.calls else 0,
+            'queries_max': self.queries_max,
+            'db_avg_ms': round(self.db_time / self.calls * 1000, 1) if self.calls else 0,
+            'api_calls': self.api_calls,
+            'n_plus_one': self.n_plus_one
+        }
+
+
+class Instrumentation():
+    """Per-invocation wall time, DB query count/time and Discord API calls for handlers and jobs.
+
+    timed(name) wraps a sync or async callable so each call runs as an Invocation. Queries are attributed through a
+    context variable, so work handed to lib.db.run or other tasks started from the handler still counts towards it.
+    Any invocation repeating one statement more than `repeat_threshold` times is flagged as a likely N+1.
+    Components register their stats() with register() to be reported alongside in components() and dump().
+    """
+
+    def __init__(self, repeat_threshold=N_PLUS_ONE_THRESHOLD):
+        self.repeat_threshold = repeat_threshold
+        self._stats = {}
+        self._lock = threading.Lock()
+        self.api_routes = Counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self._sources = {}
+
+    def register(self, name, stats):
+        """Report `stats`, a callable returning a dict of counters, as component `name`."""
+        self._sources[name] = stats
+
+    def sources(self):
+        values = {}
+        for name, stats in self._sources.items():
+            try:
+                values[name] = stats()
+            except Exception as e:
+                logger.warning("Unable to read stats for %s because %s", name, e)
+        return values
+
+    def listen(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Kept on the statement's own context, so a statement that raises leaves nothing behind on the connection
+        context._query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_started
+        invocation = _current.get()
+        # Statements run on lib.db.run executor threads, so the counters are shared between threads
+        with self._lock:
+            self.queries += 1
+            self.db_time += elapsed
+            if invocation is not None:
+                invocation.queries += 1
+                invocation.db_time += elapsed
+                invocation.statements[statement] += 1
+
+    def wrap_http(self, http):
+        """Count every request made through a discord.py HTTPClient, by route and against the current invocation."""
+        request = http.request
+
+        @functools.wraps(request)
+        async def counted_request(route, **kwargs):
+            self.api_routes[route.method + ' ' + route.path] += 1
+            invocation = _current.get()
+            if invocation is not None:
+                invocation.api_calls += 1
+            return await request(route, **kwargs)
+
+        http.request = counted_request
+
+    def timed(self, name):
+        def decorator(func):
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    invocation, token, started = self._start(name)
+                    failed = True
+                    try:
+                        result = await func(*args, **kwargs)
+                        failed = False
+                        return result
+                    finally:
+                        self._finish(invocation, token, started, failed)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                invocation, token, started = self._start(name)
+                failed = True
+                try:
+                    result = func(*args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    self._finish(invocation, token, started, failed)
+            return wrapper
+        return decorator
+
+    def _start(self, name):
+        invocation = Invocation(name)
+        return invocation, _current.set(invocation), time.perf_counter()
+
+    def _finish(self, invocation, token, started, failed):
+        elapsed = time.perf_counter() - started
+        _current.reset(token)
+        repeated = invocation.statements.most_common(1)
+        repeated = repeated[0] if repeated and repeated[0][1] > self.repeat_threshold else None
+        with self._lock:
+            stats = self._stats.setdefault(invocation.name, InvocationStats())
+            stats.calls += 1
+            stats.errors += failed
+            stats.wall_total += elapsed
+            stats.wall_max = max(stats.wall_max, elapsed)
+            stats.queries += invocation.queries
+            stats.queries_max = max(stats.queries_max, invocation.queries)
+            stats.db_time += invocation.db_time
+            stats.api_calls += invocation.api_calls
+            if repeated:
+                stats.n_plus_one += 1
+        if repeated:
+            logger.warning("Possible N+1 in %s: statement ran %s times: %s", invocation.name, repeated[1],
+                           ' '.join(repeated[0].split())[:200])
+        logger.debug("%s took %sms with %s queries (%sms) and %s API calls", invocation.name, round(elapsed * 1000),
+                     invocation.queries, round(invocation.db_time * 1000), invocation.api_calls)
+
+    def stats(self):
+        with self._lock:
+            return dict((name, stats.as_dict()) for name, stats in self._stats.items())
+
+    def summary(self, limit=STATS_TOP_N):
+        """Fixed width table of the invocations with the most total wall time."""
+        rows = sorted(self._stats.items(), key=lambda item: item[1].wall_total, reverse=True)[:limit]
+        lines = ["{:<20} {:>6} {:>8} {:>8} {:>6} {:>7} {:>5} {:>4}".format(
+            'name', 'calls', 'avg ms', 'max ms', 'q avg', 'db ms', 'api', 'n+1')]
+        for name, stats in rows:
+            values = stats.as_dict()
+            lines.append("{:<20} {:>6} {:>8} {:>8} {:>6} {:>7} {:>5} {:>4}".format(
+                name[:20], values['calls'], values['wall_avg_ms'], values['wall_max_ms'], values['queries_avg'],
+                values['db_avg_ms'], values['api_calls'], values['n_plus_one']))
+        return '\n'.join(lines)
+
+    def components(self):
+        """One line of counters per registered component, nested dicts (e.g. one per pool) on lines of their own."""
+        lines = []
+        for name, values in sorted(self.sources().items()):
+            lines.extend(_component_lines(name, values))
+        return '\n'.join(lines)
+
+    def dump(self):
+        for name, values in sorted(self.stats().items()):
+            logger.info("Stats for %s", name, extra={'fields': values})
+        for name, values in sorted(self.sources().items()):
+            logger.info("Stats for component %s", name, extra={'fields': values})
+        logger.info("Totals", extra={'fields': {'queries': self.queries, 'db_ms': round(self.db_time * 1000),
+                                                'api_calls': sum(self.api_routes.values())}})
+
+    async def dump_periodically(self, interval=STATS_DUMP_SECONDS):
+        while True:
+            await asyncio.sleep(interval)
+            self.dump()
+
+
+def _component_lines(name, values):
+    counters = ', '.join(str(key) + '=' + str(value) for key, value in sorted(values.items())
+                         if not isinstance(value, dict))
+    lines = [name + ': ' + counters] if counters else []
+    for key, value in sorted(values.items()):
+        if isinstance(value, dict):
+            lines.extend(_component_lines(name + ' ' + str(key), value))
+    return lines
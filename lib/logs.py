@@ -0,0 +1,58 @@
+import os
+import atexit
+import logging
+import logging.handlers
+import queue
+from constants import *
+
+_listener = None
+
+
+class FieldsFormatter(logging.Formatter):
+    """Appends structured fields passed as extra={'fields': {...}} to the message as key=value pairs."""
+
+    def format(self, record):
+        message = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            message += ' ' + ' '.join(str(key) + '=' + str(value) for key, value in fields.items())
+        return message
+
+
+def parse_levels(spec):
+    """Parse LOG_LEVELS style "argbot.db=DEBUG,argbot.render=WARNING" into {logger name: level}."""
+    levels = {}
+    for entry in (spec or '').split(','):
+        if '=' in entry:
+            name, level = entry.split('=', 1)
+            levels[name.strip()] = logging.getLevelName(level.strip().upper())
+    return levels
+
+
+def configure(default_level=None):
+    """Route all logging through a queue so handlers (and their I/O) run on a listener thread, not the event loop.
+
+    The argbot logger level comes from LOG_LEVEL (default LOG_LEVEL_DEFAULT), and LOG_LEVELS overrides individual
+    modules. Calling this more than once is a no-op.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(FieldsFormatter(LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    logging.getLogger('argbot').setLevel(
+        logging.getLevelName(os.environ.get('LOG_LEVEL', default_level or LOG_LEVEL_DEFAULT).upper()))
+    for name, level in parse_levels(os.environ.get('LOG_LEVELS')).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
@@ -0,0 +1,56 @@
+import time
+import asyncio
+import logging
+from constants import *
+
+logger = logging.getLogger('argbot.reactions')
+
+
+class ReactionAttacher():
+    """Attaches a fixed set of reactions to freshly posted messages in the background.
+
+    Each add_reaction is started `pace` seconds after the previous one instead of after it completes, which keeps the
+    requests inside Discord's reaction rate limit while overlapping their round trips, and keeps the order users
+    see. Time-to-ready (send to last reaction attached) is logged and kept for stats.
+    """
+
+    def __init__(self, pace=REACTION_PACE_SECONDS):
+        self.pace = pace
+        self._tasks = set()
+        self.attached = 0
+        self.failed = 0
+        self.last_ready = None
+        self.max_ready = 0.0
+
+    def attach(self, message, reactions, label, sent_at=None):
+        """Start attaching reactions to message, returning the task. sent_at (perf_counter) defaults to now."""
+        task = asyncio.ensure_future(self._attach(message, list(reactions), label, sent_at or time.perf_counter()))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _attach(self, message, reactions, label, sent_at):
+        started = time.perf_counter()
+        results = await asyncio.gather(*[self._add(message, reaction, index * self.pace)
+                                         for index, reaction in enumerate(reactions)], return_exceptions=True)
+        failures = [result for result in results if isinstance(result, Exception)]
+        self.attached += len(results) - len(failures)
+        self.failed += len(failures)
+        ready = time.perf_counter() - sent_at
+        self.last_ready = ready
+        self.max_ready = max(self.max_ready, ready)
+        if failures:
+            logger.error("Failed to attach %s of %s reactions to %s message %s: %s", len(failures), len(reactions),
+                         label, message.id, failures[0])
+        logger.info("%s message %s ready for reactions %ss after sending (%s reactions in %ss)", label, message.id,
+                    round(ready, 2), len(reactions), round(time.perf_counter() - started, 2))
+        return ready
+
+    async def _add(self, message, reaction, delay):
+        if delay:
+            await asyncio.sleep(delay)
+        await message.add_reaction(reaction)
+
+    def stats(self):
+        return {'pending': len(self._tasks), 'attached': self.attached, 'failed': self.failed,
+                'last_ready': self.last_ready, 'max_ready': self.max_ready}
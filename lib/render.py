@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import traceback
+from collections import OrderedDict
+from lib import db
+from constants import *
+
+logger = logging.getLogger('argbot.render')
+
+
+class EmbedRenderScheduler():
+    """Coalesces bursts of re-render requests for a message into one render and edit per window.
+
+    Only the most recent render request for a message is kept, so whatever is published reflects the latest state.
+    Messages are cached after the first fetch (or when handed over via remember) so edits skip fetch_message.
+    Each render is a DB unit taking a session and is handed to run (db.run by default), so only the fetch and the
+    edit happen on the loop.
+    """
+
+    def __init__(self, client, window=EMBED_RENDER_WINDOW_SECONDS, cache_size=EMBED_MESSAGE_CACHE_SIZE, run=db.run):
+        self.client = client
+        self.window = window
+        self.cache_size = cache_size
+        self.run = run
+        self._pending = {}
+        self._tasks = {}
+        self._messages = OrderedDict()
+        self.requested = 0
+        self.coalesced = 0
+        self.emitted = 0
+        self.failed = 0
+
+    def remember(self, message):
+        self._messages[message.id] = message
+        self._messages.move_to_end(message.id)
+        while len(self._messages) > self.cache_size:
+            self._messages.popitem(last=False)
+
+    def forget(self, message_id):
+        self._messages.pop(message_id, None)
+
+    async def get_message(self, channel_id, message_id):
+        message = self._messages.get(message_id)
+        if message is None:
+            message = await self.client.get_channel(channel_id).fetch_message(message_id)
+            self.remember(message)
+        return message
+
+    def schedule(self, channel_id, message_id, render, failure_notice=None):
+        self.requested += 1
+        if message_id in self._pending:
+            self.coalesced += 1
+        self._pending[message_id] = (channel_id, render, failure_notice)
+        if message_id not in self._tasks:
+            self._tasks[message_id] = asyncio.ensure_future(self._run(message_id))
+
+    async def _run(self, message_id):
+        try:
+            while message_id in self._pending:
+                await asyncio.sleep(self.window)
+                channel_id, render, failure_notice = self._pending.pop(message_id)
+                try:
+                    embed = await self.run(render)
+                    message = await self.get_message(channel_id, message_id)
+                    await message.edit(embed=embed)
+                    self.emitted += 1
+                except Exception as e:
+                    self.failed += 1
+                    self.forget(message_id)
+                    logger.error("Failed to re-render message %s because %s", message_id, e)
+                    logger.error(traceback.format_exc())
+                    if failure_notice:
+                        await self.client.get_channel(channel_id).send(failure_notice)
+        finally:
+            self._tasks.pop(message_id, None)
+
+    def stats(self):
+        return {'requested': self.requested, 'coalesced': self.coalesced, 'emitted': self.emitted,
+                'failed': self.failed, 'pending': len(self._pending)}
@@ -0,0 +1,76 @@
+import logging
+import threading
+from sqlalchemy import event
+from models import Raid, ItemDrop
+
+logger = logging.getLogger('argbot.routing')
+
+ROUTE_RAID = 'raid'
+ROUTE_DROP = 'drop'
+ROUTE_AUDIT = 'audit'
+
+
+class MessageRoutes():
+    """In-process map of message_id -> (kind, entity id) so unrelated reactions never touch the database.
+
+    Once listening on a session factory, the routes of raids that close and drops that are awarded (or of either being
+    deleted) are dropped as the change is flushed, so the map only holds messages that can still take reactions.
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def register(self, message_id, kind, entity_id):
+        if message_id is None:
+            return
+        with self._lock:
+            self._routes[message_id] = (kind, entity_id)
+        logger.debug("Registered route for message %s to %s %s", message_id, kind, entity_id)
+
+    def unregister(self, message_id):
+        with self._lock:
+            self._routes.pop(message_id, None)
+
+    def lookup(self, message_id):
+        route = self._routes.get(message_id)
+        if route is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return route
+
+    def listen(self, session_factory):
+        event.listen(session_factory, 'after_flush', self._after_flush)
+
+    def _after_flush(self, session, flush_context):
+        deleted = set(session.deleted)
+        for instance in list(session.dirty) + list(deleted):
+            if isinstance(instance, Raid) and (instance.is_closed or instance in deleted):
+                self.unregister(instance.signup_message_id)
+            elif isinstance(instance, ItemDrop) and (instance.is_awarded or instance in deleted):
+                self.unregister(instance.bid_message_id)
+
+    def warm(self, session):
+        routes = {}
+        for raid_id, message_id in session.query(Raid.id, Raid.signup_message_id) \
+                .filter(Raid.is_closed == False, Raid.signup_message_id != None) \
+                .all():
+            routes[message_id] = (ROUTE_RAID, raid_id)
+        for drop_id, message_id in session.query(ItemDrop.id, ItemDrop.bid_message_id) \
+                .filter(ItemDrop.is_awarded == False, ItemDrop.bid_message_id != None) \
+                .all():
+            routes[message_id] = (ROUTE_DROP, drop_id)
+        warmed = len(routes)
+        with self._lock:
+            # Audit views live only in memory, so keep their routes across a re-warm after reconnecting
+            routes.update((message_id, route) for message_id, route in self._routes.items()
+                          if route[0] == ROUTE_AUDIT)
+            self._routes = routes
+        logger.info("Warmed message routes with %s raid and drop messages", warmed)
+        return warmed
+
+    def stats(self):
+        return {'routes': len(self._routes), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,165 @@
+import re
+import math
+import time
+import heapq
+import logging
+import threading
+import unicodedata
+from collections import namedtuple
+from models import Item
+from constants import *
+
+logger = logging.getLogger('argbot.search')
+
+MATCH_EXACT = 0
+MATCH_PREFIX = 1
+MATCH_SUBSTRING = 2
+MATCH_FUZZY = 3
+
+ItemMatch = namedtuple('ItemMatch', 'item_id name match score')
+
+
+def normalize(name):
+    """Lowercase, strip accents and punctuation and collapse whitespace: "Bonereaver's  Edge" -> "bonereavers edge"."""
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii').lower()
+    return ' '.join(re.sub(r"[^a-z0-9 ]+", '', name.replace('-', ' ')).split())
+
+
+def trigrams(normalized):
+    padded = '  ' + normalized + ' '
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class ItemIndex():
+    """In-process trigram index over item names, so item lookups by name never scan the items table.
+
+    Matches are ranked exact, then prefix, then substring, with the closest and then shortest names first inside each
+    rank. Only when nothing contains the query are fuzzy matches (trigram dice similarity at or above
+    ITEM_SEARCH_FUZZY_THRESHOLD) returned instead.
+    """
+
+    def __init__(self):
+        self._items = {}
+        self._postings = {}
+        self._lock = threading.Lock()
+        self.refreshed_at = 0.0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item_id):
+        return item_id in self._items
+
+    def add(self, item_id, name):
+        normalized = normalize(name or '')
+        grams = trigrams(normalized)
+        with self._lock:
+            if item_id in self._items:
+                self._remove(item_id)
+            self._items[item_id] = (name, normalized, frozenset(grams))
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(item_id)
+
+    def _remove(self, item_id):
+        name, normalized, grams = self._items.pop(item_id)
+        for gram in grams:
+            self._postings[gram].discard(item_id)
+
+    def warm(self, session):
+        started = time.perf_counter()
+        with self._lock:
+            self._items = {}
+            self._postings = {}
+        for item_id, name in session.query(Item.id, Item.name).all():
+            self.add(item_id, name)
+        self.refreshed_at = time.monotonic()
+        logger.info("Warmed item index with %s items in %sms", len(self._items),
+                    round((time.perf_counter() - started) * 1000))
+        return len(self._items)
+
+    def refresh(self, session):
+        """Index items that were added since the last warm or refresh, returning how many were new."""
+        known = set(self._items)
+        new_ids = [item_id for (item_id,) in session.query(Item.id).all() if item_id not in known]
+        for start in range(0, len(new_ids), ITEM_LOAD_BATCH_SIZE):
+            for item_id, name in session.query(Item.id, Item.name) \
+                    .filter(Item.id.in_(new_ids[start:start + ITEM_LOAD_BATCH_SIZE])).all():
+                self.add(item_id, name)
+        self.refreshed_at = time.monotonic()
+        if new_ids:
+            logger.info("Added %s new items to the item index", len(new_ids))
+        return len(new_ids)
+
+    def is_stale(self):
+        return time.monotonic() - self.refreshed_at > ITEM_INDEX_REFRESH_SECONDS
+
+    def search(self, query, limit=ITEM_SEARCH_LIMIT):
+        normalized = normalize(query)
+        if not normalized:
+            return []
+        query_grams = trigrams(normalized)
+        inner_grams = set(normalized[i:i + 3] for i in range(len(normalized) - 2))
+        ranked = []
+        with self._lock:
+            # Any name containing the query contains all of its inner trigrams, so intersecting those posting lists
+            # (rarest first) finds every exact, prefix and substring match without scanning the whole index
+            if inner_grams:
+                postings = sorted((self._postings.get(gram, set()) for gram in inner_grams), key=len)
+                contains = postings[0].intersection(*postings[1:])
+            else:
+                contains = set().union(*(self._postings.get(gram, ()) for gram in query_grams))
+            for item_id in contains:
+                name, item_normalized, item_grams = self._items[item_id]
+                if item_normalized == normalized:
+                    match = MATCH_EXACT
+                elif item_normalized.startswith(normalized):
+                    match = MATCH_PREFIX
+                elif normalized in item_normalized:
+                    match = MATCH_SUBSTRING
+                else:
+                    continue
+                ranked.append((match, -self._similarity(query_grams, item_grams), len(item_normalized), name, item_id))
+
+            # Fuzzy scoring is the expensive part and only matters for typos, so skip it when the name matched as typed
+            if not ranked:
+                ranked.extend(self._fuzzy(query_grams))
+
+        return [ItemMatch(item_id, name, match, -score)
+                for match, score, _, name, item_id in heapq.nsmallest(limit, ranked)]
+
+    @staticmethod
+    def _similarity(query_grams, item_grams):
+        return 2.0 * len(query_grams & item_grams) / (len(query_grams) + len(item_grams))
+
+    def _fuzzy(self, query_grams):
+        """Dice similarity 2c / (k + g) >= t bounds both the shared count c >= t * k / (2 - t) and the name's own
+        trigram count g, so only the rarest posting lists that could still supply c shared trigrams are scanned."""
+        threshold = ITEM_SEARCH_FUZZY_THRESHOLD
+        min_shared = math.ceil(threshold * len(query_grams) / (2 - threshold))
+        max_grams = len(query_grams) * (2 - threshold) / threshold
+        postings = sorted((self._postings.get(gram, ()) for gram in query_grams), key=len)
+        for item_id in set().union(*postings[:len(postings) - min_shared + 1]):
+            name, item_normalized, item_grams = self._items[item_id]
+            if min_shared <= len(item_grams) <= max_grams:
+                score = self._similarity(query_grams, item_grams)
+                if score >= threshold:
+                    yield (MATCH_FUZZY, -score, len(item_normalized), name, item_id)
+
+    def resolve(self, query, limit=ITEM_SEARCH_LIMIT):
+        """Return (item_id or None, matches): the id is set when the query names a single item unambiguously.
+
+        Only an exact name, or a prefix of exactly one name, picks an item. Substring and fuzzy matches never do, even
+        when there is only one, since a typo would otherwise pick the wrong item.
+        """
+        matches = self.search(query, limit=limit)
+        if not matches:
+            return None, matches
+        if matches[0].match == MATCH_EXACT and (len(matches) == 1 or matches[1].match != MATCH_EXACT):
+            return matches[0].item_id, matches
+        non_fuzzy = [match for match in matches if match.match != MATCH_FUZZY]
+        if len(non_fuzzy) == 1 and non_fuzzy[0].match == MATCH_PREFIX:
+            return non_fuzzy[0].item_id, matches
+        return None, matches
+
+    def stats(self):
+        return {'items': len(self._items), 'trigrams': len(self._postings)}
@@ -0,0 +1,125 @@
+import time
+import logging
+import threading
+from collections import namedtuple
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload
+from models import User, Character, Signup, Raid, Team
+from constants import *
+
+logger = logging.getLogger('argbot.usercache')
+
+CharacterContext = namedtuple('CharacterContext', 'id name spec_id team_ids')
+SignupContext = namedtuple('SignupContext', 'id character_id is_rescinded')
+
+
+class UserContext():
+    def __init__(self, user_id, characters, signups):
+        self.user_id = user_id
+        self.characters = characters
+        self.signups = signups
+        self.loaded_at = time.monotonic()
+
+    def characters_for(self, spec_ids, team_id):
+        return [character for character in self.characters
+                if character.spec_id in spec_ids and team_id in character.team_ids]
+
+
+class UserContextCache():
+    """Short-lived per-user snapshot of the user row, characters (spec and teams) and open raid signups.
+
+    Entries expire after `ttl` seconds. listen() hooks a sessionmaker so any flush touching a User, Character or
+    Signup drops that user's entry, closing a Raid drops its signups from every entry, and a Team change or bulk
+    update on those tables drops everything. Signups for raids that aren't cached (closed raids) are looked up
+    directly by signup_for.
+    """
+
+    def __init__(self, ttl=USER_CONTEXT_TTL_SECONDS):
+        self.ttl = ttl
+        self._contexts = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, session, user_id):
+        """Return the UserContext for user_id, or None if they haven't registered."""
+        context = self._contexts.get(user_id)
+        if context is not None and time.monotonic() - context.loaded_at < self.ttl:
+            self.hits += 1
+            return context
+        self.misses += 1
+        context = self.load(session, user_id)
+        if context is not None:
+            with self._lock:
+                self._contexts[user_id] = context
+        return context
+
+    def load(self, session, user_id):
+        if session.query(User.id).filter(User.id == user_id).one_or_none() is None:
+            return None
+        characters = tuple(
+            CharacterContext(character.id, character.name, character.spec_id,
+                             frozenset(team.id for team in character.rosters))
+            for character in session.query(Character).options(joinedload(Character.rosters))
+            .filter(Character.user_id == user_id).all())
+        signups = dict(
+            (raid_id, SignupContext(signup_id, character_id, bool(is_rescinded)))
+            for signup_id, raid_id, character_id, is_rescinded in
+            session.query(Signup.id, Signup.raid_id, Signup.character_id, Signup.is_rescinded)
+            .join(Raid, Raid.id == Signup.raid_id)
+            .filter(Signup.user_id == user_id, Raid.is_closed == False).all())
+        return UserContext(user_id, characters, signups)
+
+    def signup_for(self, session, context, raid_id):
+        """The user's SignupContext for raid_id, from the entry or, for raids it doesn't hold, from the database."""
+        signup = context.signups.get(raid_id)
+        if signup is not None:
+            return signup
+        row = session.query(Signup.id, Signup.character_id, Signup.is_rescinded) \
+            .filter(Signup.user_id == context.user_id, Signup.raid_id == raid_id).first()
+        if row is None:
+            return None
+        signup_id, character_id, is_rescinded = row
+        return SignupContext(signup_id, character_id, bool(is_rescinded))
+
+    def forget_raid(self, raid_id):
+        with self._lock:
+            for context in self._contexts.values():
+                context.signups.pop(raid_id, None)
+
+    def record_signup(self, user_id, raid_id, signup):
+        """Write through a signup change made without the ORM, so the entry doesn't need to be reloaded."""
+        context = self._contexts.get(user_id)
+        if context is not None:
+            context.signups[raid_id] = signup
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._contexts.pop(user_id, None)
+
+    def invalidate_all(self):
+        with self._lock:
+            self._contexts = {}
+
+    def listen(self, session_factory):
+        event.listen(session_factory, 'after_flush', self._after_flush)
+        event.listen(session_factory, 'after_bulk_update', self._after_bulk)
+        event.listen(session_factory, 'after_bulk_delete', self._after_bulk)
+
+    def _after_flush(self, session, flush_context):
+        for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(instance, User):
+                self.invalidate(instance.id)
+            elif isinstance(instance, (Character, Signup)):
+                self.invalidate(instance.user_id)
+            elif isinstance(instance, Raid) and instance.is_closed:
+                self.forget_raid(instance.id)
+            elif isinstance(instance, Team):
+                self.invalidate_all()
+
+    def _after_bulk(self, update_context):
+        if update_context.mapper.class_ in (User, Character, Signup, Team):
+            self.invalidate_all()
+
+    def stats(self):
+        return {'users': len(self._contexts), 'hits': self.hits, 'misses': self.misses}
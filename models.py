@@ -1,24 +1,31 @@
 import os
 import enum
+import math
 import logging
 import random
+import threading
+import time
 from collections import namedtuple
+import sqlalchemy
 from constants import *
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import create_engine
-from sqlalchemy.sql import func
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.pool import QueuePool, StaticPool
+from sqlalchemy.sql import func, case, select, cast, literal, and_, null, tuple_
 from sqlalchemy import Column, Boolean, BigInteger, Integer, Interval, String, Enum, DateTime, ForeignKey, Table, \
-    Numeric, ForeignKeyConstraint
-from sqlalchemy.orm import sessionmaker, relationship
-from operator import itemgetter
+    Numeric, ForeignKeyConstraint, Index, DDL
+from sqlalchemy.orm import sessionmaker, relationship, joinedload, aliased
+from operator import itemgetter, attrgetter
 from datetime import datetime, timedelta
 
-FORMAT = '%(asctime)-15s %(message)s'
-logging.basicConfig(format=FORMAT)
 logger = logging.getLogger('argbot.models')
-logger.setLevel(10)  # https://docs.python.org/2/library/logging.html#levels
 
 Base = declarative_base()
+# Trigram indexes back the ilike name searches
+event.listen(Base.metadata, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+# SQLite only autoincrements INTEGER PRIMARY KEY columns, so generated BigInteger keys fall back to Integer there
+AutoBigInteger = BigInteger().with_variant(Integer, 'sqlite')
 
 ENVIRONMENT = os.environ['ENVIRONMENT']
 
@@ -61,8 +68,102 @@ def get_db_uri():
     return url
 
 
-engine = create_engine(get_db_uri())
-# 'postgresql://' + DB_USER + ':' + DB_PASSWORD + '@' + DB_HOST + ':' + DB_PORT + '/' + DB_NAME)
+class PoolStats():
+    def __init__(self, name):
+        self.name = name
+        self.checkouts = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def record_checkout(self, wait):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def record_checkin(self):
+        with self._lock:
+            self.checked_out -= 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def as_dict(self):
+        return {
+            'checkouts': self.checkouts,
+            'checked_out': self.checked_out,
+            'max_checked_out': self.max_checked_out,
+            'wait_avg_ms': round(self.wait_total / self.checkouts * 1000, 2) if self.checkouts else 0,
+            'wait_max_ms': round(self.wait_max * 1000, 2),
+            'timeouts': self.timeouts
+        }
+
+
+class InstrumentedQueuePool(QueuePool):
+    stats = None
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.stats.record_timeout()
+            raise
+        self.stats.record_checkout(time.perf_counter() - started)
+        return connection
+
+
+pool_stats = {}
+
+
+def _env_setting(prefix, key, default, cast_to=int):
+    value = os.environ.get(prefix + '_' + key)
+    if value is None:
+        return default
+    if cast_to is bool:
+        return value.upper() in ('TRUE', '1', 'YES')
+    return cast_to(value)
+
+
+def create_db_engine(name='DB', pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW):
+    """Build an engine with its own connection pool, configured from <name>_* environment variables.
+
+    Recognized settings are POOL_SIZE, MAX_OVERFLOW, POOL_TIMEOUT, POOL_RECYCLE, POOL_PRE_PING and
+    STATEMENT_TIMEOUT_MS. Checkout counts and wait times for the pool are collected under pool_stats[name].
+    """
+    if ENVIRONMENT == 'test':
+        # One shared in-memory database, visible from executor and scheduler threads
+        return create_engine(get_db_uri(), poolclass=StaticPool, connect_args={'check_same_thread': False})
+
+    stats = pool_stats[name] = PoolStats(name)
+    statement_timeout = _env_setting(name, 'STATEMENT_TIMEOUT_MS', DB_STATEMENT_TIMEOUT_MS)
+    _engine = create_engine(
+        get_db_uri(),
+        poolclass=type(name.title() + 'QueuePool', (InstrumentedQueuePool,), {'stats': stats}),
+        pool_size=_env_setting(name, 'POOL_SIZE', pool_size),
+        max_overflow=_env_setting(name, 'MAX_OVERFLOW', max_overflow),
+        pool_timeout=_env_setting(name, 'POOL_TIMEOUT', DB_POOL_TIMEOUT_SECONDS),
+        pool_recycle=_env_setting(name, 'POOL_RECYCLE', DB_POOL_RECYCLE_SECONDS),
+        pool_pre_ping=_env_setting(name, 'POOL_PRE_PING', True, cast_to=bool),
+        # Pin sessions to UTC, so now() column defaults are stamped in the same zone as datetime.utcnow()
+        connect_args={'options': '-c timezone=UTC -c statement_timeout=' + str(statement_timeout)}
+    )
+    event.listen(_engine, 'checkin', lambda dbapi_connection, connection_record: stats.record_checkin())
+    return _engine
+
+
+def get_pool_stats():
+    return {name: stats.as_dict() for name, stats in pool_stats.items()}
+
+
+engine = create_db_engine('DB')
 
 
 Session = sessionmaker()
@@ -87,6 +188,11 @@ RaidTier = namedtuple('RaidTier', 'name tier')
 
 ActiveRaidTiers = [RaidTier('MC/ONY', 1), RaidTier('BWL', 2)]
 
+PRStanding = namedtuple('PRStanding', 'user_id display_name ep gp pr')
+BucketDrift = namedtuple('BucketDrift', 'user_id team_id raid_tier point_type stored expected')
+LedgerPage = namedtuple('LedgerPage', 'entries has_newer has_older')
+HistoricalStandings = namedtuple('HistoricalStandings', 'standings history_start incomplete')
+
 
 class PointTypes(enum.Enum):
     EP = 1
@@ -212,6 +318,8 @@ class User(Base):
     discord_guild_id = Column(BigInteger)
     name = Column(String)
     display_name = Column(String)
+    __table_args__ = (Index('ix_users_display_name_trgm', 'display_name', postgresql_using='gin',
+                            postgresql_ops={'display_name': 'gin_trgm_ops'}), {})
 
     def find_or_init_bucket(self, session, team, raid_tier, point_type):
         try:
@@ -247,7 +355,7 @@ class User(Base):
                 query.filter(Spec.character_class == character_class)
             results = query.all()
         except Exception as e:
-            logger.error("Unable to lookup user's characters because: " + str(e))
+            logger.error("Unable to lookup user's characters because: %s", e)
             session.rollback()
             raise
         return results
@@ -275,10 +383,11 @@ class Raid(Base):
     ends_at = Column(DateTime)
     notes = Column(String)
     signup_message_channel_id = Column(BigInteger)
-    signup_message_id = Column(BigInteger)
+    signup_message_id = Column(BigInteger, index=True)
     created_by_id = Column(BigInteger, ForeignKey('users.id'))
     is_started = Column(Boolean, default=False)
     is_closed = Column(Boolean, default=False)
+    last_reward_tick = Column(Integer)
     reward_schedule = relationship('RewardSchedule', viewonly=True)
     team = relationship('Team')
     created_by = relationship('User')
@@ -301,26 +410,94 @@ class Raid(Base):
         else:
             return -1
 
-    def reward(self, session):
-        logger.info("Processing raid reward tick for raid " + str(self.id))
+    def get_tick(self, at=None):
+        if at is None:
+            at = datetime.utcnow()
+        if at <= self.starts_at or not self.reward_schedule.tick_interval:
+            return 0
+        return int((at - self.starts_at) / self.reward_schedule.tick_interval)
+
+    def final_tick(self):
+        """The first tick at or after ends_at, which pays the end bonus and closes the raid."""
+        tick_interval = self.reward_schedule.tick_interval
+        ends_at = self.ends_at or self.starts_at + self.reward_schedule.duration
+        if not tick_interval:
+            return 0
+        return int(math.ceil((ends_at - self.starts_at) / tick_interval))
+
+    def reward(self, session, tick=None):
+        """Pay every tick after last_reward_tick through `tick` (default: the current tick) in one batch.
+
+        Tick 0 pays the start bonus, later ticks the tick bonus, and final_tick() adds the end bonus and closes the
+        raid. Ticks are derived from starts_at rather than the time a job happened to run, so catching up after
+        downtime pays exactly the missed ticks and repeating a tick pays nothing.
+        """
+        logger.info("Processing raid reward tick for raid %s", self.id)
         try:
-            if self.is_started == False:
-                for signup in self.signups:
-                    signup.give_effort(session, self.reward_schedule.start_bonus)
-                self.is_started = True
+            if self.is_closed:
+                logger.warning("Ignoring reward tick for closed raid %s", self.id)
+                return 0
+            final_tick = self.final_tick()
+            tick = min(self.get_tick() if tick is None else tick, final_tick)
+            if self.last_reward_tick is not None:
+                first_tick = self.last_reward_tick + 1
+            elif self.is_started:
+                # Started before ticks were tracked, so only the current tick is known to be unpaid
+                first_tick = tick
             else:
-                for signup in self.signups:
-                    signup.give_effort(session, self.reward_schedule.tick_bonus)
-                    if datetime.utcnow() > self.ends_at:
-                        signup.give_effort(session, self.reward_schedule.end_bonus)
-                if datetime.utcnow() > self.ends_at:
-                    self.is_closed = True
+                first_tick = 0
+            if tick < first_tick:
+                logger.warning("Ignoring reward tick %s for raid %s, already rewarded through tick %s", tick, self.id,
+                               self.last_reward_tick)
+                return 0
+
+            bonuses = []
+            for _tick in range(first_tick, tick + 1):
+                if _tick == 0:
+                    bonuses.append(self.reward_schedule.start_bonus)
+                else:
+                    bonuses.append(self.reward_schedule.tick_bonus)
+                if _tick == final_tick:
+                    bonuses.append(self.reward_schedule.end_bonus)
+            self.is_started = True
+            self.is_closed = tick == final_tick
+            rewarded = self.grant_effort(session, bonuses)
+            self.last_reward_tick = tick
             session.commit()
+            logger.info("Rewarded %s signups for ticks %s through %s of raid %s", rewarded, first_tick, tick, self.id)
+            return rewarded
         except Exception as e:
-            logger.error("Failed to process raid reward because " + str(e))
+            logger.error("Failed to process raid reward because %s", e)
             session.rollback()
             raise e
 
+    def grant_effort(self, session, bonuses):
+        """Grant each bonus to every confirmed, non-ejected signup, resolving their EP buckets in a single query.
+
+        Bucket balances and ledger rows are only staged on the session; the caller commits them together.
+        """
+        bonuses = [bonus for bonus in bonuses if bonus]
+        if not bonuses:
+            return 0
+        _signup_buckets = session.query(Signup, UserPointBucket) \
+            .outerjoin(UserPointBucket, and_(UserPointBucket.user_id == Signup.user_id,
+                                        UserPointBucket.team_id == self.team_id,
+                                        UserPointBucket.raid_tier == self.get_tier(),
+                                        UserPointBucket.point_type == PointTypes.EP)) \
+            .options(joinedload(Signup.character)) \
+            .filter(Signup.raid_id == self.id, Signup.is_confirmed == True, Signup.is_ejected == False) \
+            .all()
+        _missing = [_signup.user_id for _signup, _bucket in _signup_buckets if _bucket is None]
+        if _missing:
+            logger.warning("No tier %s EP bucket for users %s signed up to raid %s, they get no effort",
+                           self.get_tier(), _missing, self.id)
+        for _signup, _bucket in _signup_buckets:
+            if _bucket is None:
+                continue
+            for bonus in bonuses:
+                session.add(_bucket.stage_grant(bonus, raid=self, character=_signup.character))
+        return len(_signup_buckets) - len(_missing)
+
     def extend(self, session, interval):
         logger.info("Extending raid ends_at")
         if self.is_closed == False:
@@ -347,6 +524,9 @@ class Character(Base):
     user = relationship('User', backref='characters')
     rosters = relationship('Team', secondary=roster_table)
     spec = relationship('Spec', backref='characters')
+    __table_args__ = (Index('ix_characters_user_id', 'user_id'),
+                      Index('ix_characters_name_trgm', 'name', postgresql_using='gin',
+                            postgresql_ops={'name': 'gin_trgm_ops'}), {})
 
     def __str__(self):
         string = (self.name + ' ' + str(self.spec))
@@ -371,24 +551,7 @@ class Signup(Base):
     user = relationship('User')
     character = relationship('Character')
     raid = relationship('Raid', backref='signups')
-
-    def give_effort(self, session, effort_amount):
-        logger.info("About to look for bucket to give_effort")
-        _bucket = session.query(UserPointBucket).filter(UserPointBucket.user == self.user,
-                                                        UserPointBucket.team == self.raid.team,
-                                                        UserPointBucket.raid_tier == self.raid.get_tier(),
-                                                        UserPointBucket.point_type == PointTypes.EP).one()
-
-        if _bucket is None:
-            raise ValueError("Can't grant effort to a null bucket")
-        if self.is_confirmed == True and self.is_ejected == False:
-            logger.info("Proceeding with grant")
-            _bucket.grant_points(session=session, delta_points=effort_amount, raid=self.raid, character=self.character)
-        else:
-            logger.info("Ignoring effort from " + str(self.user_id) + " because " + str(self.is_confirmed) + " " + str(
-                self.is_ejected))
-            pass
-        return
+    __table_args__ = (Index('ix_signups_raid_id_user_id', 'raid_id', 'user_id'), {})
 
     def confirm(self):
         if not self.is_confirmed:
@@ -414,15 +577,19 @@ class Team(Base):
         if self not in character.rosters:
             character.rosters.append(self)
             user = character.user
+            _existing = set(session.query(UserPointBucket.raid_tier, UserPointBucket.point_type).filter(
+                UserPointBucket.user_id == user.id,
+                UserPointBucket.team_id == self.id).all())
             for _tier in range(5):  # 0 through 4 bad hardcode for set(raid_tiers.get_tier)
                 for _point_type in PointTypes:
-                    logger.debug(
-                        "Find or creating " + user.display_name + '  ' + str(_point_type) + " bucket for tier " + str(
-                            _tier) + " for team "
-                        + self.name)
-                    user.find_or_init_bucket(session=session, team=self, raid_tier=_tier, point_type=_point_type)
+                    if (_tier, _point_type) not in _existing:
+                        logger.debug("Creating %s  %s bucket for tier %s for team %s", user.display_name, _point_type,
+                                     _tier, self.name)
+                        _new_bucket = UserPointBucket(user=user, team=self, raid_tier=_tier, point_type=_point_type)
+                        session.add(_new_bucket)
+                        _new_bucket.init_points(session=session)
         else:
-            logger.warning("Couldn't assign " + character.name + " to team " + self.name + ", they are already on it!")
+            logger.warning("Couldn't assign %s to team %s, they are already on it!", character.name, self.name)
         return
 
 
@@ -433,6 +600,55 @@ class ItemSubClass(Base):
     name = Column(String)
 
 
+# Slot modifiers from http://www.epgpweb.com/help/gearpoints as (default, {role: modifier}) per weapon group
+TWO_HAND_WEAPONS = frozenset(subclass.value for subclass in [
+    WeaponSubclasses.Axe2, WeaponSubclasses.Mace2, WeaponSubclasses.Sword2, WeaponSubclasses.Staff,
+    WeaponSubclasses.Exotic2, WeaponSubclasses.Spear])
+ONE_HAND_WEAPONS = frozenset(subclass.value for subclass in [
+    WeaponSubclasses.Axe, WeaponSubclasses.Mace, WeaponSubclasses.Sword, WeaponSubclasses.Exotic,
+    WeaponSubclasses.Fist, WeaponSubclasses.Dagger])
+RANGED_WEAPONS = frozenset(subclass.value for subclass in [
+    WeaponSubclasses.Bow, WeaponSubclasses.Gun, WeaponSubclasses.Thrown, WeaponSubclasses.Crossbow,
+    WeaponSubclasses.Wand])
+WEAPON_SLOT_MODIFIERS = [
+    (TWO_HAND_WEAPONS, (2, {CharacterRoles.Ranged: 1})),
+    (ONE_HAND_WEAPONS, (1, {CharacterRoles.Tank: 0.5, CharacterRoles.Ranged: 0.5})),
+    (RANGED_WEAPONS, (0.5, {CharacterRoles.Ranged: 1.5})),
+]
+RELIC_ARMOR = frozenset(subclass.value for subclass in [ArmorSubclasses.Libram, ArmorSubclasses.Idol,
+                                                        ArmorSubclasses.Totem])
+ARMOR_SLOT_MODIFIERS = {'Head': 1, 'Chest': 1, 'Legs': 1,
+                        'Shoulder': 0.75, 'Hands': 0.75, 'Waist': 0.75, 'Feet': 0.75, 'Trinket': 0.75,
+                        'Wrist': 0.5, 'Neck': 0.5, 'Back': 0.5, 'Finger': 0.5}
+QUALITY_VALUES = {'Legendary': 5, 'Epic': 4, 'Rare': 3, 'Uncommon': 2}
+# item_gear_points.role for the role-independent value shown on drop embeds
+GP_ROLE_BASE = 0
+GP_ROLES = [None] + list(CharacterRoles)
+
+
+def gp_slot_modifier(item_class, item_subclass_id, inventory_type_name, role=None):
+    if item_class == ItemClasses.Weapon:
+        for subclasses, (default, role_modifiers) in WEAPON_SLOT_MODIFIERS:
+            if item_subclass_id in subclasses:
+                return role_modifiers.get(role, default)
+    elif item_class == ItemClasses.Armor:
+        if item_subclass_id == ArmorSubclasses.Shield.value and role == CharacterRoles.Tank:
+            return 1.5
+        elif item_subclass_id in RELIC_ARMOR:
+            return 0.5
+        return ARMOR_SLOT_MODIFIERS.get(inventory_type_name, 0)
+    return 0
+
+
+def calculate_gp(item_level, quality, slot_modifier):
+    # To maintain consistency I'm using the formula from here: https://gitlab.com/Korkd/epgpbot/-/wikis/epgp
+    return int(round((17.213 * 2 ** (item_level / 26 + (QUALITY_VALUES.get(quality, 0) - 4)) * slot_modifier), 0))
+
+
+def gp_role_key(role):
+    return GP_ROLE_BASE if role is None else role.value
+
+
 class Item(Base):
     __tablename__ = 'items'
     id = Column(Integer, primary_key=True)
@@ -447,81 +663,91 @@ class Item(Base):
     inventory_type_name = Column(String)
     max_count = Column(Integer)
     __table_args__ = (
-        ForeignKeyConstraint([item_class, item_subclass_id], [ItemSubClass.item_class, ItemSubClass.subclass_id]), {})
+        ForeignKeyConstraint([item_class, item_subclass_id], [ItemSubClass.item_class, ItemSubClass.subclass_id]),
+        Index('ix_items_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}), {})
     item_subclass = relationship('ItemSubClass')
+    gear_points = relationship('ItemGearPoints', lazy='select')
 
     def __str__(self):
         return (self.name + ", a " + self.item_subclass.name)
 
     def gp(self, role=None):
-        slot_modifier = 0
-        # Using slot modifier logic from here: http://www.epgpweb.com/help/gearpoints
-        if self.item_class == ItemClasses.Weapon:
-            logger.debug("I'm a weapon with subclass = " + str(self.item_subclass_id))
-            if self.item_subclass_id in [WeaponSubclasses.Axe2.value, WeaponSubclasses.Mace2.value,
-                                         WeaponSubclasses.Sword2.value, WeaponSubclasses.Staff.value,
-                                         WeaponSubclasses.Exotic2.value, WeaponSubclasses.Spear.value]:
-                if role == CharacterRoles.Ranged:
-                    slot_modifier = 1
-                else:
-                    slot_modifier = 2
-            elif self.item_subclass_id in [WeaponSubclasses.Axe.value, WeaponSubclasses.Mace.value,
-                                           WeaponSubclasses.Sword.value, WeaponSubclasses.Exotic.value,
-                                           WeaponSubclasses.Fist.value, WeaponSubclasses.Dagger.value]:
-                if role == CharacterRoles.Tank:
-                    slot_modifier = 0.5
-                elif role == CharacterRoles.Ranged:
-                    slot_modifier = 0.5
-                else:
-                    slot_modifier = 1
-            elif self.item_subclass_id in [WeaponSubclasses.Bow.value, WeaponSubclasses.Gun.value,
-                                           WeaponSubclasses.Thrown.value, WeaponSubclasses.Crossbow.value,
-                                           WeaponSubclasses.Wand.value]:
-                if role == CharacterRoles.Ranged:
-                    slot_modifier = 1.5
-                else:
-                    slot_modifier = 0.5
-        elif self.item_class == ItemClasses.Armor:
-            logger.debug("I'm armor with subclass =" + str(self.item_subclass_id))
-            if self.item_subclass_id == ArmorSubclasses.Shield.value and role == CharacterRoles.Tank:
-                slot_modifier = 1.5
-            elif self.item_subclass in [ArmorSubclasses.Libram.value, ArmorSubclasses.Idol.value,
-                                        ArmorSubclasses.Totem.value]:
-                slot_modifier = 0.5
-            else:
-                if self.inventory_type_name in ['Head', 'Chest', 'Legs']:
-                    slot_modifier = 1
-                elif self.inventory_type_name in ['Shoulder', 'Hands', 'Waist', 'Feet', 'Trinket']:
-                    slot_modifier = 0.75
-                elif self.inventory_type_name in ['Wrist', 'Neck', 'Back', 'Finger']:
-                    slot_modifier = 0.5
-
-        quality_value = 0
-        if self.quality == 'Legendary':
-            quality_value = 5
-        elif self.quality == 'Epic':
-            quality_value = 4
-        elif self.quality == 'Rare':
-            quality_value = 3
-        elif self.quality == 'Uncommon':
-            quality_value = 2
-
-        logger.debug("Calculating GP with the following values.  ilvl=" + str(self.item_level) + ", slot_mod=" + str(
-            slot_modifier) + ", qval=" + str(quality_value))
-        gp_value = int(round((17.213 * 2 ** (self.item_level / 26 + (quality_value - 4)) * slot_modifier), 0))
-        # To maintain consistency I'm using the formula from here: https://gitlab.com/Korkd/epgpbot/-/wikis/epgp
-        return gp_value
+        """GP for this item when won by role, read from item_gear_points and falling back to the formula."""
+        role_key = gp_role_key(role)
+        for gear_points in self.gear_points:
+            if gear_points.role == role_key:
+                return gear_points.gp
+        if self.id not in _items_without_gear_points:
+            # Renders and awards ask on every call, so only the first time is worth a warning
+            _items_without_gear_points.add(self.id)
+            logger.warning("No precomputed GP for item %s, calculating it instead until --recompute-gp is run",
+                           self.id)
+        return self.formula_gp(role=role)
+
+    def formula_gp(self, role=None):
+        return calculate_gp(self.item_level, self.quality,
+                            gp_slot_modifier(self.item_class, self.item_subclass_id, self.inventory_type_name, role))
+
+
+# Items Item.gp has already warned about
+_items_without_gear_points = set()
+
+
+class ItemGearPoints(Base):
+    """Precomputed GP per item and role, so drop renders and awards don't re-run the formula."""
+    __tablename__ = 'item_gear_points'
+    item_id = Column(Integer, ForeignKey('items.id', ondelete='CASCADE'), primary_key=True)
+    role = Column(Integer, primary_key=True)
+    gp = Column(Integer, nullable=False)
+
+    @classmethod
+    def _expected(cls, session, item_ids=None):
+        query = session.query(Item.id, Item.item_class, Item.item_subclass_id, Item.inventory_type_name,
+                              Item.item_level, Item.quality)
+        if item_ids is not None:
+            query = query.filter(Item.id.in_(item_ids))
+        for item_id, item_class, subclass_id, inventory_type_name, item_level, quality in query.yield_per(1000):
+            for role in GP_ROLES:
+                yield {'item_id': item_id, 'role': gp_role_key(role),
+                       'gp': calculate_gp(item_level, quality,
+                                          gp_slot_modifier(item_class, subclass_id, inventory_type_name, role))}
+
+    @classmethod
+    def recompute(cls, session, item_ids=None):
+        """Rebuild the table (or just item_ids) from the formula in one delete and one executemany. Doesn't commit."""
+        rows = list(cls._expected(session, item_ids))
+        delete = cls.__table__.delete()
+        if item_ids is not None:
+            delete = delete.where(cls.item_id.in_(item_ids))
+        session.execute(delete)
+        if rows:
+            session.execute(cls.__table__.insert(), rows)
+        logger.info("Recomputed %s item GP values", len(rows))
+        return len(rows)
+
+    @classmethod
+    def verify(cls, session):
+        """Compare the table against the formula, returning (item_id, role, stored gp, expected gp) for mismatches."""
+        stored = dict(((item_id, role), gp) for item_id, role, gp in session.query(cls.item_id, cls.role, cls.gp))
+        mismatches = []
+        for row in cls._expected(session):
+            stored_gp = stored.get((row['item_id'], row['role']))
+            if stored_gp != row['gp']:
+                mismatches.append((row['item_id'], row['role'], stored_gp, row['gp']))
+        if mismatches:
+            logger.warning("%s item GP values don't match the formula", len(mismatches))
+        return mismatches
 
 
 class ItemDrop(Base):
     __tablename__ = 'item_drops'
-    id = Column(BigInteger, primary_key=True)
+    id = Column(AutoBigInteger, primary_key=True)
     item_id = Column(Integer, ForeignKey('items.id'))
     raid_id = Column(Integer, ForeignKey('raids.id'))
     created_by_id = Column(BigInteger, ForeignKey('users.id'))
-    dropped_at = Column(DateTime, default=datetime.utcnow())
+    dropped_at = Column(DateTime, default=datetime.utcnow)
     bid_message_channel_id = Column(BigInteger)
-    bid_message_id = Column(BigInteger)
+    bid_message_id = Column(BigInteger, index=True)
     is_awarded = Column(Boolean, default=False)
     awarded_at = Column(DateTime)
     winner_id = Column(BigInteger, ForeignKey('characters.id'))
@@ -558,7 +784,7 @@ class ItemDrop(Base):
                     self.is_awarded = True
                     self.awarded_at = datetime.utcnow()
                     return
-                logger.debug("Sorted bid w/ pr list: " + str(sorted_bid_pr_list))
+                logger.debug("Sorted bid w/ pr list: %s", sorted_bid_pr_list)
                 winning_bid = sorted_bid_pr_list[0][0]
                 winning_bid_pr = sorted_bid_pr_list[0][1]
                 self.winner_pr = winning_bid_pr
@@ -588,28 +814,27 @@ class ItemDrop(Base):
             self.is_awarded = True
             self.awarded_at = datetime.utcnow()
         except Exception as e:
-            logger.error("Failed to award item because " + str(e))
+            logger.error("Failed to award item because %s", e)
             session.rollback()
             raise e
 
     def prioritize_bids(self, session, bids):
         bid_pr_list = []
+        if not bids:
+            return bid_pr_list
         try:
+            _bidder_ids = [bid.user_id for bid in bids]
+            _signed_up_ids = set(_user_id for (_user_id,) in session.query(Signup.user_id).filter(
+                Signup.raid_id == self.raid_id, Signup.user_id.in_(_bidder_ids)).all())
+            _tier = self.raid.get_tier()
+            _standings = {standing.user_id: standing for standing in get_pr_standings(
+                session, self.raid.team, raid_tiers=[_tier], user_ids=_bidder_ids)[_tier]}
             for bid in bids:
-                signup = session.query(Signup).filter(Signup.raid == self.raid, Signup.user == bid.user).one()
-                ep_bucket = session.query(UserPointBucket).filter(
-                    UserPointBucket.user == bid.user,
-                    UserPointBucket.team == self.raid.team,
-                    UserPointBucket.raid_tier == self.raid.get_tier(),
-                    UserPointBucket.point_type == PointTypes.EP
-                ).one()
-                gp_bucket = session.query(UserPointBucket).filter(
-                    UserPointBucket.user == bid.user,
-                    UserPointBucket.team == self.raid.team,
-                    UserPointBucket.raid_tier == self.raid.get_tier(),
-                    UserPointBucket.point_type == PointTypes.GP
-                ).one()
-                priority = round((ep_bucket.get_points() / gp_bucket.get_points()), 2)
+                if bid.user_id not in _signed_up_ids:
+                    raise ValueError("Bidder " + str(bid.user_id) + " is not signed up for raid " + str(self.raid_id))
+                if bid.user_id not in _standings:
+                    raise ValueError("No EP/GP buckets found for bidder " + str(bid.user_id))
+                priority = _standings[bid.user_id].pr
                 bid.pr = priority
                 bid_pr_list.append((bid, priority))
             return sorted(bid_pr_list, key=itemgetter(1), reverse=True)
@@ -628,7 +853,7 @@ class ItemDrop(Base):
 
             return sorted(bid_pr_list, key=itemgetter(1), reverse=True)
         except Exception as e:
-            logger.error("Somehow failed to randomize the bids list because " + str(e))
+            logger.error("Somehow failed to randomize the bids list because %s", e)
             raise
 
 
@@ -647,56 +872,6 @@ class ItemDropBid(Base):
     character = relationship('Character')
 
 
-class Bids():
-    class __Bids():
-        def __init__(self):
-            self.emoji_id_mappings = {
-                'bid_100': -1,
-                'bid_25': -1,
-                'bid_0': -1,
-            }
-
-        def register(self, emoji_name, emoji_id):
-            # logger.info("Registering bid reaction")
-            if self.get(emoji_name) is None:
-                raise KeyError
-            else:
-                # logger.debug("Setting self.emoji_id_mappings[" + emoji_name + "] to " + emoji_id)
-                self.emoji_id_mappings[emoji_name] = emoji_id
-                return
-
-        def get(self, key):
-            try:
-                val = self.emoji_id_mappings[key]
-            except KeyError:
-                val = None
-            finally:
-                return val
-
-    instance = None
-
-    def __init__(self):
-        if not Bids.instance:
-            Bids.instance = Bids.__Bids()
-
-    def register(self, emoji_name, emoji_id):
-        self.instance.register(emoji_name, emoji_id)
-        return
-
-    def lookup(self, emoji_id):
-        name = None
-        for _name, _id in self.instance.emoji_id_mappings:
-            if _id == emoji_id:
-                name = _name
-        return name
-
-    def get_all(self):
-        return self.instance.emoji_id_mappings
-
-    def __getitem__(self, key):
-        return self.instance.emoji_id_mappings.get(key)
-
-
 class UserPointBucket(Base):
     __tablename__ = 'point_buckets'
     team_id = Column(Integer, ForeignKey('teams.id'), primary_key=True)
@@ -706,6 +881,7 @@ class UserPointBucket(Base):
     __point_value = Column(Integer)
     user = relationship('User')
     team = relationship('Team')
+    __table_args__ = (Index('ix_point_buckets_user_id_team_id', 'user_id', 'team_id', 'raid_tier', 'point_type'), {})
 
     def __str__(self):
         return str(self.__point_value)
@@ -713,6 +889,10 @@ class UserPointBucket(Base):
     def get_points(self):
         return self.__point_value
 
+    @classmethod
+    def points_column(cls):
+        return cls.__point_value
+
     def init_points(self, session):
         try:
             if self.point_type == PointTypes.GP:
@@ -798,37 +978,7 @@ class UserPointBucket(Base):
 
     def grant_points(self, session, delta_points, raid=None, item_drop=None, character=None):
         try:
-            old_value = self.__point_value
-            new_value = old_value + delta_points
-            if self.point_type == PointTypes.GP:
-                if new_value < BASE_GP:
-                    new_value = BASE_GP
-                    delta_points = new_value - old_value
-                _ledger_entry = GearPointLedgerEntry(
-                    bucket=self,
-                    transaction_type=PointTransactionTypes.GRANT,
-                    raid=raid,
-                    item_drop=item_drop,
-                    character=character,
-                    point_old_value=old_value,
-                    point_delta=delta_points,
-                    point_new_value=new_value,
-                    point_type=self.point_type
-                )
-            elif self.point_type == PointTypes.EP:
-                _ledger_entry = EffortPointLedgerEntry(
-                    bucket=self,
-                    transaction_type=PointTransactionTypes.GRANT,
-                    raid=raid,
-                    point_old_value=old_value,
-                    point_delta=delta_points,
-                    point_new_value=new_value,
-                    point_type=self.point_type
-                )
-            else:
-                raise ValueError("Unrecognized point_type during grant")
-            self.__point_value = new_value
-            session.add(_ledger_entry)
+            session.add(self.stage_grant(delta_points, raid=raid, item_drop=item_drop, character=character))
             session.commit()
             return
         except Exception as e:
@@ -836,27 +986,59 @@ class UserPointBucket(Base):
             session.rollback()
             raise e
 
+    def stage_grant(self, delta_points, raid=None, item_drop=None, character=None):
+        """Apply a grant to the in-memory balance and return its ledger entry without touching the session."""
+        old_value = self.__point_value
+        new_value = old_value + delta_points
+        if self.point_type == PointTypes.GP:
+            if new_value < BASE_GP:
+                new_value = BASE_GP
+                delta_points = new_value - old_value
+            _ledger_entry = GearPointLedgerEntry(
+                bucket=self,
+                transaction_type=PointTransactionTypes.GRANT,
+                raid=raid,
+                item_drop=item_drop,
+                character=character,
+                point_old_value=old_value,
+                point_delta=delta_points,
+                point_new_value=new_value,
+                point_type=self.point_type
+            )
+        elif self.point_type == PointTypes.EP:
+            _ledger_entry = EffortPointLedgerEntry(
+                bucket=self,
+                transaction_type=PointTransactionTypes.GRANT,
+                raid=raid,
+                character=character,
+                point_old_value=old_value,
+                point_delta=delta_points,
+                point_new_value=new_value,
+                point_type=self.point_type
+            )
+        else:
+            raise ValueError("Unrecognized point_type during grant")
+        self.__point_value = new_value
+        return _ledger_entry
+
     def decay_points(self, session, percent_decay):
         try:
             old_value = self.__point_value
 
             if 0 < percent_decay < 100:
-                delta_points = old_value * (percent_decay / 100)
+                # Round half away from zero to match SQL round() in bulk_decay
+                new_value = abs(old_value) * (100 - percent_decay) / 100
+                new_value = int(math.copysign(math.floor(new_value + 0.5), old_value))
             else:
                 raise ValueError("Invalid decay amount, must be between 0 and 100")
 
-            new_value = old_value - delta_points
-
             if self.point_type == PointTypes.GP:
-                if new_value < BASE_GP:
-                    new_value = BASE_GP
-                    delta_points = new_value - old_value
-
+                new_value = max(new_value, BASE_GP)
                 _ledger_entry = GearPointLedgerEntry(
                     bucket=self,
                     transaction_type=PointTransactionTypes.DECAY,
                     point_old_value=old_value,
-                    point_delta=delta_points,
+                    point_delta=new_value - old_value,
                     point_new_value=new_value,
                     point_type=self.point_type
                 )
@@ -865,7 +1047,7 @@ class UserPointBucket(Base):
                     bucket=self,
                     transaction_type=PointTransactionTypes.DECAY,
                     point_old_value=old_value,
-                    point_delta=delta_points,
+                    point_delta=new_value - old_value,
                     point_new_value=new_value,
                     point_type=self.point_type
                 )
@@ -876,20 +1058,55 @@ class UserPointBucket(Base):
             session.commit()
             return
         except Exception as e:
-            logger.error("Failed to decay points to bucket "
-                         + str(self.user_id) + '.' + str(self.team_id) + '.' + str(self.raid_tier)
-                         )
+            logger.error("Failed to decay points to bucket %s.%s.%s", self.user_id, self.team_id, self.raid_tier)
             session.rollback()
             raise e
 
+    @classmethod
+    def bulk_decay(cls, session, team, raid_tier, percent_decay):
+        """Decay every bucket of a team's raid tier with one UPDATE instead of an ORM round trip per bucket.
+
+        Ledger rows are written first with INSERT ... SELECT so they capture the pre-decay values. Nothing is committed
+        here, the caller owns the transaction. Returns the number of buckets updated.
+        """
+        if not 0 < percent_decay < 100:
+            raise ValueError("Invalid decay amount, must be between 0 and 100")
+        old_value = cls.__point_value
+        decayed_value = cast(func.round(old_value * (100 - percent_decay) / 100.0), Integer)
+        new_value = case([(and_(cls.point_type == PointTypes.GP, decayed_value < BASE_GP), BASE_GP)],
+                         else_=decayed_value)
+        bucket_filter = and_(cls.team_id == team.id, cls.raid_tier == raid_tier)
+
+        ledger_classes = ((PointTypes.EP, EffortPointLedgerEntry), (PointTypes.GP, GearPointLedgerEntry))
+        for point_type, ledger_class in ledger_classes:
+            ledger_table = ledger_class.__table__
+            ledger_values = [
+                (ledger_table.c.user_id, cls.user_id),
+                (ledger_table.c.team_id, cls.team_id),
+                (ledger_table.c.raid_tier, cls.raid_tier),
+                (ledger_table.c.point_type, cls.point_type),
+                (ledger_table.c.transaction_type,
+                 literal(PointTransactionTypes.DECAY, type_=ledger_table.c.transaction_type.type)),
+                (ledger_table.c.point_old_value, old_value),
+                (ledger_table.c.point_delta, new_value - old_value),
+                (ledger_table.c.point_new_value, new_value),
+                (ledger_table.c.created_at, func.now()),
+            ]
+            session.execute(ledger_table.insert().from_select(
+                [column for column, _ in ledger_values],
+                select([value for _, value in ledger_values]).where(and_(bucket_filter, cls.point_type == point_type))
+            ))
+
+        return session.query(cls).filter(bucket_filter).update({old_value: new_value}, synchronize_session=False)
+
 
 class EffortPointLedgerEntry(Base):
     __tablename__ = 'effort_point_ledger_entries'
-    id = Column(BigInteger, primary_key=True)
+    id = Column(AutoBigInteger, primary_key=True)
     user_id = Column(BigInteger, ForeignKey('users.id'), nullable=False)
     team_id = Column(Integer, ForeignKey('teams.id'), nullable=False)
     raid_tier = Column(Integer, nullable=False)
-    created_at = Column(DateTime, nullable=False, default=func.now())
+    created_at = Column(DateTime, nullable=False, default=func.now(), server_default=func.now())
     raid_id = Column(Integer, ForeignKey('raids.id'))
     character_id = Column(Integer, ForeignKey('characters.id'))
     transaction_type = Column(Enum(PointTransactionTypes), nullable=False)
@@ -905,15 +1122,18 @@ class EffortPointLedgerEntry(Base):
     __table_args__ = (ForeignKeyConstraint(
         [user_id, team_id, raid_tier, point_type],
         [UserPointBucket.user_id, UserPointBucket.team_id, UserPointBucket.raid_tier, UserPointBucket.point_type]),
+                      Index('ix_ep_ledger_team_tier_user_created_at',
+                            'team_id', 'raid_tier', 'user_id', 'created_at'),
                       {})
 
 
 class GearPointLedgerEntry(Base):
     __tablename__ = 'gear_point_ledger_entries'
-    id = Column(BigInteger, primary_key=True)
+    id = Column(AutoBigInteger, primary_key=True)
     user_id = Column(BigInteger, ForeignKey('users.id'), nullable=False)
     team_id = Column(Integer, ForeignKey('teams.id'), nullable=False)
     raid_tier = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=func.now(), server_default=func.now())
     raid_id = Column(Integer, ForeignKey('raids.id'))
     character_id = Column(Integer, ForeignKey('characters.id'))
     transaction_type = Column(Enum(PointTransactionTypes), nullable=False)
@@ -928,11 +1148,300 @@ class GearPointLedgerEntry(Base):
     team = relationship('Team', viewonly=True)
     raid = relationship('Raid', viewonly=True)
     bucket = relationship('UserPointBucket')
+    __table_args__ = (ForeignKeyConstraint(
+        [user_id, team_id, raid_tier, point_type],
+        [UserPointBucket.user_id, UserPointBucket.team_id, UserPointBucket.raid_tier, UserPointBucket.point_type]),
+                      Index('ix_gp_ledger_team_tier_user_created_at',
+                            'team_id', 'raid_tier', 'user_id', 'created_at'),
+                      {})
+
+
+LEDGER_CLASSES = ((PointTypes.EP, EffortPointLedgerEntry), (PointTypes.GP, GearPointLedgerEntry))
+
+
+class PointBucketCheckpoint(Base):
+    """Ledger-derived balance of a point bucket as of ledger entry ledger_entry_id (inclusive).
+
+    A bucket's first checkpoint takes the running balance recorded on its latest ledger entry, and each later one adds
+    the deltas of the entries since the previous checkpoint. Balances can then be rebuilt from the nearest checkpoint
+    plus the ledger tail after it, instead of from the whole history.
+    """
+    __tablename__ = 'point_bucket_checkpoints'
+    user_id = Column(BigInteger, primary_key=True)
+    team_id = Column(Integer, primary_key=True)
+    raid_tier = Column(Integer, primary_key=True)
+    point_type = Column(Enum(PointTypes), primary_key=True)
+    ledger_entry_id = Column(BigInteger, primary_key=True)
+    balance = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=func.now(), server_default=func.now())
     __table_args__ = (ForeignKeyConstraint(
         [user_id, team_id, raid_tier, point_type],
         [UserPointBucket.user_id, UserPointBucket.team_id, UserPointBucket.raid_tier, UserPointBucket.point_type]),
                       {})
 
+    @classmethod
+    def _tails(cls, session, point_type, ledger_class, through_id=None):
+        """Per bucket of point_type: stored balance, latest checkpoint and the count, delta sum and last id of the
+        ledger entries after it (up to through_id), all in one grouped query."""
+        ledger = ledger_class.__table__
+        latest = session.query(cls.user_id, cls.team_id, cls.raid_tier,
+                               func.max(cls.ledger_entry_id).label('ledger_entry_id')) \
+            .filter(cls.point_type == point_type) \
+            .group_by(cls.user_id, cls.team_id, cls.raid_tier).subquery()
+        checkpoint = aliased(cls)
+        tail_filter = and_(ledger.c.user_id == UserPointBucket.user_id, ledger.c.team_id == UserPointBucket.team_id,
+                           ledger.c.raid_tier == UserPointBucket.raid_tier,
+                           ledger.c.id > func.coalesce(latest.c.ledger_entry_id, 0))
+        if through_id is not None:
+            tail_filter = and_(tail_filter, ledger.c.id <= through_id)
+        return session.query(UserPointBucket.user_id, UserPointBucket.team_id, UserPointBucket.raid_tier,
+                             UserPointBucket.points_column(), checkpoint.ledger_entry_id, checkpoint.balance,
+                             func.count(ledger.c.id), func.sum(ledger.c.point_delta), func.max(ledger.c.id)) \
+            .outerjoin(latest, and_(latest.c.user_id == UserPointBucket.user_id,
+                                    latest.c.team_id == UserPointBucket.team_id,
+                                    latest.c.raid_tier == UserPointBucket.raid_tier)) \
+            .outerjoin(checkpoint, and_(checkpoint.user_id == latest.c.user_id, checkpoint.team_id == latest.c.team_id,
+                                        checkpoint.raid_tier == latest.c.raid_tier,
+                                        checkpoint.point_type == point_type,
+                                        checkpoint.ledger_entry_id == latest.c.ledger_entry_id)) \
+            .outerjoin(ledger, tail_filter) \
+            .filter(UserPointBucket.point_type == point_type) \
+            .group_by(UserPointBucket.user_id, UserPointBucket.team_id, UserPointBucket.raid_tier,
+                      UserPointBucket.points_column(), checkpoint.ledger_entry_id, checkpoint.balance) \
+            .all()
+
+    @classmethod
+    def write(cls, session, settle_seconds=LEDGER_CHECKPOINT_SETTLE_SECONDS):
+        """Checkpoint every bucket with ledger entries since its last checkpoint. Doesn't commit.
+
+        Entries younger than settle_seconds are left for the next run, so a transaction that took its ledger id
+        earlier but commits later can't end up behind a checkpoint.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=settle_seconds)
+        written = 0
+        for point_type, ledger_class in LEDGER_CLASSES:
+            ledger = ledger_class.__table__
+            through_id = session.query(func.max(ledger.c.id)).filter(ledger.c.created_at <= cutoff).scalar()
+            if through_id is None:
+                continue
+            rows = []
+            bootstrap = []
+            for user_id, team_id, raid_tier, stored, checkpoint_id, balance, entries, delta, last_id in \
+                    cls._tails(session, point_type, ledger_class, through_id):
+                if not entries:
+                    continue
+                if checkpoint_id is None:
+                    bootstrap.append(last_id)
+                    continue
+                rows.append({'user_id': user_id, 'team_id': team_id, 'raid_tier': raid_tier, 'point_type': point_type,
+                             'ledger_entry_id': last_id, 'balance': balance + delta})
+            # First checkpoints start from the balance the ledger recorded, as INIT and LOAD entries don't carry it
+            # in their delta
+            for offset in range(0, len(bootstrap), LEDGER_CHECKPOINT_BATCH_SIZE):
+                for user_id, team_id, raid_tier, last_id, balance in session.query(
+                        ledger.c.user_id, ledger.c.team_id, ledger.c.raid_tier, ledger.c.id, ledger.c.point_new_value) \
+                        .filter(ledger.c.id.in_(bootstrap[offset:offset + LEDGER_CHECKPOINT_BATCH_SIZE])):
+                    rows.append({'user_id': user_id, 'team_id': team_id, 'raid_tier': raid_tier,
+                                 'point_type': point_type, 'ledger_entry_id': last_id, 'balance': balance})
+            if rows:
+                session.execute(cls.__table__.insert(), rows)
+            logger.info("Wrote %s %s checkpoints through ledger entry %s", len(rows), point_type.name, through_id)
+            written += len(rows)
+        return written
+
+    @classmethod
+    def verify(cls, session):
+        """Rebuild every checkpointed balance from its latest checkpoint plus the ledger tail and return a BucketDrift
+        for each bucket whose stored balance differs. Buckets without a checkpoint are skipped."""
+        drifts = []
+        unchecked = 0
+        for point_type, ledger_class in LEDGER_CLASSES:
+            for user_id, team_id, raid_tier, stored, checkpoint_id, balance, entries, delta, last_id in \
+                    cls._tails(session, point_type, ledger_class):
+                if checkpoint_id is None:
+                    unchecked += 1
+                    continue
+                expected = balance + (delta or 0)
+                if stored != expected:
+                    drifts.append(BucketDrift(user_id, team_id, raid_tier, point_type, stored, expected))
+        if unchecked:
+            logger.info("%s buckets have no checkpoint yet and weren't verified", unchecked)
+        if drifts:
+            logger.warning("%s point buckets have drifted from their ledger", len(drifts))
+        return drifts
+
+    @classmethod
+    def balance_at(cls, session, user_id, team_id, raid_tier, point_type, ledger_entry_id=None):
+        """Ledger balance of a bucket as of ledger_entry_id (default: latest), from the nearest checkpoint and the
+        tail after it. Returns None if the bucket had no ledger entries by then."""
+        ledger = dict(LEDGER_CLASSES)[point_type].__table__
+        bucket_filter = and_(ledger.c.user_id == user_id, ledger.c.team_id == team_id, ledger.c.raid_tier == raid_tier)
+        if ledger_entry_id is not None:
+            bucket_filter = and_(bucket_filter, ledger.c.id <= ledger_entry_id)
+        checkpoints = session.query(cls.ledger_entry_id, cls.balance) \
+            .filter(cls.user_id == user_id, cls.team_id == team_id, cls.raid_tier == raid_tier,
+                    cls.point_type == point_type)
+        if ledger_entry_id is not None:
+            checkpoints = checkpoints.filter(cls.ledger_entry_id <= ledger_entry_id)
+        checkpoint = checkpoints.order_by(cls.ledger_entry_id.desc()).first()
+        if checkpoint is None:
+            latest = session.query(ledger.c.point_new_value).filter(bucket_filter).order_by(ledger.c.id.desc()).first()
+            return latest[0] if latest else None
+        return checkpoint.balance + session.query(func.coalesce(func.sum(ledger.c.point_delta), 0)) \
+            .filter(bucket_filter, ledger.c.id > checkpoint.ledger_entry_id).scalar()
+
+
+def calculate_pr(ep, gp):
+    return round((ep / gp), 2)
+
+
+def get_pr_standings(session, team, raid_tiers=None, user_ids=None):
+    """Build the EP/GP/PR table for a team in a single pivoted query over point_buckets.
+
+    Returns a dict keyed by raid tier number, each holding a list of PRStanding rows sorted by PR (highest first).
+    raid_tiers defaults to every tier in ActiveRaidTiers; user_ids optionally narrows the table to specific users.
+    """
+    if raid_tiers is None:
+        raid_tiers = [tier_tuple.tier for tier_tuple in ActiveRaidTiers]
+    _points = UserPointBucket.points_column()
+    query = session.query(
+        UserPointBucket.raid_tier,
+        User.id,
+        User.display_name,
+        func.max(case([(UserPointBucket.point_type == PointTypes.EP, _points)])),
+        func.max(case([(UserPointBucket.point_type == PointTypes.GP, _points)]))
+    ) \
+        .join(User, User.id == UserPointBucket.user_id) \
+        .filter(UserPointBucket.team_id == team.id, UserPointBucket.raid_tier.in_(raid_tiers)) \
+        .group_by(UserPointBucket.raid_tier, User.id, User.display_name)
+    if user_ids is not None:
+        query = query.filter(UserPointBucket.user_id.in_(user_ids))
+    return _collect_standings(query.all(), raid_tiers)
+
+
+def _ledger_points_at(ledger_class, team_id, raid_tiers, at, user_ids=None):
+    """Subquery of each bucket's balance at `at`: the running balance on its newest ledger entry up to then, picked
+    with a window function. Served by the (team_id, raid_tier, user_id, created_at) ledger indexes."""
+    ledger = ledger_class.__table__
+    position = func.row_number().over(partition_by=(ledger.c.user_id, ledger.c.raid_tier),
+                                      order_by=(ledger.c.created_at.desc(), ledger.c.id.desc()))
+    query = select([ledger.c.user_id, ledger.c.raid_tier, ledger.c.point_new_value.label('points'),
+                    position.label('position')]) \
+        .where(and_(ledger.c.team_id == team_id, ledger.c.raid_tier.in_(raid_tiers), ledger.c.created_at <= at))
+    if user_ids is not None:
+        query = query.where(ledger.c.user_id.in_(user_ids))
+    ranked = query.subquery()
+    return select([ranked.c.user_id, ranked.c.raid_tier, ranked.c.points]).where(ranked.c.position == 1).subquery()
+
+
+def get_ledger_history_start(session, team, raid_tiers=None):
+    """When a team's GP ledger starts, or None without any GP history. GP entries are only written since the ledger
+    was introduced, so there is nothing trustworthy to read standings from before this."""
+    if raid_tiers is None:
+        raid_tiers = [tier_tuple.tier for tier_tuple in ActiveRaidTiers]
+    return session.query(func.min(GearPointLedgerEntry.created_at)) \
+        .filter(GearPointLedgerEntry.team_id == team.id, GearPointLedgerEntry.raid_tier.in_(raid_tiers)).scalar()
+
+
+def get_pr_standings_at(session, team, at, raid_tiers=None, user_ids=None):
+    """get_pr_standings as of `at`, read from the EP and GP ledgers, as a HistoricalStandings.
+
+    `at` is a naive UTC datetime (e.g. ItemDrop.dropped_at). Ledger created_at stamps are UTC too: sessions are
+    pinned to UTC in create_db_engine, so the database's now() defaults agree with datetime.utcnow().
+
+    When `at` is before history_start the standings are left empty, since the ledgers can't tell what they were.
+    Users with only one of EP or GP history by `at` are listed in incomplete as (raid tier, display name) instead.
+    """
+    if raid_tiers is None:
+        raid_tiers = [tier_tuple.tier for tier_tuple in ActiveRaidTiers]
+    history_start = get_ledger_history_start(session, team, raid_tiers)
+    if history_start is None or at < history_start:
+        return HistoricalStandings({raid_tier: [] for raid_tier in raid_tiers}, history_start, [])
+
+    ep = _ledger_points_at(EffortPointLedgerEntry, team.id, raid_tiers, at, user_ids)
+    gp = _ledger_points_at(GearPointLedgerEntry, team.id, raid_tiers, at, user_ids)
+    bucket_user_id = func.coalesce(ep.c.user_id, gp.c.user_id)
+    query = session.query(func.coalesce(ep.c.raid_tier, gp.c.raid_tier), User.id, User.display_name,
+                          ep.c.points, gp.c.points) \
+        .select_from(ep) \
+        .outerjoin(gp, and_(gp.c.user_id == ep.c.user_id, gp.c.raid_tier == ep.c.raid_tier), full=True) \
+        .join(User, User.id == bucket_user_id)
+    incomplete = []
+    standings = _collect_standings(query.all(), raid_tiers, incomplete)
+    return HistoricalStandings(standings, history_start, incomplete)
+
+
+def _ledger_audit_query(point_type, user_id, team_id):
+    """Select of a user's ledger entries in one team for the audit, with the awarded item's name on GP entries."""
+    ledger = dict(LEDGER_CLASSES)[point_type].__table__
+    if point_type == PointTypes.GP:
+        item_name = Item.__table__.c.name
+        source = ledger.outerjoin(ItemDrop.__table__, ItemDrop.__table__.c.id == ledger.c.item_drop_id) \
+            .outerjoin(Item.__table__, Item.__table__.c.id == ItemDrop.__table__.c.item_id)
+    else:
+        item_name = null()
+        source = ledger
+    return ledger, select([ledger.c.id, ledger.c.created_at, ledger.c.point_type, ledger.c.raid_tier,
+                           ledger.c.transaction_type, ledger.c.point_old_value, ledger.c.point_delta,
+                           ledger.c.point_new_value, ledger.c.raid_id, item_name.label('item_name')]) \
+        .select_from(source) \
+        .where(and_(ledger.c.team_id == team_id, ledger.c.user_id == user_id))
+
+
+def get_ledger_page(session, point_type, user_id, team_id, raid_tier, before=None, after=None,
+                    limit=AUDIT_PAGE_SIZE):
+    """One page of a bucket's ledger, newest first, using (created_at, id) keyset pagination.
+
+    before/after are the (created_at, id) key of an entry; the page holds the `limit` entries just older than before,
+    or just newer than after, or the newest ones when neither is given. Each page is a range scan on the
+    (team_id, raid_tier, user_id, created_at) ledger index however deep into the history it is.
+    """
+    ledger, query = _ledger_audit_query(point_type, user_id, team_id)
+    key = tuple_(ledger.c.created_at, ledger.c.id)
+    query = query.where(ledger.c.raid_tier == raid_tier)
+    if after is not None:
+        query = query.where(key > tuple_(*after)).order_by(ledger.c.created_at, ledger.c.id)
+    else:
+        if before is not None:
+            query = query.where(key < tuple_(*before))
+        query = query.order_by(ledger.c.created_at.desc(), ledger.c.id.desc())
+    entries = session.execute(query.limit(limit + 1)).all()
+    more = len(entries) > limit
+    entries = entries[:limit]
+    if after is not None:
+        return LedgerPage(list(reversed(entries)), more, True)
+    return LedgerPage(entries, before is not None, more)
+
+
+def iter_ledger_entries(session, user_id, team_id, batch_size=AUDIT_EXPORT_BATCH_SIZE):
+    """Yield every EP then GP ledger entry of a user in one team, oldest first per raid tier.
+
+    Rows are streamed through a server-side cursor in batches of batch_size, so the whole history is never held in
+    memory. The session has to stay open until the generator is exhausted.
+    """
+    for point_type, ledger_class in LEDGER_CLASSES:
+        ledger, query = _ledger_audit_query(point_type, user_id, team_id)
+        result = session.execute(query.order_by(ledger.c.raid_tier, ledger.c.created_at, ledger.c.id)
+                                 .execution_options(stream_results=True))
+        for partition in result.partitions(batch_size):
+            for entry in partition:
+                yield entry
+
+
+def _collect_standings(rows, raid_tiers, incomplete=None):
+    standings = {raid_tier: [] for raid_tier in raid_tiers}
+    for raid_tier, user_id, display_name, ep_val, gp_val in rows:
+        if ep_val is None or gp_val is None:
+            if incomplete is None:
+                logger.warning("Skipping incomplete bucket pair for user %s in tier %s", user_id, raid_tier)
+            else:
+                incomplete.append((raid_tier, display_name))
+            continue
+        standings[raid_tier].append(PRStanding(user_id, display_name, ep_val, gp_val, calculate_pr(ep_val, gp_val)))
+    for raid_tier in standings:
+        standings[raid_tier].sort(key=attrgetter('pr'), reverse=True)
+    return standings
+
 
 ###
 #   Begin initializers/seed methods for testing
@@ -2,118 +2,212 @@ import os
 import logging
 import traceback
 import csv
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from requests_oauthlib import OAuth2Session
 from oauthlib.oauth2 import BackendApplicationClient
 from ratelimit import limits, sleep_and_retry
 
 import models
 import constants
-from models import Item, ItemClasses, ItemSubClass
+from models import Item, ItemClasses, ItemSubClass, ItemGearPoints, PointBucketCheckpoint
+from lib import http_cache, catalog, logs
 
 
 
 
 
-FORMAT = '%(asctime)-15s %(message)s'
-logging.basicConfig(format=FORMAT)
 logger = logging.getLogger('argbot.setup')
+response_cache = None
 
 
-def load_subclasses_from_blizzard(db_session, oa_session):
+class LookupFailed(Exception):
+    """A Blizzard lookup that didn't come back 200 or 404 (rate limits, server errors, offline cache misses).
+
+    It fails the whole item batch, so the checkpoint stays before it and a resumed load retries it.
+    """
+
+    def __init__(self, url, status_code):
+        super().__init__("Lookup of " + str(url) + " failed with status " + str(status_code))
+        self.url = url
+        self.status_code = status_code
+
+
+def load_subclasses_from_blizzard(db_session, oa_session, api_url=None):
+    api_url = api_url or get_api_url()
     for item_class in ItemClasses:
-        logger.info("Loading subclasses for " + str(item_class.name))
+        logger.info("Loading subclasses for %s", item_class.name)
         response = blizzard_lookup(oa_session,
-                                   ("https://us.api.blizzard.com/data/wow/item-class/" + str(item_class.value)
+                                   (api_url + "/data/wow/item-class/" + str(item_class.value)
                                     + "?namespace=static-classic-us&locale=en_US"))
         if response.status_code == 200:
             for subclass in response.json()['item_subclasses']:
                 new_subclass = ItemSubClass(item_class=item_class, name=subclass['name'], subclass_id=subclass['id'])
                 db_session.add(new_subclass)
         elif response.status_code == 404:
-            logger.warning("Blizzard API couldn't find item class with id " + str(item_class.value))
+            logger.warning("Blizzard API couldn't find item class with id %s", item_class.value)
     db_session.commit()
 
 
-def load_items_from_blizzard():
-    db_session = models.Session()
+def get_api_url():
+    return os.environ.get('BLIZZARD_API_URL', constants.BLIZZARD_API_URL)
+
+
+def blizzard_session(pool_size=constants.ITEM_LOAD_CONCURRENCY):
     BLIZZARD_API_CLIENT_ID = os.environ.get('BLIZZARD_API_CLIENT_ID')
     BLIZZARD_API_CLIENT_SECRET = os.environ.get('BLIZZARD_API_CLIENT_SECRET')
 
-    blizzard_api_client = BackendApplicationClient(client_id=os.environ.get('BLIZZARD_API_CLIENT_ID'))
+    blizzard_api_client = BackendApplicationClient(client_id=BLIZZARD_API_CLIENT_ID)
     oa_session = OAuth2Session(client=blizzard_api_client)
-    token = oa_session.fetch_token(token_url='https://us.battle.net/oauth/token', client_id=BLIZZARD_API_CLIENT_ID,
-                      client_secret=BLIZZARD_API_CLIENT_SECRET)
-    load_subclasses_from_blizzard(db_session, oa_session)
+    for prefix in ('https://', 'http://'):
+        oa_session.mount(prefix, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+    oa_session.fetch_token(token_url=os.environ.get('BLIZZARD_OAUTH_URL', constants.BLIZZARD_OAUTH_URL),
+                           client_id=BLIZZARD_API_CLIENT_ID,
+                           client_secret=BLIZZARD_API_CLIENT_SECRET)
+    return oa_session
+
+
+def read_checkpoint(checkpoint_path):
+    try:
+        with open(checkpoint_path, mode='rt') as checkpoint_file:
+            return int(checkpoint_file.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(checkpoint_path, line_num):
+    with open(checkpoint_path + '.tmp', mode='wt') as checkpoint_file:
+        checkpoint_file.write(str(line_num))
+    os.replace(checkpoint_path + '.tmp', checkpoint_path)
+
+
+def fetch_item(oa_session, api_url, entry, subclass_ids):
+    """Look up one item and its icon, returning an Item mapping for bulk insert or None if it should be skipped.
+
+    Items Blizzard doesn't know (404) are skipped; any other failure raises LookupFailed.
+    """
+    response = lookup_item(oa_session, entry, api_url=api_url)
+    if response.status_code == 404:
+        logger.warning("Got a 404 for item_list entry %s", entry)
+        return None
+    elif response.status_code != 200:
+        logger.error("Blizzard didn't like something about our request for %s", entry)
+        logger.debug("Response data: %s", response.text)
+        raise LookupFailed("item " + str(entry), response.status_code)
+
+    data = response.json()
+    try:
+        if data['item_class']['name'] not in set(itemclass.name for itemclass in ItemClasses):
+            logger.warning("Skipping item %s because of unknown class name %s", data['id'], data['item_class']['name'])
+            return None
+        item_class = ItemClasses[data['item_class']['name']]
+        if (item_class, data['item_subclass']['id']) not in subclass_ids:
+            raise ValueError("Unknown subclass " + str(data['item_subclass']['id']) + " for " + item_class.name)
+        return {
+            'id': data['id'],
+            'name': data['name'],
+            'item_level': data['level'],
+            'required_level': data['required_level'],
+            'icon_url': get_item_media_url(oa_session, data['media']['key']['href']),
+            'item_class': item_class,
+            'item_subclass_id': data['item_subclass']['id'],
+            'quality': data['quality']['name'],
+            'inventory_type': data['inventory_type']['type'],
+            'inventory_type_name': data['inventory_type'].get('name'),
+            'max_count': data['max_count']
+        }
+    except Exception as e:
+        logger.error("Failed to process item %s", entry)
+        logger.debug("Item contents: %s", data)
+        raise
+
+
+def load_item_batch(db_session, oa_session, pool, api_url, entries, subclass_ids):
+    results = pool.map(lambda entry: fetch_item(oa_session, api_url, entry, subclass_ids), entries)
+    mappings = [mapping for mapping in results if mapping is not None]
+    if mappings:
+        existing_ids = set(item_id for (item_id,) in db_session.query(Item.id)
+                           .filter(Item.id.in_([mapping['id'] for mapping in mappings])).all())
+        db_session.bulk_insert_mappings(Item, [mapping for mapping in mappings if mapping['id'] not in existing_ids])
+    db_session.commit()
+    return len(mappings)
+
+
+def load_items_from_blizzard(api_url=None, item_list='data/dedupe_items.csv',
+                             checkpoint_path=constants.ITEM_LOAD_CHECKPOINT_FILE,
+                             concurrency=constants.ITEM_LOAD_CONCURRENCY):
+    """Load every item in item_list from the Blizzard API, keeping up to `concurrency` lookups in flight.
+
+    Items are inserted in ITEM_LOAD_BATCH_SIZE chunks and the CSV line of each committed chunk is checkpointed, so an
+    interrupted load resumes after the last committed chunk. The checkpoint is ignored when the items table is empty.
+    A failed lookup in a chunk stops the load before that chunk is committed or checkpointed, and raises.
+    """
+    global response_cache
+    api_url = api_url or get_api_url()
+    db_session = models.Session()
+    response_cache = response_cache or http_cache.from_env()
+    if response_cache is not None and response_cache.offline:
+        logger.warning("BLIZZARD_OFFLINE detected: serving item data from %s only", response_cache.path)
+        oa_session = None
+    else:
+        oa_session = blizzard_session(pool_size=concurrency)
 
     try:
-        with open('data/dedupe_items.csv', mode='rt', buffering=1) as listfile:
+        if db_session.query(ItemSubClass).count() == 0:
+            load_subclasses_from_blizzard(db_session, oa_session, api_url)
+        subclass_ids = set(db_session.query(ItemSubClass.item_class, ItemSubClass.subclass_id).all())
+
+        resume_after = 0
+        if db_session.query(Item.id).first() is not None:
+            resume_after = read_checkpoint(checkpoint_path)
+            logger.info("Resuming item load after line %s", resume_after)
+
+        loaded = 0
+        with open(item_list, mode='rt', buffering=1) as listfile, ThreadPoolExecutor(max_workers=concurrency) as pool:
             reader = csv.DictReader(listfile, delimiter=',')
+            entries = []
             for row in reader:
-                logger.debug("Processing row of :" + str(row))
-                response = lookup_item(oa_session, row['entry'])
-                if response.status_code == 200:
-                    try:
-                        data = response.json()
-                        logger.info('Got an item')
-                        #pprint.pprint(data)
-                        if data['item_class']['name'] in set(itemclass.name for itemclass in ItemClasses):
-                            media_url = get_item_media_url(oa_session, data['media']['key']['href'])
-                            itemsubclass = db_session.query(ItemSubClass)\
-                                .filter(ItemSubClass.item_class == ItemClasses[data['item_class']['name']])\
-                                .filter(ItemSubClass.subclass_id == data['item_subclass']['id'])\
-                                .one()
-                            if data['inventory_type'].get('name'):
-                                _inventory_type_name = data['inventory_type']['name']
-                            else:
-                                _inventory_type_name = None
-                            new_item = Item(
-                                id=data['id'],
-                                name=data['name'],
-                                item_level=data['level'],
-                                required_level=data['required_level'],
-                                icon_url=media_url,
-                                item_class=ItemClasses[data['item_class']['name']],
-                                item_subclass=itemsubclass,
-                                quality=data['quality']['name'],
-                                inventory_type=data['inventory_type']['type'],
-                                inventory_type_name=_inventory_type_name,
-                                max_count=data['max_count'])
-                            db_session.add(new_item)
-                        else:
-                            logger.warning("Skipping item " + str(data['id']) + " because of unknown class name " + data['item_class']['name'])
-                    except Exception as e:
-                        logger.error("Failed to process item " + str(row['entry']))
-                        logger.error(traceback.format_exc())
-                        logger.debug("Item contents (if we got a response): " + str(data))
-                        raise
-
-                elif response.status_code == 404:
-                    logger.warning("Got a 404 for item_list entry " + str(row))
-                else:
-                    logger.error("Blizzard didn't like something about our request for " + str(row))
-                    logger.debug("Response data: " + str(data))
-                if reader.line_num % constants.ITEM_LOAD_BATCH_SIZE == 0:
-                    logger.info("Committing batch at " + str(reader.line_num))
-                    db_session.commit()
-
-            db_session.commit()
+                if reader.line_num <= resume_after:
+                    continue
+                entries.append(row['entry'])
+                if len(entries) == constants.ITEM_LOAD_BATCH_SIZE:
+                    loaded += load_item_batch(db_session, oa_session, pool, api_url, entries, subclass_ids)
+                    write_checkpoint(checkpoint_path, reader.line_num)
+                    logger.info("Committed batch at %s", reader.line_num)
+                    entries = []
+            if entries:
+                loaded += load_item_batch(db_session, oa_session, pool, api_url, entries, subclass_ids)
+                write_checkpoint(checkpoint_path, reader.line_num)
+        logger.info("Finished item load with %s items", loaded)
+        ItemGearPoints.recompute(db_session)
+        db_session.commit()
+        if response_cache is not None:
+            logger.info("Response cache stats: %s", response_cache.stats())
+        return loaded
     except Exception as e:
-        logger.error("Failed to load items because" + str(e))
+        logger.error("Failed to load items because %s", e)
         logger.error(traceback.format_exc())
         db_session.rollback()
+        raise
     finally:
         db_session.close()
 
 
+def blizzard_lookup(oa_session, url):
+    if response_cache is None:
+        return fetch_from_blizzard(oa_session, url)
+    return response_cache.fetch(url, lambda url, headers: fetch_from_blizzard(oa_session, url, headers))
+
 
 @sleep_and_retry
 @limits(calls=95, period=1)
-def blizzard_lookup(oa_session, url):
-    return oa_session.get(url)
+def fetch_from_blizzard(oa_session, url, headers=None):
+    return oa_session.get(url, headers=headers)
 
-def lookup_item(oa_session, item_id):
+def lookup_item(oa_session, item_id, api_url=None):
     response = blizzard_lookup(oa_session=oa_session,
-                               url=("https://us.api.blizzard.com/data/wow/item/" + str(item_id)
+                               url=((api_url or get_api_url()) + "/data/wow/item/" + str(item_id)
                                     + "?namespace=static-classic-us&locale=en_US")
                                )
     return response
@@ -129,17 +223,134 @@ def get_item_media_url(oa_session, href):
             logger.warning("No media returned.")
             url = None
     elif response.status_code == 404:
-        logger.warning("Got 404 on item media for: " + str(href))
+        logger.warning("Got 404 on item media for: %s", href)
         url = None
     else:
-        logger.error("Failed to retrieve media url for " + str(href))
-        logger.debug("Response data: " + str(response))
-        raise ValueError
+        logger.error("Failed to retrieve media url for %s", href)
+        logger.debug("Response data: %s", response.text)
+        raise LookupFailed(href, response.status_code)
     return url
 
+def get_snapshot_path():
+    return os.environ.get('ITEM_SNAPSHOT_FILE', constants.ITEM_SNAPSHOT_FILE)
+
+
+def export_items_snapshot(path=None):
+    db_session = models.Session()
+    try:
+        return catalog.export_snapshot(db_session, path or get_snapshot_path())
+    finally:
+        db_session.close()
+
+
+def load_items_from_snapshot(path=None, diff=None):
+    """Load the item catalog from a snapshot, diffing against existing items unless the table is empty."""
+    db_session = models.Session()
+    try:
+        if diff is None:
+            diff = db_session.query(Item.id).first() is not None
+        result = catalog.import_snapshot(db_session, path or get_snapshot_path(), diff=diff)
+        ItemGearPoints.recompute(db_session)
+        db_session.commit()
+        return result
+    except Exception as e:
+        logger.error("Failed to load item snapshot because %s", e)
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+
+
+def recompute_item_gp():
+    db_session = models.Session()
+    try:
+        count = ItemGearPoints.recompute(db_session)
+        db_session.commit()
+        return count
+    except Exception as e:
+        logger.error("Failed to recompute item GP because %s", e)
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+
+
+def check_item_gp():
+    db_session = models.Session()
+    try:
+        mismatches = ItemGearPoints.verify(db_session)
+        missing = sorted(set(item_id for item_id, role, stored_gp, expected_gp in mismatches if stored_gp is None))
+        if missing:
+            logger.warning("%s items have no precomputed GP, run --recompute-gp to add them: %s", len(missing),
+                           missing[:20])
+        for item_id, role, stored_gp, expected_gp in [mismatch for mismatch in mismatches
+                                                       if mismatch[2] is not None][:20]:
+            logger.warning("Item %s role %s has GP %s, expected %s", item_id, role, stored_gp, expected_gp)
+        return mismatches
+    finally:
+        db_session.close()
+
+
+def checkpoint_ledgers():
+    db_session = models.Session()
+    try:
+        written = PointBucketCheckpoint.write(db_session)
+        db_session.commit()
+        return written
+    except Exception as e:
+        logger.error("Failed to checkpoint ledgers because %s", e)
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+
+
+def verify_ledgers():
+    db_session = models.Session()
+    try:
+        drifts = PointBucketCheckpoint.verify(db_session)
+        for drift in drifts[:20]:
+            logger.warning("Bucket %s/%s/%s %s holds %s, ledger says %s", drift.user_id, drift.team_id,
+                           drift.raid_tier, drift.point_type.name, drift.stored, drift.expected)
+        return drifts
+    finally:
+        db_session.close()
+
 
 if __name__ == "__main__":
-    logger.setLevel(10)  # https://docs.python.org/2/library/logging.html#levels
+    logs.configure(default_level='DEBUG')
+    parser = argparse.ArgumentParser(description="Initialize the database and item catalog")
+    parser.add_argument('--export-snapshot', metavar='PATH', nargs='?', const='',
+                        help="write the loaded item catalog to a snapshot and exit")
+    parser.add_argument('--import-snapshot', metavar='PATH', nargs='?', const='',
+                        help="load the item catalog from a snapshot and exit")
+    parser.add_argument('--diff', action='store_true', help="only apply new and changed items from the snapshot")
+    parser.add_argument('--recompute-gp', action='store_true',
+                        help="rebuild the item GP table from the formula and exit")
+    parser.add_argument('--check-gp', action='store_true',
+                        help="compare the item GP table against the formula and exit non-zero on mismatches")
+    parser.add_argument('--checkpoint-ledgers', action='store_true',
+                        help="write point bucket checkpoints from the EP/GP ledgers and exit")
+    parser.add_argument('--verify-ledgers', action='store_true',
+                        help="compare point buckets against their ledgers and exit non-zero on drift")
+    args = parser.parse_args()
+    if args.recompute_gp:
+        recompute_item_gp()
+        raise SystemExit
+    if args.check_gp:
+        raise SystemExit(1 if check_item_gp() else 0)
+    if args.checkpoint_ledgers:
+        checkpoint_ledgers()
+        raise SystemExit
+    if args.verify_ledgers:
+        raise SystemExit(1 if verify_ledgers() else 0)
+    if args.export_snapshot is not None:
+        export_items_snapshot(args.export_snapshot or None)
+        raise SystemExit
+    if args.import_snapshot is not None:
+        load_items_from_snapshot(args.import_snapshot or None, diff=args.diff or None)
+        raise SystemExit
+
     if os.environ.get('INIT_ARG_DB') == "TRUE":
         logger.warning("INIT_ARG_DB detected: Initializing database")
         if os.environ.get('ENVIRONMENT') != 'production':
@@ -162,6 +373,8 @@ if __name__ == "__main__":
 
     if os.environ.get('FULL_ITEM_LOAD') == "TRUE":
         load_items_from_blizzard()
+    elif os.path.exists(get_snapshot_path()):
+        load_items_from_snapshot()
     #else:
         #models.seedItems()
 
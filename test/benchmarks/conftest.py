@@ -0,0 +1,128 @@
+import os
+import sys
+import json
+import time
+import statistics
+import subprocess
+from datetime import datetime
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('ENVIRONMENT', 'test')
+os.environ.setdefault('DISCORD_BOT_TOKEN', 'benchmark')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from sqlalchemy import event
+import models
+import synthetic
+from lib import logs
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+DEFAULT_ROUNDS = int(os.environ.get('BENCH_ROUNDS', 10))
+# A benchmark is reported as a regression when its median grows by more than this factor
+REGRESSION_TOLERANCE = float(os.environ.get('BENCHMARK_TOLERANCE', 1.25))
+
+_results = {}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+class QueryCounter():
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'after_cursor_execute', self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+@pytest.fixture(scope='session')
+def guild():
+    logs.configure()
+    started = time.perf_counter()
+    summary = synthetic.build_guild(synthetic.size_from_env())
+    summary['build_seconds'] = round(time.perf_counter() - started, 2)
+    _results['_guild'] = summary['size']
+    return summary
+
+
+@pytest.fixture(scope='session')
+def query_counter():
+    return QueryCounter(models.engine)
+
+
+@pytest.fixture
+def bench(request, query_counter):
+    """Time func over a number of rounds and record min/median/mean/max and queries per round for the JSON report.
+
+    setup(round_number), when given, runs untimed before each round and returns the positional args for func.
+    """
+    def run(func, *args, rounds=DEFAULT_ROUNDS, setup=None, **kwargs):
+        timings = []
+        queries = []
+        result = None
+        for round_number in range(rounds):
+            call_args = setup(round_number) if setup else args
+            queries_before = query_counter.count
+            started = time.perf_counter()
+            result = func(*call_args, **kwargs)
+            timings.append(time.perf_counter() - started)
+            queries.append(query_counter.count - queries_before)
+        _results[request.node.name] = {
+            'rounds': rounds,
+            'min_ms': round(min(timings) * 1000, 3),
+            'median_ms': round(statistics.median(timings) * 1000, 3),
+            'mean_ms': round(statistics.mean(timings) * 1000, 3),
+            'max_ms': round(max(timings) * 1000, 3),
+            'queries': round(statistics.median(queries), 1)
+        }
+        return result
+    return run
+
+
+def pytest_sessionfinish(session, exitstatus):
+    benchmarks = dict((name, result) for name, result in _results.items() if not name.startswith('_'))
+    if not benchmarks:
+        return
+    commit = git_commit()
+    path = os.environ.get('BENCHMARK_RESULTS') or os.path.join(RESULTS_DIR, commit + '.json')
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as results_file:
+        json.dump({'commit': commit, 'created_at': datetime.utcnow().isoformat(), 'guild': _results.get('_guild'),
+                   'benchmarks': benchmarks}, results_file, indent=2, sort_keys=True)
+    session.config._benchmark_results_path = path
+
+
+def pytest_terminal_summary(terminalreporter):
+    path = getattr(terminalreporter.config, '_benchmark_results_path', None)
+    if path is None:
+        return
+    with open(path) as results_file:
+        current = json.load(results_file)
+    baseline = {}
+    if os.environ.get('BENCHMARK_COMPARE'):
+        with open(os.environ['BENCHMARK_COMPARE']) as baseline_file:
+            baseline = json.load(baseline_file)['benchmarks']
+
+    terminalreporter.section('benchmarks')
+    terminalreporter.write_line("{:<28} {:>10} {:>10} {:>8} {:>10}".format('name', 'median ms', 'min ms', 'queries',
+                                                                          'vs base'))
+    for name, result in sorted(current['benchmarks'].items()):
+        change = ''
+        previous = baseline.get(name)
+        if previous and previous['median_ms']:
+            ratio = result['median_ms'] / previous['median_ms']
+            change = str(round(ratio, 2)) + 'x'
+            if ratio > REGRESSION_TOLERANCE or result['queries'] > previous['queries']:
+                change += ' REGRESSED'
+        terminalreporter.write_line("{:<28} {:>10} {:>10} {:>8} {:>10}".format(
+            name[:28], result['median_ms'], result['min_ms'], result['queries'], change))
+    terminalreporter.write_line('Results written to ' + path)
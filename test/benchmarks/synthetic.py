@@ -0,0 +1,154 @@
+import os
+import random
+from collections import namedtuple
+from datetime import datetime, timedelta
+import models
+from models import Spec, Team, Raid, User, Character, Signup, Item, ItemSubClass, ItemGearPoints, ItemDrop, \
+    ItemDropBid, UserPointBucket, EffortPointLedgerEntry, GearPointLedgerEntry, PointTypes, PointTransactionTypes, \
+    RaidZone, ItemClasses, WeaponSubclasses, ArmorSubclasses, roster_table
+
+GuildSize = namedtuple('GuildSize', 'users characters_per_user raids signups_per_raid items drops bids_per_drop '
+                                    'ledger_rows_per_user')
+DEFAULT_SIZE = GuildSize(users=300, characters_per_user=2, raids=20, signups_per_raid=40, items=500, drops=40,
+                         bids_per_drop=15, ledger_rows_per_user=40)
+
+USER_ID_BASE = 100000
+RAID_TIERS = range(5)
+RAID_ZONES = [RaidZone.MC, RaidZone.BWL]
+ITEM_SHAPES = [
+    (ItemClasses.Weapon, WeaponSubclasses.Sword.value, 'One-Hand'),
+    (ItemClasses.Weapon, WeaponSubclasses.Staff.value, 'Two-Hand'),
+    (ItemClasses.Weapon, WeaponSubclasses.Bow.value, 'Ranged'),
+    (ItemClasses.Armor, ArmorSubclasses.Plate.value, 'Chest'),
+    (ItemClasses.Armor, ArmorSubclasses.Cloth.value, 'Head'),
+    (ItemClasses.Armor, ArmorSubclasses.Leather.value, 'Hands'),
+    (ItemClasses.Armor, ArmorSubclasses.Mail.value, 'Wrist'),
+    (ItemClasses.Armor, ArmorSubclasses.Shield.value, 'Off Hand'),
+    (ItemClasses.Armor, ArmorSubclasses.Libram.value, 'Relic'),
+]
+
+
+def size_from_env(default=DEFAULT_SIZE):
+    """Override any GuildSize field with a BENCH_<FIELD> environment variable, e.g. BENCH_USERS=2000."""
+    return default._replace(**dict((field, int(os.environ['BENCH_' + field.upper()]))
+                                   for field in default._fields if 'BENCH_' + field.upper() in os.environ))
+
+
+def display_name(index):
+    return 'Raider%05d' % index
+
+
+def character_name(user_index, slot):
+    return 'Toon%05d%s' % (user_index, chr(ord('a') + slot))
+
+
+def build_guild(size=DEFAULT_SIZE, seed=1):
+    """Create the schema and fill it with a synthetic guild of the given size, returning a summary dict.
+
+    Everyone is rostered on the Aesir team with EP/GP buckets for every tier. Raids are open (started in the past,
+    ending in the future) with confirmed signups, and every drop carries bids from that raid's signups, so awards and
+    bid prioritization hit the same code paths they do in production. Bulk rows go in with Core executemany.
+    """
+    rng = random.Random(seed)
+    models.Base.metadata.create_all(models.engine)
+    models.seedSpecs()
+    models.seedTeams()
+    models.seedRewardSchedules()
+    models.seedSubclasses()
+
+    session = models.Session()
+    try:
+        team = session.query(Team).filter(Team.name == 'Aesir').one()
+        spec_ids = [spec_id for (spec_id,) in session.query(Spec.id).order_by(Spec.id)]
+        now = datetime.utcnow()
+
+        user_ids = [USER_ID_BASE + index for index in range(size.users)]
+        session.execute(User.__table__.insert(), [
+            {'id': user_id, 'name': 'raider' + str(index), 'display_name': display_name(index)}
+            for index, user_id in enumerate(user_ids)])
+
+        characters = []
+        for index, user_id in enumerate(user_ids):
+            for slot in range(size.characters_per_user):
+                characters.append({'id': len(characters) + 1, 'user_id': user_id,
+                                   'name': character_name(index, slot), 'spec_id': rng.choice(spec_ids)})
+        session.execute(Character.__table__.insert(), characters)
+        session.execute(roster_table.insert(), [{'team_id': team.id, 'character_id': character['id']}
+                                                for character in characters])
+        main_character = dict((character['user_id'], character['id']) for character in reversed(characters))
+
+        points = UserPointBucket.points_column().key
+        session.execute(UserPointBucket.__table__.insert(), [
+            {'team_id': team.id, 'raid_tier': tier, 'user_id': user_id, 'point_type': point_type,
+             points: rng.randint(0, 5000) if point_type == PointTypes.EP else rng.randint(models.BASE_GP, 3000)}
+            for user_id in user_ids for tier in RAID_TIERS for point_type in PointTypes])
+
+        for ledger_class, point_type in ((EffortPointLedgerEntry, PointTypes.EP), (GearPointLedgerEntry, PointTypes.GP)):
+            rows = []
+            for user_id in user_ids:
+                for entry in range(size.ledger_rows_per_user // 2):
+                    delta = rng.randint(1, 200)
+                    rows.append({'user_id': user_id, 'team_id': team.id, 'raid_tier': rng.choice((1, 2)),
+                                 'point_type': point_type, 'transaction_type': PointTransactionTypes.GRANT,
+                                 'character_id': main_character[user_id],
+                                 'created_at': now - timedelta(hours=rng.randint(1, 24 * 180)),
+                                 'point_old_value': 0, 'point_delta': delta, 'point_new_value': delta})
+            if rows:
+                session.execute(ledger_class.__table__.insert(), rows)
+
+        session.execute(Item.__table__.insert(), [
+            {'id': 50000 + index, 'name': 'Synthetic Item %04d' % index, 'item_level': rng.randint(60, 90),
+             'required_level': 60, 'icon_url': '', 'item_class': item_class, 'item_subclass_id': subclass_id,
+             'quality': rng.choice(('Epic', 'Epic', 'Rare', 'Legendary')), 'inventory_type': inventory_type_name,
+             'inventory_type_name': inventory_type_name, 'max_count': 1}
+            for index, (item_class, subclass_id, inventory_type_name) in
+            ((index, ITEM_SHAPES[index % len(ITEM_SHAPES)]) for index in range(size.items))])
+        ItemGearPoints.recompute(session)
+
+        raids = []
+        for index in range(size.raids):
+            raid = Raid(team=team, zone=RAID_ZONES[index % len(RAID_ZONES)], starts_at=now - timedelta(hours=1),
+                        ends_at=now + timedelta(days=1), notes='Synthetic raid ' + str(index),
+                        created_by_id=user_ids[0], is_started=True)
+            session.add(raid)
+            raids.append(raid)
+        session.flush()
+
+        raid_signups = {}
+        signups = []
+        for raid in raids:
+            raid_signups[raid.id] = rng.sample(user_ids, min(size.signups_per_raid, len(user_ids)))
+            for user_id in raid_signups[raid.id]:
+                signups.append({'user_id': user_id, 'character_id': main_character[user_id], 'raid_id': raid.id,
+                                'signup_at': now - timedelta(hours=2), 'is_confirmed': True, 'confirmed_at': now,
+                                'is_ejected': False, 'is_rescinded': False})
+        if signups:
+            session.execute(Signup.__table__.insert(), signups)
+
+        drops = []
+        for index in range(size.drops):
+            raid = raids[index % len(raids)]
+            drop = ItemDrop(item_id=50000 + rng.randrange(size.items), raid=raid, created_by_id=user_ids[0],
+                            dropped_at=now, is_awarded=False)
+            session.add(drop)
+            drops.append(drop)
+        session.flush()
+
+        bids = []
+        for drop in drops:
+            for user_id in rng.sample(raid_signups[drop.raid_id], min(size.bids_per_drop,
+                                                                      len(raid_signups[drop.raid_id]))):
+                choice = rng.randrange(3)
+                bids.append({'drop_id': drop.id, 'user_id': user_id, 'character_id': main_character[user_id],
+                             'bid_100': choice == 0, 'bid_25': choice == 1, 'bid_0': choice == 2})
+        if bids:
+            session.execute(ItemDropBid.__table__.insert(), bids)
+
+        session.commit()
+        return {'team_id': team.id, 'raid_ids': [raid.id for raid in raids], 'drop_ids': [drop.id for drop in drops],
+                'user_ids': user_ids, 'size': size._asdict(), 'seed': seed}
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
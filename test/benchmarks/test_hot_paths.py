@@ -0,0 +1,68 @@
+import pytest
+import models
+import synthetic
+from models import Team, Raid, ItemDrop
+from lib.helpers import search_user
+
+
+@pytest.fixture(scope='module')
+def bot():
+    # bot.py needs discord.py and apscheduler installed, but nothing connects at import time
+    return pytest.importorskip('bot')
+
+
+@pytest.fixture
+def session(guild):
+    session = models.Session()
+    yield session
+    session.close()
+
+
+def award_drop(drop, session):
+    drop.award(session)
+    session.commit()
+
+
+def test_search_user_by_name(bench, guild, session):
+    user = bench(search_user, session, synthetic.display_name(len(guild['user_ids']) // 2))
+    assert user.id == guild['user_ids'][len(guild['user_ids']) // 2]
+
+
+def test_search_user_by_character(bench, guild, session):
+    user = bench(search_user, session, synthetic.character_name(len(guild['user_ids']) - 1, 0))
+    assert user.id == guild['user_ids'][-1]
+
+
+def test_generate_pr_embed(bench, guild, session, bot):
+    team = session.query(Team).get(guild['team_id'])
+    embed = bench(bot.generate_pr_embed, session, team)
+    assert len(embed.fields) == 3 * len(models.ActiveRaidTiers)
+
+
+def test_generate_raid_embed(bench, guild, session, bot):
+    raid = session.query(Raid).get(guild['raid_ids'][0])
+    assert bench(bot.generate_raid_embed, session, raid) is not None
+
+
+def test_generate_drop_embed(bench, guild, session, bot):
+    # The last drop is never awarded by test_item_drop_award, so every round renders the open bid lists
+    drop = session.query(ItemDrop).get(guild['drop_ids'][-1])
+    assert bench(bot.generate_drop_embed, session, drop) is not None
+
+
+def test_raid_reward(bench, guild, session):
+    raid = session.query(Raid).get(guild['raid_ids'][1 % len(guild['raid_ids'])])
+    rewarded = bench(raid.reward, setup=lambda round_number: (session, (raid.last_reward_tick or 0) + 1))
+    assert rewarded == guild['size']['signups_per_raid']
+
+
+def test_item_drop_award(bench, guild, session):
+    drop_ids = guild['drop_ids'][:-1]
+    bench(award_drop, rounds=min(len(drop_ids), 10),
+          setup=lambda round_number: (session.query(ItemDrop).get(drop_ids[round_number]), session))
+    assert session.query(ItemDrop).get(drop_ids[0]).is_awarded
+
+
+def test_process_decayall(bench, guild, session, bot):
+    touched, elapsed = bench(bot.process_decayall, session, rounds=3)
+    assert touched == len(guild['user_ids']) * len(models.ActiveRaidTiers) * 2
@@ -0,0 +1,50 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('ENVIRONMENT', 'test')
+os.environ.setdefault('DISCORD_BOT_TOKEN', 'test')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import pytest
+import models
+from models import Team, User, UserPointBucket, PointTypes
+
+
+@pytest.fixture
+def session():
+    """A session on a freshly created and seeded test database, dropped again afterwards.
+
+    The test engine is one shared in-memory SQLite database, so anything left by the benchmark guild is dropped first.
+    """
+    models.Base.metadata.drop_all(models.engine)
+    models.Base.metadata.create_all(models.engine)
+    models.seedTeams()
+    models.seedRewardSchedules()
+    session = models.Session()
+    yield session
+    session.close()
+    models.Base.metadata.drop_all(models.engine)
+
+
+@pytest.fixture
+def team(session):
+    return session.query(Team).filter(Team.name == 'Aesir').one()
+
+
+@pytest.fixture
+def make_user(session, team):
+    """make_user(user_id, ep, gp, raid_tier=1) adds a user with loaded EP and GP buckets in the fixture team."""
+    def make(user_id, ep, gp, raid_tier=1, display_name=None):
+        user = session.query(User).get(user_id)
+        if user is None:
+            user = User(id=user_id, name='user' + str(user_id), display_name=display_name or 'User' + str(user_id))
+            session.add(user)
+        for point_type, value in ((PointTypes.EP, ep), (PointTypes.GP, gp)):
+            bucket = UserPointBucket(user=user, team=team, raid_tier=raid_tier, point_type=point_type)
+            session.add(bucket)
+            bucket.init_points(session)
+            bucket.load_points(session, value)
+        session.commit()
+        return user
+    return make
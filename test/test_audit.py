@@ -0,0 +1,105 @@
+import csv
+import io
+from datetime import datetime, timedelta
+import pytest
+import models
+from models import UserPointBucket, EffortPointLedgerEntry, GearPointLedgerEntry, PointTypes, Raid, RaidZone, Item, \
+    ItemDrop, ItemClasses, WeaponSubclasses
+from lib.audit import AuditPages, AuditView, page_view, export_ledger_csv
+
+START = datetime(2021, 3, 1, 20, 0)
+
+
+def bucket(session, point_type):
+    return session.query(UserPointBucket).filter(UserPointBucket.user_id == 1,
+                                                 UserPointBucket.point_type == point_type).one()
+
+
+@pytest.fixture
+def ledger(session, team, make_user):
+    """User 1 with nine EP entries, an hour apart except for the last five which share a timestamp so a page boundary
+    falls among them, and a GP award for a dropped item."""
+    make_user(1, 0, 200)
+    effort = bucket(session, PointTypes.EP)
+    for _ in range(7):
+        effort.grant_points(session, 10)
+    for position, entry in enumerate(session.query(EffortPointLedgerEntry).order_by(EffortPointLedgerEntry.id)):
+        entry.created_at = START + timedelta(hours=min(position, 4))
+
+    raid = Raid(team=team, zone=RaidZone.MC, starts_at=START, ends_at=START + timedelta(minutes=90))
+    session.add(Item(id=1, name='Test Item', item_class=ItemClasses.Weapon,
+                     item_subclass_id=WeaponSubclasses.Sword.value))
+    drop = ItemDrop(item_id=1, raid=raid, dropped_at=START, created_by_id=1)
+    session.add(drop)
+    session.commit()
+    bucket(session, PointTypes.GP).grant_points(session, 50, raid=raid, item_drop=drop)
+    return session
+
+
+def ep_ids(session):
+    return [entry_id for (entry_id,) in session.query(EffortPointLedgerEntry.id)
+            .order_by(EffortPointLedgerEntry.created_at.desc(), EffortPointLedgerEntry.id.desc())]
+
+
+def key(entry):
+    return entry.created_at, entry.id
+
+
+def page(session, team, **kwargs):
+    return models.get_ledger_page(session, PointTypes.EP, 1, team.id, 1, limit=4, **kwargs)
+
+
+def test_paging_older_visits_every_entry_once(ledger, team):
+    pages = [page(ledger, team)]
+    while pages[-1].has_older:
+        pages.append(page(ledger, team, before=key(pages[-1].entries[-1])))
+
+    assert [len(each.entries) for each in pages] == [4, 4, 1]
+    assert [entry.id for each in pages for entry in each.entries] == ep_ids(ledger)
+    assert [each.has_newer for each in pages] == [False, True, True]
+
+
+def test_paging_newer_returns_the_same_pages(ledger, team):
+    newest = page(ledger, team)
+    middle = page(ledger, team, before=key(newest.entries[-1]))
+    oldest = page(ledger, team, before=key(middle.entries[-1]))
+
+    back = page(ledger, team, after=key(oldest.entries[0]))
+    assert [entry.id for entry in back.entries] == [entry.id for entry in middle.entries]
+    assert back.has_newer and back.has_older
+    back = page(ledger, team, after=key(back.entries[0]))
+    assert [entry.id for entry in back.entries] == [entry.id for entry in newest.entries]
+    assert not back.has_newer
+
+
+def test_page_view_keeps_the_shown_keys(ledger, team):
+    view = AuditView(1, 1, 'User1', 1, 'Aesir', 1, 'Tier 1', PointTypes.EP, None, None, False, False)
+    shown = page(ledger, team)
+    view = page_view(view, shown)
+    assert view.newest == key(shown.entries[0]) and view.oldest == key(shown.entries[-1])
+    assert view.has_older and not view.has_newer
+
+
+def test_iter_ledger_entries_streams_everything_in_order(ledger, team):
+    entries = list(models.iter_ledger_entries(ledger, 1, team.id, batch_size=2))
+    ep_entries = [entry.id for entry in entries if entry.point_type == PointTypes.EP]
+    assert ep_entries == list(reversed(ep_ids(ledger)))
+    assert len(entries) == ledger.query(EffortPointLedgerEntry).count() + ledger.query(GearPointLedgerEntry).count()
+
+
+def test_export_writes_every_entry_with_item_names(ledger, team):
+    export = export_ledger_csv(ledger, 1, team.id)
+    rows = list(csv.DictReader(io.TextIOWrapper(export, encoding='utf-8', newline='')))
+    export.close()
+
+    assert len(rows) == 9 + ledger.query(GearPointLedgerEntry).count()
+    assert [row['item_name'] for row in rows if row['point_type'] == 'GP'][-1] == 'Test Item'
+    assert rows[0]['created_at'] == START.isoformat()
+
+
+def test_audit_pages_drop_the_oldest_views():
+    pages = AuditPages(capacity=2)
+    assert pages.remember(10, 'first') == []
+    assert pages.remember(11, 'second') == []
+    assert pages.remember(12, 'third') == [10]
+    assert pages.get(10) is None and pages.get(12) == 'third'
@@ -0,0 +1,64 @@
+import gzip
+import pytest
+import models
+from models import Item, ItemSubClass, ItemClasses, WeaponSubclasses
+from lib.catalog import export_snapshot, import_snapshot, read_snapshot, SnapshotError
+
+
+def item_rows(session):
+    session.expire_all()
+    return [(item.id, item.name, item.item_class, item.item_subclass_id, item.icon_url)
+            for item in session.query(Item).order_by(Item.id)]
+
+
+@pytest.fixture
+def catalog(session):
+    models.seedSubclasses()
+    session.add_all([Item(id=item_id, name='Item ' + str(item_id), item_class=ItemClasses.Weapon,
+                          item_subclass_id=WeaponSubclasses.Sword.value, item_level=70, quality='Epic',
+                          icon_url='https://render.test/' + str(item_id) + '.jpg') for item_id in (1, 2, 3)])
+    session.commit()
+    return session
+
+
+def test_snapshot_round_trip(catalog, tmp_path):
+    path = str(tmp_path / 'items.jsonl.gz')
+    before = item_rows(catalog)
+    subclasses = catalog.query(ItemSubClass).count()
+    header = export_snapshot(catalog, path)
+    assert header['items'] == 3 and header['subclasses'] == subclasses
+
+    catalog.query(Item).delete()
+    catalog.query(ItemSubClass).delete()
+    catalog.commit()
+    assert import_snapshot(catalog, path)['inserted'] == 3
+    catalog.commit()
+    assert item_rows(catalog) == before
+    assert catalog.query(ItemSubClass).count() == subclasses
+
+
+def test_diff_import_writes_only_changes(catalog, tmp_path):
+    path = str(tmp_path / 'items.jsonl.gz')
+    export_snapshot(catalog, path)
+    catalog.query(Item).filter(Item.id == 2).update({Item.name: 'Renamed'})
+    catalog.query(Item).filter(Item.id == 3).delete()
+    catalog.commit()
+
+    with pytest.raises(SnapshotError):
+        import_snapshot(catalog, path)
+    catalog.rollback()
+    assert import_snapshot(catalog, path, diff=True) == {'inserted': 1, 'updated': 1, 'unchanged': 1}
+    catalog.commit()
+    assert [name for _, name, _, _, _ in item_rows(catalog)] == ['Item 1', 'Item 2', 'Item 3']
+
+
+def test_edited_snapshot_is_rejected(catalog, tmp_path):
+    path = str(tmp_path / 'items.jsonl.gz')
+    export_snapshot(catalog, path)
+    with gzip.open(path, mode='rt', encoding='utf-8') as snapshot:
+        content = snapshot.read()
+    with gzip.open(path, mode='wt', encoding='utf-8') as snapshot:
+        snapshot.write(content.replace('Item 2', 'Item 9'))
+
+    with pytest.raises(SnapshotError, match='Checksum mismatch'):
+        read_snapshot(path)
@@ -0,0 +1,74 @@
+from models import UserPointBucket, PointBucketCheckpoint, EffortPointLedgerEntry, PointTypes
+
+
+def ep_bucket(session, user_id):
+    return session.query(UserPointBucket).filter(UserPointBucket.user_id == user_id,
+                                                 UserPointBucket.point_type == PointTypes.EP).one()
+
+
+def checkpoints(session, point_type=PointTypes.EP):
+    return [(checkpoint.ledger_entry_id, checkpoint.balance) for checkpoint in session.query(PointBucketCheckpoint)
+            .filter(PointBucketCheckpoint.point_type == point_type).order_by(PointBucketCheckpoint.ledger_entry_id)]
+
+
+def ep_entry_ids(session):
+    return [entry_id for (entry_id,) in session.query(EffortPointLedgerEntry.id).order_by(EffortPointLedgerEntry.id)]
+
+
+def test_first_checkpoint_takes_the_recorded_balance(session, make_user):
+    make_user(1, 100, 200)
+
+    assert PointBucketCheckpoint.write(session, settle_seconds=0) == 2
+    assert checkpoints(session) == [(ep_entry_ids(session)[-1], 100)]
+    assert checkpoints(session, PointTypes.GP)[0][1] == 200
+    assert PointBucketCheckpoint.verify(session) == []
+
+
+def test_later_checkpoints_add_the_tail(session, make_user):
+    make_user(1, 100, 200)
+    PointBucketCheckpoint.write(session, settle_seconds=0)
+    bucket = ep_bucket(session, 1)
+    bucket.grant_points(session, 50)
+    bucket.grant_points(session, -30)
+
+    assert PointBucketCheckpoint.write(session, settle_seconds=0) == 1
+    assert [balance for _, balance in checkpoints(session)] == [100, 120]
+    assert PointBucketCheckpoint.write(session, settle_seconds=0) == 0
+    assert PointBucketCheckpoint.verify(session) == []
+
+
+def test_unsettled_entries_are_left_for_the_next_run(session, make_user):
+    make_user(1, 100, 200)
+    assert PointBucketCheckpoint.write(session) == 0
+    assert checkpoints(session) == []
+
+
+def test_verify_reports_drifted_buckets(session, make_user):
+    make_user(1, 100, 200)
+    make_user(2, 50, 100)
+    PointBucketCheckpoint.write(session, settle_seconds=0)
+    ep_bucket(session, 1).grant_points(session, 25)
+    session.query(UserPointBucket).filter(UserPointBucket.user_id == 2, UserPointBucket.point_type == PointTypes.EP) \
+        .update({UserPointBucket.points_column(): 999}, synchronize_session=False)
+    session.commit()
+
+    drifts = PointBucketCheckpoint.verify(session)
+    assert [(drift.user_id, drift.point_type, drift.stored, drift.expected) for drift in drifts] == \
+        [(2, PointTypes.EP, 999, 50)]
+
+
+def test_balance_at_each_ledger_entry(session, make_user):
+    make_user(1, 100, 200)
+    bucket = ep_bucket(session, 1)
+    bucket.grant_points(session, 50)
+    PointBucketCheckpoint.write(session, settle_seconds=0)
+    bucket.grant_points(session, 10)
+    bucket.grant_points(session, -40)
+
+    expected = [value for (value,) in session.query(EffortPointLedgerEntry.point_new_value)
+                .order_by(EffortPointLedgerEntry.id)]
+    entry_ids = ep_entry_ids(session)
+    assert [PointBucketCheckpoint.balance_at(session, 1, bucket.team_id, 1, PointTypes.EP, entry_id)
+            for entry_id in entry_ids] == expected
+    assert PointBucketCheckpoint.balance_at(session, 1, bucket.team_id, 1, PointTypes.EP) == 120
+    assert PointBucketCheckpoint.balance_at(session, 1, bucket.team_id, 1, PointTypes.EP, entry_ids[0] - 1) is None
@@ -0,0 +1,70 @@
+import pytest
+from models import UserPointBucket, EffortPointLedgerEntry, GearPointLedgerEntry, PointTypes, PointTransactionTypes
+from constants import BASE_GP
+
+# Half values exercise rounding away from zero, the low GP values the BASE_GP floor
+BALANCES = [(1, 1000, 2000), (2, 5, 101), (3, 15, 110), (4, 0, BASE_GP), (5, -7, 135), (6, 333, 99)]
+
+
+def buckets(session, team):
+    return dict(((bucket.user_id, bucket.point_type), bucket.get_points()) for bucket in
+                session.query(UserPointBucket).filter(UserPointBucket.team_id == team.id))
+
+
+def decay_ledger(session):
+    rows = {}
+    for ledger_class in (EffortPointLedgerEntry, GearPointLedgerEntry):
+        for entry in session.query(ledger_class).filter(ledger_class.transaction_type == PointTransactionTypes.DECAY):
+            rows[(entry.user_id, entry.point_type)] = (entry.point_old_value, entry.point_delta,
+                                                       entry.point_new_value)
+    return rows
+
+
+@pytest.mark.parametrize('percent', [10, 50, 33])
+def test_bulk_decay_matches_decay_points(session, team, make_user, percent):
+    for user_id, ep, gp in BALANCES:
+        make_user(user_id, ep, gp)
+    before = buckets(session, team)
+
+    for bucket in session.query(UserPointBucket).filter(UserPointBucket.team_id == team.id).all():
+        bucket.decay_points(session, percent)
+    expected_buckets = buckets(session, team)
+    expected_ledger = decay_ledger(session)
+
+    for ledger_class in (EffortPointLedgerEntry, GearPointLedgerEntry):
+        session.query(ledger_class).filter(ledger_class.transaction_type == PointTransactionTypes.DECAY) \
+            .delete(synchronize_session=False)
+    for (user_id, point_type), value in before.items():
+        session.query(UserPointBucket).filter(UserPointBucket.user_id == user_id,
+                                              UserPointBucket.point_type == point_type) \
+            .update({UserPointBucket.points_column(): value}, synchronize_session=False)
+    session.commit()
+
+    assert UserPointBucket.bulk_decay(session, team, 1, percent) == len(BALANCES) * 2
+    session.commit()
+    session.expire_all()
+    assert buckets(session, team) == expected_buckets
+    assert decay_ledger(session) == expected_ledger
+
+
+def test_decay_rounds_half_away_from_zero_and_floors_gp(session, team, make_user):
+    for user_id, ep, gp in BALANCES:
+        make_user(user_id, ep, gp)
+    UserPointBucket.bulk_decay(session, team, 1, 50)
+    session.commit()
+    session.expire_all()
+    points = buckets(session, team)
+    assert points[(2, PointTypes.EP)] == 3
+    assert points[(3, PointTypes.EP)] == 8
+    assert points[(5, PointTypes.EP)] == -4
+    assert all(points[(user_id, PointTypes.GP)] == BASE_GP for user_id in (2, 3, 4, 5, 6))
+    assert points[(1, PointTypes.GP)] == 1000
+    ledger = decay_ledger(session)
+    assert ledger[(1, PointTypes.EP)] == (1000, -500, 500)
+    assert ledger[(6, PointTypes.GP)] == (99, BASE_GP - 99, BASE_GP)
+
+
+def test_decay_rejects_invalid_percent(session, team, make_user):
+    make_user(1, 100, 200)
+    with pytest.raises(ValueError):
+        UserPointBucket.bulk_decay(session, team, 1, 100)
@@ -0,0 +1,106 @@
+import asyncio
+from types import SimpleNamespace
+from lib.dispatch import CommandDispatcher, LatencyHistogram
+
+
+class FakeChannel():
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content):
+        self.sent.append(content)
+
+
+def message(content, member_id=1, roles=('Raider',)):
+    author = SimpleNamespace(id=member_id, roles=[SimpleNamespace(name=role) for role in roles])
+    return SimpleNamespace(content=content, author=author, channel=FakeChannel())
+
+
+def test_unknown_command_and_missing_role_are_answered():
+    async def handler(message):
+        raise AssertionError
+
+    dispatcher = CommandDispatcher({'arg.pr': {'handler': handler, 'required_role': 'Raider'}})
+
+    async def run():
+        unknown = message('arg.prr Aesir')
+        denied = message('arg.pr Aesir', member_id=2, roles=())
+        assert await dispatcher.dispatch(unknown) is None
+        assert await dispatcher.dispatch(denied) is None
+        return unknown.channel.sent + denied.channel.sent
+
+    sent = asyncio.run(run())
+    assert sent[0].startswith('Command Not Found') and sent[1].startswith('Access Denied')
+
+
+def test_queue_limit_turns_away_excess_invocations():
+    running = []
+    peak = []
+    release = None
+
+    async def handler(message):
+        running.append(message)
+        peak.append(len(running))
+        await release.wait()
+        running.remove(message)
+
+    dispatcher = CommandDispatcher({'arg.pr': {'handler': handler, 'required_role': 'Raider', 'max_concurrency': 1}},
+                                   max_queued=2)
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        first = await dispatcher.dispatch(message('arg.pr Aesir'))
+        await asyncio.sleep(0)
+        queued = [await dispatcher.dispatch(message('arg.pr Aesir')) for _ in range(2)]
+        rejected = message('arg.pr Aesir')
+        assert await dispatcher.dispatch(rejected) is None
+        release.set()
+        await asyncio.gather(first, *queued)
+        return rejected.channel.sent
+
+    sent = asyncio.run(run())
+    assert sent[0].startswith('Too many arg.pr requests')
+    assert max(peak) == 1
+    stats = dispatcher.stats()
+    assert stats['rejected'] == 1 and stats['in_flight'] == 0
+    assert stats['commands']['arg.pr']['count'] == 3
+
+
+def test_failing_handler_releases_its_slot():
+    calls = []
+
+    async def handler(message):
+        calls.append(message.content)
+        if len(calls) == 1:
+            raise ValueError('boom')
+
+    dispatcher = CommandDispatcher({'arg.pr': {'handler': handler, 'required_role': 'Raider', 'max_concurrency': 1}})
+
+    async def run():
+        await dispatcher.dispatch(message('arg.pr one'))
+        await asyncio.wait_for(await dispatcher.dispatch(message('arg.pr two')), 1)
+
+    asyncio.run(run())
+    assert calls == ['arg.pr one', 'arg.pr two']
+    assert dispatcher.stats()['failed'] == 1
+
+
+def test_member_roles_are_cached_until_forgotten():
+    dispatcher = CommandDispatcher({})
+    member = message('arg.pr').author
+    assert dispatcher.member_roles(member) == {'Raider'}
+    member.roles = []
+    assert dispatcher.member_roles(member) == {'Raider'}
+    dispatcher.forget_member(member.id)
+    assert dispatcher.member_roles(member) == frozenset()
+
+
+def test_latency_histogram_percentiles():
+    histogram = LatencyHistogram(bounds=(10, 100))
+    for elapsed_ms in (5, 6, 7, 50, 500):
+        histogram.observe(elapsed_ms)
+    assert histogram.percentile(0.5) == 10
+    assert histogram.percentile(0.8) == 100
+    assert histogram.percentile(1.0) is None
+    assert histogram.stats()['buckets'] == {'<=10': 3, '<=100': 1, '>100': 1}
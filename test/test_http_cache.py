@@ -0,0 +1,67 @@
+from lib.http_cache import ResponseCache, CachedResponse, STATUS_NOT_CACHED
+
+URL = 'https://api.test/data/wow/item/1'
+
+
+class Getter():
+    """Records the conditional headers of each request and answers with the next queued response."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def __call__(self, url, headers):
+        self.requests.append(headers)
+        return self.responses.pop(0)
+
+
+def fresh(status=200, text='{"id": 1}', headers=None):
+    return CachedResponse(status, text, headers, from_cache=False)
+
+
+def test_fresh_entries_are_served_from_the_cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), ttl=60)
+    getter = Getter(fresh(), fresh(404, '{}'))
+
+    assert cache.fetch(URL, getter).json() == {'id': 1}
+    assert cache.fetch(URL, getter).from_cache
+    assert cache.fetch(URL + '0', getter).status_code == 404
+    assert cache.fetch(URL + '0', getter).status_code == 404
+    assert len(getter.requests) == 2
+    assert cache.stats() == {'entries': 2, 'hits': 2, 'misses': 2, 'revalidated': 0}
+
+
+def test_stale_entries_are_revalidated(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), ttl=0)
+    getter = Getter(fresh(headers={'ETag': '"v1"', 'Last-Modified': 'Mon, 01 Mar 2021 20:00:00 GMT'}),
+                    fresh(304, ''), fresh(text='{"id": 2}', headers={'ETag': '"v2"'}), fresh(304, ''))
+
+    cache.fetch(URL, getter)
+    revalidated = cache.fetch(URL, getter)
+    assert revalidated.from_cache and revalidated.json() == {'id': 1}
+    assert getter.requests[1] == {'If-None-Match': '"v1"', 'If-Modified-Since': 'Mon, 01 Mar 2021 20:00:00 GMT'}
+
+    assert cache.fetch(URL, getter).json() == {'id': 2}
+    assert cache.fetch(URL, getter).json() == {'id': 2}
+    assert getter.requests[3]['If-None-Match'] == '"v2"'
+    assert cache.stats()['revalidated'] == 2
+
+
+def test_errors_are_not_cached(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), ttl=60)
+    getter = Getter(fresh(429, ''), fresh())
+
+    assert cache.fetch(URL, getter).status_code == 429
+    assert cache.fetch(URL, getter).status_code == 200
+    assert getter.requests == [{}, {}]
+
+
+def test_offline_mode_only_reads_the_cache(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    ResponseCache(path, ttl=0).fetch(URL, Getter(fresh()))
+    offline = ResponseCache(path, ttl=0, offline=True)
+    getter = Getter()
+
+    assert offline.fetch(URL, getter).json() == {'id': 1}
+    assert offline.fetch(URL + '0', getter).status_code == STATUS_NOT_CACHED
+    assert getter.requests == []
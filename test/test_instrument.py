@@ -0,0 +1,78 @@
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from lib.instrument import Instrumentation
+
+
+def test_components_report_registered_stats():
+    instruments = Instrumentation()
+    instruments.register('routes', lambda: {'hits': 3, 'misses': 1})
+    instruments.register('db pools', lambda: {'DB': {'checkouts': 5, 'timeouts': 0}})
+
+    assert instruments.components().split('\n') == ['db pools DB: checkouts=5, timeouts=0',
+                                                    'routes: hits=3, misses=1']
+
+
+def test_failing_component_is_skipped(caplog):
+    instruments = Instrumentation()
+    instruments.register('broken', lambda: 1 / 0)
+    instruments.register('routes', lambda: {'hits': 1})
+
+    with caplog.at_level(logging.INFO, logger='argbot.instrument'):
+        instruments.dump()
+    assert instruments.components() == 'routes: hits=1'
+    assert 'Stats for component routes' in caplog.text
+    assert 'Unable to read stats for broken' in caplog.text
+
+
+def test_timed_counts_calls_and_errors():
+    instruments = Instrumentation()
+
+    @instruments.timed('job')
+    def job(fail):
+        if fail:
+            raise ValueError
+
+    job(False)
+    try:
+        job(True)
+    except ValueError:
+        pass
+    stats = instruments.stats()['job']
+    assert stats['calls'] == 2 and stats['errors'] == 1
+
+
+def test_failed_statement_leaves_later_timings_alone():
+    engine = create_engine('sqlite://')
+    instruments = Instrumentation()
+    instruments.listen(engine)
+    with engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute(text('SELECT * FROM missing'))
+        conn.execute(text('SELECT 1'))
+        assert 'query_started' not in conn.info
+    assert instruments.queries == 1
+
+
+def test_queries_from_executor_threads_are_all_counted():
+    engine = create_engine('sqlite://')
+    instruments = Instrumentation()
+    instruments.listen(engine)
+
+    def unit():
+        with engine.connect() as conn:
+            for _ in range(50):
+                conn.execute(text('SELECT 1'))
+
+    @instruments.timed('handler')
+    def handler():
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for future in [executor.submit(contextvars.copy_context().run, unit) for _ in range(8)]:
+                future.result()
+
+    handler()
+    assert instruments.queries == 400
+    assert instruments.stats()['handler']['queries_max'] == 400
@@ -0,0 +1,46 @@
+import logging
+import pytest
+import models
+import setup
+from models import Item, ItemGearPoints, ItemClasses, WeaponSubclasses
+
+
+@pytest.fixture
+def items(session, monkeypatch):
+    models.seedSubclasses()
+    session.add_all([Item(id=item_id, name='Item ' + str(item_id), item_class=ItemClasses.Weapon,
+                          item_subclass_id=WeaponSubclasses.Sword.value, item_level=70, quality='Epic',
+                          inventory_type_name='One-Hand') for item_id in (1, 2)])
+    session.commit()
+    monkeypatch.setattr(models, '_items_without_gear_points', set())
+    return session
+
+
+def test_missing_gear_points_warn_once_per_item(items, caplog):
+    item = items.query(Item).get(1)
+    with caplog.at_level(logging.WARNING, logger='argbot.models'):
+        values = [item.gp(), item.gp(), item.gp()]
+    assert values == [item.formula_gp()] * 3
+    assert caplog.text.count('No precomputed GP for item 1') == 1
+
+
+def test_recomputed_gear_points_are_used(items, caplog):
+    ItemGearPoints.recompute(items)
+    items.commit()
+    item = items.query(Item).get(1)
+    with caplog.at_level(logging.WARNING, logger='argbot.models'):
+        assert item.gp() == item.formula_gp()
+    assert 'No precomputed GP' not in caplog.text
+
+
+def test_check_gp_reports_missing_rows(items, caplog):
+    ItemGearPoints.recompute(items, item_ids=[1])
+    items.query(ItemGearPoints).filter(ItemGearPoints.item_id == 1, ItemGearPoints.role == 0) \
+        .update({ItemGearPoints.gp: 1})
+    items.commit()
+
+    with caplog.at_level(logging.WARNING, logger='argbot.setup'):
+        mismatches = setup.check_item_gp()
+    assert sorted(set(item_id for item_id, _, _, _ in mismatches)) == [1, 2]
+    assert '1 items have no precomputed GP, run --recompute-gp to add them: [2]' in caplog.text
+    assert 'Item 1 role 0 has GP 1' in caplog.text
@@ -0,0 +1,144 @@
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import models
+import constants
+import setup
+from lib import http_cache
+from models import Item, WeaponSubclasses
+
+
+class FakeBlizzard(BaseHTTPRequestHandler):
+    """Just enough of the Blizzard API for the loader: an OAuth token, items and item media.
+
+    Each item's behaviour comes from server.items: 'ok', 'missing' (404) or a list of statuses to return in order
+    before it succeeds, e.g. [429].
+    """
+
+    def do_POST(self):
+        self.reply(200, {'access_token': 'test', 'token_type': 'bearer', 'expires_in': 3600})
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        kind = 'media' if '/media/' in path else 'item'
+        item_id = int(path.split('/')[-1])
+        self.server.requests[(kind, item_id)] += 1
+        behaviour = self.server.items.get(item_id, 'missing') if kind == 'item' else \
+            self.server.media.get(item_id, 'ok')
+        if behaviour == 'missing':
+            return self.reply(404, {})
+        if isinstance(behaviour, list) and len(behaviour) >= self.server.requests[(kind, item_id)]:
+            return self.reply(behaviour[self.server.requests[(kind, item_id)] - 1], {})
+        if kind == 'media':
+            return self.reply(200, {'assets': [{'value': 'https://render.test/' + str(item_id) + '.jpg'}]})
+        return self.reply(200, {
+            'id': item_id, 'name': 'Item ' + str(item_id), 'level': 70, 'required_level': 60,
+            'media': {'key': {'href': self.server.url + '/data/wow/media/item/' + str(item_id)}},
+            'item_class': {'name': 'Weapon'}, 'item_subclass': {'id': WeaponSubclasses.Sword.value},
+            'quality': {'name': 'Epic'}, 'inventory_type': {'type': 'WEAPON', 'name': 'One-Hand'}, 'max_count': 1})
+
+    def reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def blizzard(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeBlizzard)
+    server.url = 'http://127.0.0.1:' + str(server.server_address[1])
+    server.items = {}
+    server.media = {}
+    server.requests = Counter()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv('BLIZZARD_API_URL', server.url)
+    monkeypatch.setenv('BLIZZARD_OAUTH_URL', server.url + '/oauth/token')
+    monkeypatch.setenv('BLIZZARD_CACHE', 'FALSE')
+    monkeypatch.setenv('OAUTHLIB_INSECURE_TRANSPORT', '1')
+    monkeypatch.setattr(setup, 'response_cache', None)
+    monkeypatch.setattr(constants, 'ITEM_LOAD_BATCH_SIZE', 2)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def item_list(tmp_path):
+    def write(entries):
+        path = tmp_path / 'items.csv'
+        path.write_text('entry\n' + ''.join(str(entry) + '\n' for entry in entries))
+        return str(path)
+    return write
+
+
+@pytest.fixture
+def loader_db(session):
+    models.seedSubclasses()
+    return session
+
+
+def item_ids(session):
+    session.expire_all()
+    return sorted(item_id for (item_id,) in session.query(Item.id))
+
+
+def test_load_skips_missing_items(blizzard, item_list, loader_db, tmp_path):
+    blizzard.items = {1: 'ok', 2: 'missing', 3: 'ok'}
+    checkpoint = str(tmp_path / 'checkpoint')
+
+    assert setup.load_items_from_blizzard(item_list=item_list([1, 2, 3]), checkpoint_path=checkpoint,
+                                          concurrency=2) == 2
+    assert item_ids(loader_db) == [1, 3]
+    assert setup.read_checkpoint(checkpoint) == 4
+    assert loader_db.query(Item).get(1).icon_url == 'https://render.test/1.jpg'
+
+
+def test_rate_limited_batch_is_retried_on_resume(blizzard, item_list, loader_db, tmp_path):
+    blizzard.items = {1: 'ok', 2: 'missing', 3: [429], 4: 'ok', 5: 'ok'}
+    entries = item_list([1, 2, 3, 4, 5])
+    checkpoint = str(tmp_path / 'checkpoint')
+
+    with pytest.raises(setup.LookupFailed):
+        setup.load_items_from_blizzard(item_list=entries, checkpoint_path=checkpoint, concurrency=2)
+    assert item_ids(loader_db) == [1]
+    assert setup.read_checkpoint(checkpoint) == 3
+
+    assert setup.load_items_from_blizzard(item_list=entries, checkpoint_path=checkpoint, concurrency=2) == 3
+    assert item_ids(loader_db) == [1, 3, 4, 5]
+    assert setup.read_checkpoint(checkpoint) == 6
+    # The resumed load started at the failed batch, the first one wasn't fetched again
+    assert blizzard.requests[('item', 1)] == 1
+    assert blizzard.requests[('item', 3)] == 2
+
+
+def test_media_failure_fails_the_batch(blizzard, item_list, loader_db, tmp_path):
+    blizzard.items = {1: 'ok', 2: 'ok', 3: 'ok'}
+    blizzard.media = {2: [503], 3: 'missing'}
+    entries = item_list([1, 2, 3])
+    checkpoint = str(tmp_path / 'checkpoint')
+
+    with pytest.raises(setup.LookupFailed):
+        setup.load_items_from_blizzard(item_list=entries, checkpoint_path=checkpoint, concurrency=2)
+    assert item_ids(loader_db) == []
+    assert setup.read_checkpoint(checkpoint) == 0
+
+    assert setup.load_items_from_blizzard(item_list=entries, checkpoint_path=checkpoint, concurrency=2) == 3
+    assert loader_db.query(Item).get(2).icon_url == 'https://render.test/2.jpg'
+    assert loader_db.query(Item).get(3).icon_url is None
+
+
+def test_offline_cache_miss_fails_the_batch(blizzard, item_list, loader_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(setup, 'response_cache', http_cache.ResponseCache(str(tmp_path / 'cache.sqlite'), 60,
+                                                                          offline=True))
+    with pytest.raises(setup.LookupFailed):
+        setup.load_items_from_blizzard(item_list=item_list([1]), checkpoint_path=str(tmp_path / 'checkpoint'))
+    assert blizzard.requests == {}
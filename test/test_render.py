@@ -0,0 +1,90 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+from lib.render import EmbedRenderScheduler
+
+
+class FakeMessage():
+    def __init__(self, message_id):
+        self.id = message_id
+        self.edits = []
+
+    async def edit(self, embed=None):
+        self.edits.append(embed)
+
+
+class FakeChannel():
+    def __init__(self):
+        self.messages = {}
+        self.fetches = 0
+        self.sent = []
+
+    async def fetch_message(self, message_id):
+        self.fetches += 1
+        return self.messages.setdefault(message_id, FakeMessage(message_id))
+
+    async def send(self, content):
+        self.sent.append(content)
+
+
+def scheduler():
+    channel = FakeChannel()
+    return EmbedRenderScheduler(SimpleNamespace(get_channel=lambda channel_id: channel), window=0.01), channel
+
+
+def test_burst_is_rendered_once_with_the_latest_state():
+    renders, channel = scheduler()
+
+    async def burst():
+        for state in range(3):
+            renders.schedule(1, 10, lambda session, state=state: 'embed ' + str(state))
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.05)
+        renders.schedule(1, 10, lambda session: 'embed 3')
+        await asyncio.sleep(0.05)
+
+    asyncio.run(burst())
+    assert channel.messages[10].edits == ['embed 2', 'embed 3']
+    # The message was fetched for the first edit and reused from the cache for the second
+    assert channel.fetches == 1
+    assert renders.stats() == {'requested': 4, 'coalesced': 2, 'emitted': 2, 'failed': 0, 'pending': 0}
+
+
+def test_failed_render_posts_the_notice_and_refetches():
+    renders, channel = scheduler()
+
+    def broken(session):
+        raise ValueError('no embed')
+
+    async def run():
+        renders.schedule(1, 10, lambda session: 'embed 1')
+        await asyncio.sleep(0.05)
+        renders.schedule(1, 10, broken, failure_notice='Failed to update raid 1')
+        await asyncio.sleep(0.05)
+        renders.schedule(1, 10, lambda session: 'embed 2')
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert channel.sent == ['Failed to update raid 1']
+    assert channel.messages[10].edits == ['embed 1', 'embed 2']
+    assert channel.fetches == 2
+    assert renders.stats()['failed'] == 1
+
+
+def test_message_cache_is_bounded():
+    renders, channel = scheduler()
+    renders.cache_size = 2
+    for message_id in (10, 11, 12):
+        renders.remember(FakeMessage(message_id))
+    assert list(renders._messages) == [11, 12]
+
+
+def test_render_runs_off_the_loop():
+    renders, channel = scheduler()
+
+    async def run():
+        renders.schedule(1, 10, lambda session: threading.current_thread().name)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert channel.messages[10].edits[0].startswith('argbot-db')
@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+import asyncio
+from types import SimpleNamespace
+import pytest
+from models import Raid, Character, Signup, User, UserPointBucket, EffortPointLedgerEntry, PointTypes, RaidZone
+
+
+@pytest.fixture
+def make_raid(session, team):
+    """make_raid(started_ago, user_ids) adds an MC raid (ticks every 30 minutes for 90) with confirmed signups."""
+    def make(started_ago, user_ids):
+        starts_at = datetime.utcnow() - started_ago
+        raid = Raid(team=team, zone=RaidZone.MC, starts_at=starts_at, ends_at=starts_at + timedelta(minutes=90))
+        session.add(raid)
+        for user_id in user_ids:
+            character = Character(user_id=user_id, name='Toon' + str(user_id))
+            session.add(Signup(user_id=user_id, character=character, raid=raid, signup_at=starts_at,
+                               is_confirmed=True, confirmed_at=starts_at))
+        session.commit()
+        return raid
+    return make
+
+
+def effort(session, user_id):
+    return session.query(UserPointBucket).filter(UserPointBucket.user_id == user_id,
+                                                 UserPointBucket.point_type == PointTypes.EP).one().get_points()
+
+
+def test_repeated_tick_pays_nothing(session, make_user, make_raid):
+    make_user(1, 0, 200)
+    raid = make_raid(timedelta(minutes=10), [1])
+
+    assert raid.reward(session, tick=0) == 1
+    assert raid.last_reward_tick == 0
+    assert raid.reward(session, tick=0) == 0
+    assert effort(session, 1) == 100
+    assert session.query(EffortPointLedgerEntry).filter(EffortPointLedgerEntry.raid_id == raid.id).count() == 1
+
+
+def test_signup_without_bucket_is_logged(session, make_user, make_raid, caplog):
+    make_user(1, 0, 200)
+    session.add(User(id=2, name='user2', display_name='User2'))
+    session.commit()
+    raid = make_raid(timedelta(minutes=10), [1, 2])
+
+    assert raid.reward(session, tick=0) == 1
+    assert effort(session, 1) == 100
+    assert '[2]' in caplog.text
+
+
+def test_catch_up_pays_every_missed_tick_and_closes(session, make_user, make_raid):
+    make_user(1, 0, 200)
+    raid = make_raid(timedelta(minutes=100), [1])
+
+    assert raid.reward(session) == 1
+    # Start bonus, ticks 1 to 3 and the end bonus on the final tick
+    assert effort(session, 1) == 100 + 3 * 50 + 100
+    assert raid.is_closed and raid.last_reward_tick == raid.final_tick() == 3
+    assert raid.reward(session) == 0
+    assert effort(session, 1) == 350
+
+
+def test_late_tick_pays_only_outstanding_ticks(session, make_user, make_raid):
+    make_user(1, 0, 200)
+    raid = make_raid(timedelta(minutes=70), [1])
+
+    raid.reward(session, tick=0)
+    assert raid.reward(session) == 1
+    assert raid.last_reward_tick == 2 and not raid.is_closed
+    assert effort(session, 1) == 100 + 2 * 50
+    assert session.query(EffortPointLedgerEntry).filter(EffortPointLedgerEntry.raid_id == raid.id).count() == 3
+
+
+def test_raid_started_before_ticks_were_tracked(session, make_user, make_raid):
+    make_user(1, 0, 200)
+    raid = make_raid(timedelta(minutes=70), [1])
+    raid.is_started = True
+    session.commit()
+
+    raid.reward(session)
+    assert effort(session, 1) == 50
+
+
+def test_final_tick_is_first_tick_at_or_after_the_end(session, make_raid):
+    raid = make_raid(timedelta(minutes=10), [])
+    assert raid.final_tick() == 3
+    raid.ends_at = raid.starts_at + timedelta(minutes=80)
+    assert raid.final_tick() == 3
+    raid.ends_at = None
+    assert raid.final_tick() == 3
+
+
+def test_raid_behind_on_rewards_is_caught_up(session, make_raid, monkeypatch):
+    bot = pytest.importorskip('bot')
+    jobs = []
+    monkeypatch.setattr(bot, 'add_loop_job', lambda job, **options: jobs.append(options))
+
+    bot.schedule_raid_rewards(make_raid(timedelta(minutes=40), []))
+    assert [job['id'] for job in jobs] == ['raid-rewards-1', 'raid-rewards-1-catchup']
+    assert jobs[0]['trigger'] == 'interval' and jobs[0]['coalesce'] and 'end_date' not in jobs[0]
+
+    jobs.clear()
+    bot.schedule_raid_rewards(make_raid(timedelta(hours=3), []))
+    assert [job['id'] for job in jobs] == ['raid-rewards-2-catchup']
+
+
+def test_reward_job_runs_until_the_extended_raid_closes(session, make_user, make_raid, monkeypatch):
+    bot = pytest.importorskip('bot')
+    make_user(1, 0, 200)
+    raid = make_raid(timedelta(minutes=100), [1])
+    raid.extend(session, timedelta(minutes=30))
+    removed = []
+    sent = []
+
+    async def send(content):
+        sent.append(content)
+
+    monkeypatch.setattr(bot, 'voice_member_ids', lambda channel_id: set())
+    monkeypatch.setattr(bot.client, 'get_channel', lambda channel_id: SimpleNamespace(send=send), raising=False)
+    monkeypatch.setattr(bot.worker.scheduler, 'remove_job', lambda job_id, jobstore=None: removed.append(job_id))
+
+    # Tick 3 was the final tick before the raid was extended to 120 minutes
+    asyncio.run(bot.process_rewards(raid_id=raid.id))
+    session.expire_all()
+    assert raid.last_reward_tick == 3 and not raid.is_closed
+    assert removed == []
+
+    # Half an hour later, past the new end
+    raid.starts_at -= timedelta(minutes=30)
+    raid.ends_at -= timedelta(minutes=30)
+    session.commit()
+    asyncio.run(bot.process_rewards(raid_id=raid.id))
+    session.expire_all()
+    assert raid.is_closed and effort(session, 1) == 100 + 4 * 50 + 100
+    assert removed == ['raid-rewards-' + str(raid.id)]
+    assert len(sent) == 2
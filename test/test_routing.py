@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+import models
+from models import Raid, RaidZone, Item, ItemDrop, ItemClasses, WeaponSubclasses
+from lib.routing import MessageRoutes, ROUTE_RAID, ROUTE_DROP, ROUTE_AUDIT
+
+
+def test_lookup_counts_hits_and_misses():
+    routes = MessageRoutes()
+    routes.register(100, ROUTE_AUDIT, 1)
+    routes.register(None, ROUTE_RAID, 2)
+
+    assert routes.lookup(100) == (ROUTE_AUDIT, 1)
+    assert routes.lookup(101) is None
+    routes.unregister(100)
+    routes.unregister(100)
+    assert routes.lookup(100) is None
+    assert routes.stats() == {'routes': 0, 'hits': 1, 'misses': 2}
+
+
+def test_warm_routes_open_raids_and_unawarded_drops(session, team):
+    starts_at = datetime.utcnow()
+    open_raid = Raid(team=team, zone=RaidZone.MC, starts_at=starts_at, signup_message_id=10)
+    closed_raid = Raid(team=team, zone=RaidZone.MC, starts_at=starts_at, signup_message_id=11, is_closed=True)
+    unposted_raid = Raid(team=team, zone=RaidZone.MC, starts_at=starts_at + timedelta(days=1))
+    session.add(Item(id=1, name='Test Item', item_class=ItemClasses.Weapon,
+                     item_subclass_id=WeaponSubclasses.Sword.value))
+    open_drop = ItemDrop(item_id=1, raid=closed_raid, dropped_at=starts_at, created_by_id=1, bid_message_id=20)
+    awarded_drop = ItemDrop(item_id=1, raid=closed_raid, dropped_at=starts_at, created_by_id=1, bid_message_id=21,
+                            is_awarded=True)
+    session.add_all([open_raid, unposted_raid, open_drop, awarded_drop])
+    session.commit()
+
+    routes = MessageRoutes()
+    routes.register(30, ROUTE_AUDIT, 1)
+    routes.register(31, ROUTE_RAID, closed_raid.id)
+    assert routes.warm(session) == 2
+    assert routes.lookup(10) == (ROUTE_RAID, open_raid.id)
+    assert routes.lookup(20) == (ROUTE_DROP, open_drop.id)
+    assert routes.lookup(11) is None and routes.lookup(21) is None and routes.lookup(31) is None
+    assert routes.lookup(30) == (ROUTE_AUDIT, 1)
+
+
+@pytest.fixture
+def listening_routes(session):
+    routes = MessageRoutes()
+    routes.listen(models.Session)
+    yield routes
+    event.remove(models.Session, 'after_flush', routes._after_flush)
+
+
+def test_closed_raids_and_awarded_drops_are_unrouted(session, team, listening_routes):
+    starts_at = datetime.utcnow()
+    raid = Raid(team=team, zone=RaidZone.MC, starts_at=starts_at, signup_message_id=10)
+    other_raid = Raid(team=team, zone=RaidZone.MC, starts_at=starts_at, signup_message_id=11)
+    session.add(Item(id=1, name='Test Item', item_class=ItemClasses.Weapon,
+                     item_subclass_id=WeaponSubclasses.Sword.value))
+    drop = ItemDrop(item_id=1, raid=raid, dropped_at=starts_at, created_by_id=1, bid_message_id=20)
+    deleted_drop = ItemDrop(item_id=1, raid=raid, dropped_at=starts_at, created_by_id=1, bid_message_id=21)
+    session.add_all([raid, other_raid, drop, deleted_drop])
+    session.commit()
+    for message_id, kind, entity in ((10, ROUTE_RAID, raid), (11, ROUTE_RAID, other_raid), (20, ROUTE_DROP, drop),
+                                     (21, ROUTE_DROP, deleted_drop)):
+        listening_routes.register(message_id, kind, entity.id)
+
+    raid.notes = 'Still open'
+    session.commit()
+    assert listening_routes.lookup(10) == (ROUTE_RAID, raid.id)
+
+    raid.is_closed = True
+    drop.is_awarded = True
+    session.delete(deleted_drop)
+    session.commit()
+    assert [listening_routes.lookup(message_id) for message_id in (10, 20, 21)] == [None, None, None]
+    assert listening_routes.lookup(11) == (ROUTE_RAID, other_raid.id)
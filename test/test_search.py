@@ -0,0 +1,54 @@
+import pytest
+from lib.search import ItemIndex, normalize, MATCH_EXACT, MATCH_PREFIX, MATCH_SUBSTRING, MATCH_FUZZY
+
+ITEMS = {
+    1: "Bonereaver's Edge",
+    2: "Ashkandi, Greatsword of the Brotherhood",
+    3: "Edge of the Brotherhood",
+    4: "Ring of Binding",
+    5: "Ring of Binding",
+    6: "Band of Accuria",
+}
+
+
+@pytest.fixture
+def index():
+    index = ItemIndex()
+    for item_id, name in ITEMS.items():
+        index.add(item_id, name)
+    return index
+
+
+def test_normalize():
+    assert normalize("Bonereaver's  Edge") == 'bonereavers edge'
+    assert normalize('Ashkandi, Greatsword') == 'ashkandi greatsword'
+
+
+def test_search_ranks_exact_then_prefix_then_substring(index):
+    assert [(match.item_id, match.match) for match in index.search('edge')] == \
+        [(3, MATCH_PREFIX), (1, MATCH_SUBSTRING)]
+    assert index.search("bonereavers edge")[0].match == MATCH_EXACT
+
+
+def test_fuzzy_only_when_nothing_contains_the_query(index):
+    matches = index.search('bonereever edge')
+    assert [match.item_id for match in matches] == [1]
+    assert matches[0].match == MATCH_FUZZY
+
+
+def test_resolve_picks_exact_and_unique_prefix(index):
+    assert index.resolve("Bonereaver's Edge")[0] == 1
+    assert index.resolve('ashkandi')[0] == 2
+
+
+def test_resolve_never_picks_fuzzy_or_substring(index):
+    item_id, matches = index.resolve('bonereever edge')
+    assert item_id is None and [match.item_id for match in matches] == [1]
+    item_id, matches = index.resolve('accuria')
+    assert item_id is None and matches[0].match == MATCH_SUBSTRING
+
+
+def test_resolve_leaves_duplicate_names_ambiguous(index):
+    item_id, matches = index.resolve('ring of binding')
+    assert item_id is None
+    assert sorted(match.item_id for match in matches) == [4, 5]
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+import pytest
+import models
+from models import EffortPointLedgerEntry, GearPointLedgerEntry, PointTransactionTypes, PointTypes
+
+START = datetime(2021, 3, 1, 20, 0)
+
+
+@pytest.fixture
+def history(session, team, make_user):
+    """Users 1 and 2 loaded at START; user 1 then gains GP an hour later and EP two hours later."""
+    make_user(1, 100, 200)
+    make_user(2, 50, 100)
+    for ledger_class in (EffortPointLedgerEntry, GearPointLedgerEntry):
+        session.query(ledger_class).update({ledger_class.created_at: START})
+    add_entry(session, team, GearPointLedgerEntry, 1, START + timedelta(hours=1), 200, 300)
+    add_entry(session, team, EffortPointLedgerEntry, 1, START + timedelta(hours=2), 100, 150)
+    session.commit()
+    return session
+
+
+def add_entry(session, team, ledger_class, user_id, created_at, old_value, new_value):
+    point_type = PointTypes.GP if ledger_class is GearPointLedgerEntry else PointTypes.EP
+    session.add(ledger_class(user_id=user_id, team_id=team.id, raid_tier=1, point_type=point_type,
+                             created_at=created_at, transaction_type=PointTransactionTypes.GRANT,
+                             point_old_value=old_value, point_delta=new_value - old_value,
+                             point_new_value=new_value))
+
+
+def points(historical):
+    return {(entry.user_id, entry.ep, entry.gp) for entry in historical.standings[1]}
+
+
+def test_balances_as_of_each_entry(history, team):
+    assert points(models.get_pr_standings_at(history, team, START)) == {(1, 100, 200), (2, 50, 100)}
+    assert points(models.get_pr_standings_at(history, team, START + timedelta(minutes=90))) == \
+        {(1, 100, 300), (2, 50, 100)}
+    standings = models.get_pr_standings_at(history, team, START + timedelta(hours=3))
+    assert points(standings) == {(1, 150, 300), (2, 50, 100)}
+    assert [entry.user_id for entry in standings.standings[1]] == [1, 2]
+    assert standings.history_start == START and standings.incomplete == []
+
+
+def test_latest_id_wins_on_equal_timestamps(history, team):
+    add_entry(history, team, GearPointLedgerEntry, 2, START + timedelta(hours=1), 100, 120)
+    add_entry(history, team, GearPointLedgerEntry, 2, START + timedelta(hours=1), 120, 110)
+    history.commit()
+    assert points(models.get_pr_standings_at(history, team, START + timedelta(hours=1))) == \
+        {(1, 100, 300), (2, 50, 110)}
+
+
+def test_before_history_start_has_no_standings(history, team):
+    standings = models.get_pr_standings_at(history, team, START - timedelta(minutes=1))
+    assert not any(standings.standings.values())
+    assert standings.history_start == START
+
+
+def test_users_without_both_histories_are_incomplete(history, team, make_user):
+    make_user(3, 10, 100, display_name='Latecomer')
+    history.query(EffortPointLedgerEntry).filter(EffortPointLedgerEntry.user_id == 3) \
+        .update({EffortPointLedgerEntry.created_at: START})
+    history.commit()
+
+    standings = models.get_pr_standings_at(history, team, START + timedelta(hours=3))
+    assert 3 not in [entry.user_id for entry in standings.standings[1]]
+    assert standings.incomplete == [(1, 'Latecomer')]
+
+
+def test_pr_embed_explains_missing_history(history, team):
+    bot = pytest.importorskip('bot')
+    embed = bot.generate_pr_embed(history, team, START - timedelta(days=1))
+    assert "before" in embed.description and not embed.fields
@@ -0,0 +1,102 @@
+import asyncio
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+import models
+from models import Raid, Character, Signup, Item, ItemDrop, ItemDropBid, RaidZone, ItemClasses, WeaponSubclasses
+from lib.usercache import UserContextCache
+
+
+@pytest.fixture
+def raid_signup(session, team, make_user):
+    """User 1 signed up to an MC raid that has already started."""
+    make_user(1, 0, 200)
+    starts_at = datetime.utcnow() - timedelta(minutes=10)
+    raid = Raid(team=team, zone=RaidZone.MC, starts_at=starts_at, ends_at=starts_at + timedelta(minutes=90))
+    character = Character(user_id=1, name='Toon1')
+    signup = Signup(user_id=1, character=character, raid=raid, signup_at=starts_at, is_confirmed=True)
+    session.add(signup)
+    session.commit()
+    return raid, signup
+
+
+@pytest.fixture
+def cache(session):
+    cache = UserContextCache()
+    cache.listen(models.Session)
+    yield cache
+    event.remove(models.Session, 'after_flush', cache._after_flush)
+    event.remove(models.Session, 'after_bulk_update', cache._after_bulk)
+    event.remove(models.Session, 'after_bulk_delete', cache._after_bulk)
+
+
+def test_closing_a_raid_forgets_its_signups(session, raid_signup, cache):
+    raid, signup = raid_signup
+    context = cache.get(session, 1)
+    assert raid.id in context.signups
+
+    raid.is_closed = True
+    session.commit()
+    assert raid.id not in context.signups
+
+
+def test_signup_for_closed_raid_is_looked_up(session, raid_signup, cache):
+    raid, signup = raid_signup
+    raid.is_closed = True
+    session.commit()
+
+    context = cache.get(session, 1)
+    assert raid.id not in context.signups
+    assert cache.signup_for(session, context, raid.id).id == signup.id
+    assert cache.signup_for(session, context, raid.id + 1) is None
+
+
+@pytest.fixture
+def bid_reaction(session, raid_signup, monkeypatch):
+    """A drop for the raid, with a bid reaction from user 1 and the DMs and renders the bot sends for it."""
+    bot = pytest.importorskip('bot')
+    raid, signup = raid_signup
+    session.add(Item(id=1, name='Test Item', item_class=ItemClasses.Weapon,
+                     item_subclass_id=WeaponSubclasses.Sword.value))
+    drop = ItemDrop(item_id=1, raid=raid, dropped_at=datetime.utcnow(), created_by_id=1)
+    session.add(drop)
+    session.commit()
+
+    dms = []
+    scheduled = []
+
+    async def send_dm(user_id, content=None, embed=None):
+        dms.append(content)
+
+    monkeypatch.setattr(bot, 'send_dm', send_dm)
+    monkeypatch.setattr(bot.render_scheduler, 'schedule', lambda *args, **kwargs: scheduled.append(args))
+    raw_event = SimpleNamespace(user_id=1, event_type='REACTION_ADD', channel_id=10, message_id=20,
+                                emoji=SimpleNamespace(id=30, name='bid_100'))
+    return bot, drop, raw_event, dms, scheduled
+
+
+def test_bid_on_drop_from_closed_raid(session, raid_signup, bid_reaction):
+    bot, drop, raw_event, dms, scheduled = bid_reaction
+    raid, signup = raid_signup
+    raid.is_closed = True
+    session.commit()
+
+    asyncio.run(bot.handle_reaction_bid(raw_event=raw_event, drop_id=drop.id))
+
+    assert dms == []
+    bid = session.query(ItemDropBid).get((drop.id, 1))
+    assert bid.bid_100 and bid.character_id == signup.character_id
+    assert len(scheduled) == 1
+
+
+def test_late_bid_on_awarded_drop_is_refused(session, bid_reaction):
+    bot, drop, raw_event, dms, scheduled = bid_reaction
+    drop.is_awarded = True
+    session.commit()
+
+    asyncio.run(bot.handle_reaction_bid(raw_event=raw_event, drop_id=drop.id))
+
+    assert dms == ["Recieved your bid after the item was already awarded, sorry!"]
+    assert session.query(ItemDropBid).get((drop.id, 1)) is None
+    assert scheduled == []
@@ -1,4 +1,5 @@
 import os
+import asyncio
 import traceback
 import logging
 import models
@@ -6,15 +7,20 @@ import pytz
 from constants import *
 
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.executors.asyncio import AsyncIOExecutor
+
+SCHEDULER_MODE = os.environ.get('SCHEDULER_MODE', SCHEDULER_MODE_DEFAULT)
 
 
 jobstores = {
-  'default': SQLAlchemyJobStore(url=models.get_db_uri())
-}
-executors = {
-  'default': ThreadPoolExecutor(max_workers=5)
+  'default': SQLAlchemyJobStore(engine=models.create_db_engine('JOBSTORE', pool_size=JOBSTORE_POOL_SIZE,
+                                                                max_overflow=JOBSTORE_MAX_OVERFLOW)),
+  # Jobs rebuilt from the database at startup (raid rewards, ledger checkpoints) don't need to be persisted
+  MEMORY_JOBSTORE: MemoryJobStore()
 }
 job_defaults = {
   'coalesce': False,
@@ -22,4 +28,22 @@ job_defaults = {
   'misfire_grace_time': MISFIRE_GRACE_SECONDS
 }
 
-scheduler = BackgroundScheduler(jobstores=jobstores, executors=executors, job_defaults=job_defaults, timezone=pytz.utc)
+
+def create_scheduler(mode=SCHEDULER_MODE, event_loop=None):
+    """Build the job scheduler.
+
+    In SCHEDULER_MODE_ASYNCIO jobs run on the event loop (by default the one discord.Client picks up at import), so
+    coroutine jobs can use the client directly and hand blocking work to lib.db. SCHEDULER_MODE_BACKGROUND keeps the
+    old thread pool, where jobs must be plain functions.
+    """
+    if mode == SCHEDULER_MODE_ASYNCIO:
+        return AsyncIOScheduler(jobstores=jobstores, executors={'default': AsyncIOExecutor()},
+                                job_defaults=job_defaults, timezone=pytz.utc,
+                                event_loop=event_loop or asyncio.get_event_loop())
+    elif mode == SCHEDULER_MODE_BACKGROUND:
+        return BackgroundScheduler(jobstores=jobstores, executors={'default': ThreadPoolExecutor(max_workers=5)},
+                                   job_defaults=job_defaults, timezone=pytz.utc)
+    raise ValueError("Unknown SCHEDULER_MODE " + str(mode))
+
+
+scheduler = create_scheduler()